@@ -6,14 +6,35 @@ Input:
   data/*.pdf
 
 Output:
-  out/json/<paper_id>.json          (merged result)
+  out/corpus.sqlite                 (merged results, one row per paper; see corpus_store.py)
+  out/json/<paper_id>.json          (merged result, only with --write-json)
   out/logs/<paper_id>_raw.json      (raw LLM response + prompt for debugging)
-  out/index.jsonl                   (one-line summary per PDF)
+  out/index.jsonl                   (one-line summary per PDF, rebuilt from the manifest)
+  out/manifest.jsonl                (checkpoint: one line per finished PDF)
+  out/near_dup.sqlite               (MinHash/LSH index of front pages; see near_dup.py)
+  out/pages.sqlite                  (extracted page text per paper id; see page_cache.py)
+
+Runs are incremental: a PDF is skipped when its result is already in the
+corpus store (or in out/json/<paper_id>.json from older runs) for the same
+model/prompt/slice settings, so a crashed run resumes
+where it stopped. Use --force to re-extract everything.
+
+Near-duplicates (re-exports, arXiv versions, watermarked copies) have other
+bytes and so another paper id. Each prepared PDF's front page is MinHash-signed
+and looked up in out/near_dup.sqlite; a match is stored as a version of the
+paper it matches (listed under "versions" in that paper's record) and reuses
+its extraction instead of calling the LLM. --dedup-embeddings additionally
+requires the front pages' embeddings to agree; --no-dedup turns it off.
 
 Requires:
   pip install pymupdf requests
   Ollama running:  ollama serve
   Model pulled:    ollama pull llama3.2:3b
+
+Usage:
+  python 1_initial_script.py                     # sequential, one PDF at a time
+  python 1_initial_script.py --pipeline          # hash/slice, LLM and writes overlap
+  python 1_initial_script.py --pipeline --cpu-workers 6 --llm-workers 3
 """
 
 import os
@@ -22,12 +43,26 @@ import json
 import time
 import glob
 import hashlib
+import argparse
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from dataclasses import dataclass
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Iterator, Optional, Tuple, List
 
 import fitz  # PyMuPDF
+import numpy as np
 import requests
 
+from corpus_store import CorpusStore
+from llm_cache import LLMCache
+from near_dup import NearDupIndex, signature
+from page_cache import PageCache
+
 
 # ----------------------------
 # Config
@@ -39,9 +74,16 @@ OUT_DIR = "out"
 OUT_JSON_DIR = os.path.join(OUT_DIR, "json")
 OUT_LOG_DIR = os.path.join(OUT_DIR, "logs")
 OUT_INDEX = os.path.join(OUT_DIR, "index.jsonl")
+OUT_MANIFEST = os.path.join(OUT_DIR, "manifest.jsonl")   # checkpoint of finished PDFs
+OUT_CORPUS = os.path.join(OUT_DIR, "corpus.sqlite")      # all merged results
+OUT_PAGES = os.path.join(OUT_DIR, "pages.sqlite")        # page text cache (page_cache.py)
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+# --write-json: also write one out/json/<id>.json per paper (the old layout)
+WRITE_JSON = False
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
 MODEL = "llama3.2:3b"
+LLM_OPTIONS = {"temperature": 0}
 
 # Page strategy
 FRONT_PAGES_DEFAULT = 2        # first 2 pages
@@ -55,6 +97,22 @@ TIMEOUT_SECS = 600
 MAX_RETRIES = 2
 RETRY_SLEEP_SECS = 2.0
 
+# Response cache keyed by (model, options, prompt); see llm_cache.py
+LLM_CACHE_PATH = os.path.join(OUT_DIR, "llm_cache.sqlite")
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Near-duplicate detection (see near_dup.py)
+NEAR_DUP_PATH = os.path.join(OUT_DIR, "near_dup.sqlite")
+DEDUP_EMBED_MIN = 0.95    # front-page cosine similarity required with --dedup-embeddings
+
+# Pipelined mode (--pipeline)
+CPU_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # processes for hashing + PyMuPDF
+LLM_WORKERS = 2                                   # concurrent Ollama requests
+MAX_IN_FLIGHT = 32                                # PDFs admitted at once (backpressure)
+
+# --heuristic-only turns this off: fields the heuristics miss stay empty.
+LLM_ENABLED = True
+
 # Prompt
 PROMPT_FRONT = """You extract structured metadata from the FIRST pages of an academic/technical paper.
 Return ONLY valid JSON. No markdown. No explanations.
@@ -79,6 +137,45 @@ TEXT:
 {TEXT}
 """
 
+# Heuristic fast path: fields found in the PDF layout with at least this
+# confidence are kept, and only the rest are asked of the LLM (PROMPT_FILL).
+USE_HEURISTICS = True
+HEURISTIC_VERSION = 2
+HEURISTIC_MIN_CONFIDENCE = 0.7
+# Fields the heuristics never find: asked for when an LLM call is made for
+# another field, but never the sole reason for one.
+OPTIONAL_FIELDS = ("categories",)
+MAX_CHARS_FILL_EXCERPT = 600   # first-page excerpt sent when only year/categories are missing
+
+PROMPT_FILL = """You extract structured metadata from an academic/technical paper.
+Return ONLY valid JSON. No markdown. No explanations.
+
+Return one JSON object with exactly these keys:
+{SCHEMA}
+
+Rules:
+- If a field is missing, use null (or [] for arrays).
+{RULES}
+
+TEXT:
+{TEXT}
+"""
+
+FIELD_SCHEMA = {
+    "title": '"title": string|null',
+    "authors": '"authors": string[]',
+    "year": '"year": integer|null',
+    "abstract": '"abstract": string|null',
+    "keywords": '"keywords": string[]',
+    "categories": '"categories": string[]',
+}
+
+FIELD_RULES = {
+    "keywords": '- "keywords" should be 3-12 short phrases.',
+    "categories": '- "categories" should be 2-8 broad areas (e.g., "NLP", "Information Retrieval", "Databases").',
+    "authors": '- "authors" should be best-effort names only (no affiliations).',
+}
+
 
 # ----------------------------
 # Helpers
@@ -90,23 +187,180 @@ def ensure_dirs() -> None:
     os.makedirs(OUT_LOG_DIR, exist_ok=True)
 
 
-def sha1_file(path: str) -> str:
-    h = hashlib.sha1()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+FAKE_HASH_SUFFIX = "+fake"    # marks results built from canned fake_ollama.py answers
+
+
+def extraction_config_hash() -> str:
+    """
+    Fingerprint of every setting that changes the extraction output.
+    A stored result is only reused when this matches.
+    """
+    settings = {
+        "model": MODEL,
+        "options": LLM_OPTIONS,
+        "prompt_front": PROMPT_FRONT,
+        "front_pages_default": FRONT_PAGES_DEFAULT,
+        "front_pages_fallback": FRONT_PAGES_FALLBACK,
+        "max_chars_front": MAX_CHARS_FRONT,
+        "heuristics": {
+            "version": HEURISTIC_VERSION,
+            "min_confidence": HEURISTIC_MIN_CONFIDENCE,
+            "optional_fields": OPTIONAL_FIELDS,
+            "prompt_fill": PROMPT_FILL,
+            "max_chars_fill_excerpt": MAX_CHARS_FILL_EXCERPT,
+        } if USE_HEURISTICS else None,
+        "llm_enabled": LLM_ENABLED,
+    }
+    blob = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def write_json_atomic(path: str, obj: Any, indent: Optional[int] = 2) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp, path)
+
+
+_corpus: Optional[CorpusStore] = None
+_corpus_pid = 0
+
+
+def get_corpus() -> CorpusStore:
+    """This process's connection to the corpus store (never shared across fork)."""
+    global _corpus, _corpus_pid
+    if _corpus is None or _corpus_pid != os.getpid():
+        _corpus = CorpusStore(OUT_CORPUS)
+        _corpus_pid = os.getpid()
+    return _corpus
+
 
+_page_cache: Optional[PageCache] = None
+_page_cache_pid = 0
 
-def extract_pages_text(doc: fitz.Document, page_indices: List[int], max_chars: int) -> str:
-    parts: List[str] = []
-    for i in page_indices:
-        if 0 <= i < doc.page_count:
-            t = (doc.load_page(i).get_text("text") or "").strip()
+
+def get_page_cache() -> PageCache:
+    """This process's connection to the page text cache (never shared across fork)."""
+    global _page_cache, _page_cache_pid
+    if _page_cache is None or _page_cache_pid != os.getpid():
+        _page_cache = PageCache(OUT_PAGES)
+        _page_cache_pid = os.getpid()
+    return _page_cache
+
+
+def has_result(paper_id: str) -> bool:
+    return paper_id in get_corpus() or os.path.exists(os.path.join(OUT_JSON_DIR, f"{paper_id}.json"))
+
+
+def load_current_result(paper_id: str, config_hash: str) -> Optional[Dict[str, Any]]:
+    """Return the stored result for paper_id if it was produced with config_hash."""
+    merged = get_corpus().get(paper_id)
+    if merged is None:  # extracted before the corpus store existed
+        path = os.path.join(OUT_JSON_DIR, f"{paper_id}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                merged = json.load(f)
+        except (OSError, ValueError):
+            return None
+    if (merged.get("extraction") or {}).get("config_hash") != config_hash:
+        return None
+    return merged
+
+
+class PdfReader:
+    """
+    One pass per PDF.
+
+    The file is read once; the SHA-1 paper id is computed from those bytes and
+    PyMuPDF opens the same buffer (lazily, so a hash-only check never parses
+    the PDF). Page text is extracted on demand and cached, so no page is ever
+    extracted twice, e.g. when the front slice falls back from 2 to 4 pages.
+
+    With a PageCache, pages (and first-page layout lines) extracted by any
+    earlier run are read from disk instead, and newly extracted ones are
+    written there on close(), so a PDF is parsed at most once per page.
+    """
+
+    def __init__(self, path: str, cache: Optional[PageCache] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.sha1 = hashlib.sha1(self.data).hexdigest()
+        self.cache = cache
+        self._doc: Optional[fitz.Document] = None
+        self._page_count = cache.page_count(self.sha1) if cache is not None else None
+        self._text: Dict[int, str] = {}
+        self._lines: Dict[int, List[TextLine]] = {}
+        self._new_text: Dict[int, str] = {}
+        self._new_lines: Dict[int, List[Any]] = {}
+
+    @property
+    def doc(self) -> fitz.Document:
+        if self._doc is None:
+            self._doc = fitz.open(stream=self.data, filetype="pdf")
+        return self._doc
+
+    @property
+    def page_count(self) -> int:
+        if self._page_count is None:
+            self._page_count = self.doc.page_count
+        return self._page_count
+
+    def page_text(self, i: int) -> str:
+        if i not in self._text:
+            text = self.cache.get(self.sha1, i) if self.cache is not None else None
+            if text is None:
+                text = (self.doc.load_page(i).get_text("text") or "").strip()
+                self._new_text[i] = text
+            self._text[i] = text
+        return self._text[i]
+
+    def page_lines(self, i: int) -> List["TextLine"]:
+        """Layout lines (text + font size) of page i, see page_lines()."""
+        if i not in self._lines:
+            cached = self.cache.get_layout(self.sha1, i) if self.cache is not None else None
+            if cached is None:
+                self._lines[i] = page_lines(self.doc.load_page(i))
+                self._new_lines[i] = [[ln.text, ln.size, ln.top] for ln in self._lines[i]]
+            else:
+                self._lines[i] = [TextLine(text=t, size=size, top=top) for t, size, top in cached]
+        return self._lines[i]
+
+    def iter_pages(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Yield (page index, text) lazily; pages are extracted as they are consumed."""
+        stop = self.page_count if stop is None else min(stop, self.page_count)
+        for i in range(max(0, start), stop):
+            yield i, self.page_text(i)
+
+    def text(self, n_pages: int, max_chars: int) -> str:
+        """Text of the first n_pages, truncated to max_chars; stops extracting once enough is read."""
+        parts: List[str] = []
+        size = 0
+        for _, t in self.iter_pages(0, n_pages):
             if t:
                 parts.append(t)
-    text = "\n\n".join(parts).strip()
-    return text[:max_chars]
+                size += len(t) + 2
+                if size >= max_chars:
+                    break
+        return "\n\n".join(parts)[:max_chars]
+
+    def close(self) -> None:
+        if self.cache is not None and (self._new_text or self._new_lines):
+            self.cache.put(self.sha1, self.page_count, self._new_text, self._new_lines)
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+        self.data = b""
+        self._text.clear()
+        self._lines.clear()
+        self._new_text.clear()
+        self._new_lines.clear()
+
+    def __enter__(self) -> "PdfReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
 
 def has_front_signal(text: str) -> bool:
@@ -119,37 +373,210 @@ def has_front_signal(text: str) -> bool:
     )
 
 
+# ----------------------------
+# Heuristic fast path
+# ----------------------------
+
+ABSTRACT_RE = re.compile(r"\babstract\b[\s.:\u2014\u2013-]*", re.IGNORECASE)
+ABSTRACT_END_RE = re.compile(
+    r"\n\s*(?:key\s*words?|index terms|(?:1|I)\.?\s+introduction|introduction)\b",
+    re.IGNORECASE,
+)
+KEYWORDS_RE = re.compile(
+    r"\b(?:key\s*words?|index terms)\b\s*[:.\u2014\u2013-]?\s*(.+?)"
+    r"(?:\n\s*\n|\n\s*(?:(?:1|I)\.?\s+)?introduction\b|\n\s*(?:msc|ams|pacs)\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+COPYRIGHT_YEAR_RE = re.compile(r"(?:\u00a9|\(c\)|copyright)\s*((?:19|20)\d{2})", re.IGNORECASE)
+NAME_RE = re.compile(r"^(?:[A-Z][\w'\u2019-]*\.?\s*){1,5}[A-Z][\w'\u2019-]+$")
+NOT_NAME_RE = re.compile(
+    r"\d|@|\b(?:university|institute|department|dept|school|college|laboratory|lab|"
+    r"abstract|arxiv|journal|vol|email|centre|center)\b",
+    re.IGNORECASE,
+)
+AUTHOR_SPLIT_RE = re.compile(r"\s*(?:,|;|\band\b|&)\s*")
+# Capitalized title words that NAME_RE would take for a name ("A Survey", "The Heat Equation").
+NOT_NAME_WORDS = {
+    "an", "the", "of", "on", "for", "in", "to", "with", "from", "via", "towards", "using",
+    "survey", "review", "introduction", "overview", "tutorial", "note", "notes", "letter", "report",
+    "thesis", "chapter", "part", "paper", "study", "analysis", "approach", "method", "methods",
+    "model", "models", "theory", "problem", "problems", "equation", "equations", "system", "systems",
+    "algorithm", "algorithms", "learning", "network", "networks", "new", "general", "applications",
+}
+MAX_NAME_CHARS = 40
+
+
+@dataclass
+class TextLine:
+    text: str
+    size: float     # largest font size on the line
+    top: float      # y0 as a fraction of page height
+
+
+def page_lines(page: "fitz.Page") -> List[TextLine]:
+    """Text lines with font sizes from PyMuPDF's layout dict."""
+    height = page.rect.height or 1.0
+    lines: List[TextLine] = []
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            spans = [sp for sp in line.get("spans", []) if (sp.get("text") or "").strip()]
+            if not spans:
+                continue
+            text = " ".join(sp["text"].strip() for sp in spans)
+            size = max(float(sp.get("size") or 0.0) for sp in spans)
+            lines.append(TextLine(text=text, size=size, top=line["bbox"][1] / height))
+    return lines
+
+
+def _clean(text: str) -> str:
+    text = re.sub(r"-\n(?=[a-z])", "", text)   # re-join hyphenated line breaks
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _split_names(line: str) -> List[str]:
+    line = re.sub(r"[\*\u2020\u2021\u00a7\u00b6]|\^\w+|\s\d(?=\s|,|$)", " ", line)
+    parts = [p.strip(" .,") for p in AUTHOR_SPLIT_RE.split(line)]
+    parts = [p for p in parts if p]
+    if not parts or any(NOT_NAME_RE.search(p) or not NAME_RE.match(p) or not _name_like(p) for p in parts):
+        return []
+    return parts
+
+
+def _name_like(part: str) -> bool:
+    """Length and stop-word guard on top of NAME_RE."""
+    words = part.lower().replace(".", " ").split()
+    return len(part) <= MAX_NAME_CHARS and not any(w in NOT_NAME_WORDS for w in words)
+
+
+def heuristic_front(lines: List[TextLine], text: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Deterministic front-matter extraction from first-page layout + front text.
+
+    Returns (fields, confidence). Only fields that were found appear in
+    `fields`; confidence is in [0, 1] per field.
+    """
+    fields: Dict[str, Any] = {}
+    conf: Dict[str, float] = {}
+
+    # Title: the largest font in the top half of page one.
+    top_lines = [ln for ln in lines if ln.top < 0.5 and len(ln.text) > 1]
+    title_end = -1
+    if top_lines:
+        sizes = sorted(ln.size for ln in lines)
+        body_size = sizes[len(sizes) // 2]
+        title_size = max(ln.size for ln in top_lines)
+        idx = [i for i, ln in enumerate(lines) if ln.top < 0.5 and abs(ln.size - title_size) < 0.5]
+        # keep the first run of consecutive title-sized lines
+        run = [idx[0]]
+        for i in idx[1:]:
+            if i != run[-1] + 1:
+                break
+            run.append(i)
+        title = _clean(" ".join(lines[i].text for i in run))
+        title_end = run[-1]
+        if 4 <= len(title) <= 300 and not NOT_NAME_RE.search(title.split(" ")[0]):
+            fields["title"] = title
+            conf["title"] = 0.9 if title_size >= 1.25 * body_size else 0.5
+
+    # Authors: name-like lines right below the title.
+    if title_end >= 0:
+        authors: List[str] = []
+        for ln in lines[title_end + 1:title_end + 8]:
+            if ABSTRACT_RE.match(ln.text):
+                break
+            names = _split_names(ln.text)
+            if names:
+                authors.extend(names)
+            elif authors:
+                break
+        if authors:
+            fields["authors"] = list(dict.fromkeys(authors))
+            conf["authors"] = 0.8
+
+    # Abstract: text after the "Abstract" marker up to keywords/introduction.
+    m = ABSTRACT_RE.search(text)
+    if m:
+        rest = text[m.end():]
+        end = ABSTRACT_END_RE.search(rest)
+        abstract = _clean(rest[:end.start()] if end else rest[:3000])
+        if len(abstract) >= 50:
+            fields["abstract"] = abstract
+            conf["abstract"] = 0.9 if end and 200 <= len(abstract) <= 3000 else 0.5
+
+    # Keywords: the "Keywords:" / "Index Terms" line.
+    m = KEYWORDS_RE.search(text)
+    if m:
+        kws = [_clean(k).strip(" .") for k in re.split(r"[;,\u00b7\u2022]", m.group(1))]
+        kws = [k for k in kws if 1 < len(k) <= 80]
+        if kws:
+            fields["keywords"] = kws
+            conf["keywords"] = 0.9 if 2 <= len(kws) <= 15 else 0.5
+
+    # Year: only trust an explicit copyright line.
+    m = COPYRIGHT_YEAR_RE.search(text)
+    if m:
+        fields["year"] = int(m.group(1))
+        conf["year"] = 0.8
+
+    return fields, conf
+
+
 @dataclass
 class PaperSlices:
     front_text: str
     page_count: int
+    heuristic: Optional[Dict[str, Any]] = None
+    heuristic_confidence: Optional[Dict[str, float]] = None
 
 
-def slice_front(pdf_path: str) -> PaperSlices:
-    doc = fitz.open(pdf_path)
-    n = doc.page_count
+def slice_front(reader: PdfReader, with_heuristics: bool = False) -> PaperSlices:
+    n = reader.page_count
 
     front_n = min(FRONT_PAGES_DEFAULT, n)
-    front_text = extract_pages_text(doc, list(range(0, front_n)), MAX_CHARS_FRONT)
+    front_text = reader.text(front_n, MAX_CHARS_FRONT)
 
     if not has_front_signal(front_text) and n > front_n:
         front_n2 = min(FRONT_PAGES_FALLBACK, n)
-        front_text = extract_pages_text(doc, list(range(0, front_n2)), MAX_CHARS_FRONT)
+        front_text = reader.text(front_n2, MAX_CHARS_FRONT)  # pages 0..front_n are cached
+
+    heuristic, confidence = None, None
+    if with_heuristics and n:
+        full_front = reader.text(front_n, 20000)
+        heuristic, confidence = heuristic_front(reader.page_lines(0), full_front)
+
+    return PaperSlices(
+        front_text=front_text,
+        page_count=n,
+        heuristic=heuristic,
+        heuristic_confidence=confidence,
+    )
 
-    doc.close()
-    return PaperSlices(front_text=front_text, page_count=n)
 
+# Opened in main() unless --no-llm-cache; only used from the main process.
+_llm_cache: Optional[LLMCache] = None
+
+
+def ollama_generate(prompt: str) -> Tuple[str, str]:
+    """
+    (response text, source): "cache" for an LLM cache hit, "model" for a fresh
+    model answer, "fake" for a canned answer from fake_ollama.py, which must
+    never be cached or kept as a current result.
+    """
+    if _llm_cache is not None:
+        cached = _llm_cache.get(MODEL, LLM_OPTIONS, prompt)
+        if cached is not None:
+            return cached, "cache"
 
-def ollama_generate(prompt: str) -> str:
     payload = {
         "model": MODEL,
         "prompt": prompt,
         "stream": False,
-        "options": {"temperature": 0}
+        "options": LLM_OPTIONS
     }
     r = requests.post(OLLAMA_URL, json=payload, timeout=TIMEOUT_SECS)
     r.raise_for_status()
-    return (r.json().get("response") or "").strip()
+    body = r.json()
+    return (body.get("response") or "").strip(), "fake" if body.get("fake") else "model"
 
 
 def parse_json_strictish(text: str) -> Dict[str, Any]:
@@ -186,9 +613,12 @@ def call_llm_json(prompt_template: str, text_block: str) -> Tuple[Dict[str, Any]
 
     for attempt in range(MAX_RETRIES + 1):
         try:
-            raw = ollama_generate(prompt)
+            raw, source = ollama_generate(prompt)
             parsed = parse_json_strictish(raw)
-            return parsed, {"prompt": prompt, "raw_response": raw, "attempt": attempt}
+            # Only fresh model responses that parsed are worth replaying.
+            if _llm_cache is not None and source == "model":
+                _llm_cache.put(MODEL, LLM_OPTIONS, prompt, raw)
+            return parsed, {"prompt": prompt, "raw_response": raw, "attempt": attempt, "source": source}
         except Exception as e:
             last_err = str(e)
             if attempt < MAX_RETRIES:
@@ -239,81 +669,428 @@ def postprocess_front(front: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def process_pdf(pdf_path: str) -> Dict[str, Any]:
-    paper_id = sha1_file(pdf_path)
+@dataclass
+class PreparedPdf:
+    paper_id: str
+    file_info: Dict[str, Any]
+    mtime_ns: int
+    slices: Optional[PaperSlices]              # None when a current result already exists
+    existing: Optional[Dict[str, Any]] = None  # stored result reused instead of the LLM
+    signature: Optional[bytes] = None          # MinHash of the front pages (near_dup.py)
+    dedup_text: str = ""
+
+
+def prepare_pdf(
+    pdf_path: str,
+    config_hash: Optional[str] = None,
+    with_heuristics: bool = False,
+    with_signature: bool = False,
+) -> PreparedPdf:
+    """
+    CPU stage: hash the file and slice the front pages (picklable for process pools).
+
+    The file is read once (PdfReader). With config_hash set, slicing is skipped
+    when the content-addressed result already exists for the same settings
+    (e.g. a renamed or copied PDF). With with_signature set, the first
+    FRONT_PAGES_DEFAULT pages are also MinHash-signed for near-duplicate lookup
+    (the page text is cached, so this adds no extraction).
+    """
     stat = os.stat(pdf_path)
+    sig, dedup_text = None, ""
+    with PdfReader(pdf_path, get_page_cache()) as reader:
+        paper_id = reader.sha1
+        existing = load_current_result(paper_id, config_hash) if config_hash else None
+        slices = None if existing is not None else slice_front(reader, with_heuristics)
+        if with_signature:
+            dedup_text = reader.text(FRONT_PAGES_DEFAULT, MAX_CHARS_FRONT)
+            sig = signature(dedup_text)
+
+    file_info = {
+        "path": pdf_path,
+        "filename": os.path.basename(pdf_path),
+        "size_bytes": stat.st_size,
+        "modified_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(stat.st_mtime)),
+    }
+    return PreparedPdf(
+        paper_id=paper_id,
+        file_info=file_info,
+        mtime_ns=stat.st_mtime_ns,
+        slices=slices,
+        existing=existing,
+        signature=sig,
+        dedup_text=dedup_text if sig is not None else "",
+    )
 
-    slices = slice_front(pdf_path)
 
-    print("    Extracting front matter...")
-    front_parsed, front_log = call_llm_json(PROMPT_FRONT, slices.front_text)
+def render_fill_prompt(missing: List[str], known: Dict[str, Any], front_text: str) -> str:
+    """Smaller prompt asking only for the fields the heuristics could not fill."""
+    schema = "{\n  " + ",\n  ".join(FIELD_SCHEMA[k] for k in missing) + "\n}"
+    rules = "\n".join(FIELD_RULES[k] for k in missing if k in FIELD_RULES)
+
+    if set(missing) <= {"year", "categories"}:
+        # Title/abstract/keywords are known: send those instead of raw page text.
+        parts = [f"Title: {known['title']}", f"Abstract: {known['abstract']}"]
+        if known.get("keywords"):
+            parts.append("Keywords: " + ", ".join(known["keywords"]))
+        if "year" in missing:
+            parts.append("First page excerpt:\n" + front_text[:MAX_CHARS_FILL_EXCERPT])
+        text = "\n".join(parts)
+    else:
+        text = front_text
+
+    return PROMPT_FILL.replace("{SCHEMA}", schema).replace("{RULES}", rules).replace("{TEXT}", text)
+
+
+def extract_front(prep: PreparedPdf) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """
+    LLM stage: network-bound, safe to run from a thread pool.
 
+    Returns (front, llm_log, info) where info records which path filled each
+    field and how many LLM calls / seconds were spent.
+    """
+    slices = prep.slices
+    heuristic = slices.heuristic or {}
+    confidence = slices.heuristic_confidence or {}
+    known = {
+        k: v for k, v in heuristic.items()
+        if confidence.get(k, 0.0) >= HEURISTIC_MIN_CONFIDENCE
+    }
+    missing = [k for k in FIELD_SCHEMA if k not in known]
+    needed = [k for k in missing if k not in OPTIONAL_FIELDS]
+
+    front: Dict[str, Any] = dict(known)
+    sources: Dict[str, Optional[str]] = {k: "heuristic" for k in known}
+    llm_log: Dict[str, Any] = {}
+    llm_calls = 0
+    llm_seconds = 0.0
+
+    if needed and LLM_ENABLED:
+        t0 = time.perf_counter()
+        if len(missing) == len(FIELD_SCHEMA):
+            parsed, llm_log = call_llm_json(PROMPT_FRONT, slices.front_text)
+        else:
+            prompt = render_fill_prompt(missing, known, slices.front_text)
+            parsed, llm_log = call_llm_json(prompt, "")
+        llm_seconds = time.perf_counter() - t0
+        llm_calls = 1
+
+        if "error" in parsed:
+            front["error"] = parsed["error"]
+        for k in missing:
+            if parsed.get(k) not in (None, "", []):
+                front[k] = parsed[k]
+                sources[k] = "llm"
+
+    for k in FIELD_SCHEMA:
+        sources.setdefault(k, None)
+
+    if not known:
+        path = "llm" if llm_calls else "none"
+    else:
+        path = "heuristic+llm" if llm_calls else "heuristic"
+
+    info = {
+        "path": path,
+        "field_sources": sources,
+        "heuristic_confidence": confidence,
+        "llm_calls": llm_calls,
+        "llm_seconds": round(llm_seconds, 3),
+    }
+    if llm_log.get("source") == "fake":
+        info["fake_llm"] = True
+    return front, llm_log, info
+
+
+def build_records(
+    prep: PreparedPdf,
+    front_parsed: Dict[str, Any],
+    front_log: Dict[str, Any],
+    info: Dict[str, Any],
+    config_hash: str,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     merged = {
-        "id": paper_id,
-        "file": {
-            "path": pdf_path,
-            "filename": os.path.basename(pdf_path),
-            "size_bytes": stat.st_size,
-            "modified_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(stat.st_mtime)),
-        },
+        "id": prep.paper_id,
+        "file": prep.file_info,
         "pdf": {
-            "page_count": slices.page_count
+            "page_count": prep.slices.page_count
         },
         "slices_info": {
             "front_pages_default": FRONT_PAGES_DEFAULT,
             "front_pages_fallback": FRONT_PAGES_FALLBACK,
-            "front_chars": len(slices.front_text or ""),
+            "front_chars": len(prep.slices.front_text or ""),
+        },
+        "extraction": {
+            "model": MODEL,
+            # canned fake-Ollama answers are written for inspection, but under a
+            # hash no run matches, so the next run against a real model redoes them
+            "config_hash": config_hash + FAKE_HASH_SUFFIX if info.get("fake_llm") else config_hash,
+            **info,
         },
         "front": postprocess_front(front_parsed),
     }
 
     raw_log = {
-        "id": paper_id,
+        "id": prep.paper_id,
         "file": merged["file"],
         "slices_info": merged["slices_info"],
+        "heuristic": prep.slices.heuristic,
         "llm_calls": {"front": front_log},
     }
+    return merged, raw_log
 
-    out_json_path = os.path.join(OUT_JSON_DIR, f"{paper_id}.json")
-    out_log_path = os.path.join(OUT_LOG_DIR, f"{paper_id}_raw.json")
-
-    with open(out_json_path, "w", encoding="utf-8") as f:
-        json.dump(merged, f, ensure_ascii=False, indent=2)
 
-    with open(out_log_path, "w", encoding="utf-8") as f:
-        json.dump(raw_log, f, ensure_ascii=False, indent=2)
-
-    index_row = {
-        "id": paper_id,
+def make_index_row(merged: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": merged["id"],
         "filename": merged["file"]["filename"],
         "title": merged["front"]["title"],
         "year": merged["front"]["year"],
         "authors_n": len(merged["front"]["authors"] or []),
         "front_chars": merged["slices_info"]["front_chars"],
+        "extraction_path": (merged.get("extraction") or {}).get("path"),
+        "llm_calls": (merged.get("extraction") or {}).get("llm_calls"),
         "errors": {"front": merged["front"].get("error")},
     }
-    with open(OUT_INDEX, "a", encoding="utf-8") as f:
-        f.write(json.dumps(index_row, ensure_ascii=False) + "\n")
 
-    return merged
 
+class Manifest:
+    """
+    Append-only checkpoint of finished PDFs, one JSON line each.
 
-def main() -> None:
-    ensure_dirs()
-    pdfs = sorted(glob.glob(DATA_GLOB))
-    if not pdfs:
-        print(f"No PDFs found at: {DATA_GLOB}")
+    Every line is flushed as soon as its outputs are on disk, so a crashed run
+    loses at most the PDFs that were in flight. The last line for a path wins;
+    `compact()` rewrites the file with just those lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.by_path: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    self.by_path[entry["path"]] = entry
+
+    def is_current(self, pdf_path: str, config_hash: str) -> bool:
+        """Cheap check (no hashing): same file size/mtime and same settings as last time."""
+        entry = self.by_path.get(pdf_path)
+        if entry is None or entry.get("config_hash") != config_hash:
+            return False
+        try:
+            stat = os.stat(pdf_path)
+        except OSError:
+            return False
+        return (
+            entry.get("size_bytes") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and has_result(entry["id"])
+        )
+
+    def record(self, prep: PreparedPdf, merged: Dict[str, Any], config_hash: str) -> None:
+        entry = {
+            "path": prep.file_info["path"],
+            "id": merged["id"],   # the canonical paper's id for a near-duplicate
+            "size_bytes": prep.file_info["size_bytes"],
+            "mtime_ns": prep.mtime_ns,
+            "config_hash": config_hash,
+            "index_row": make_index_row(merged),
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.by_path[entry["path"]] = entry
+
+    def compact(self, pdfs: List[str]) -> List[Dict[str, Any]]:
+        """Keep only entries for PDFs that still exist; returns them in input order."""
+        entries = [self.by_path[p] for p in pdfs if p in self.by_path]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self.by_path = {e["path"]: e for e in entries}
+        return entries
+
+
+def rebuild_index(manifest: Manifest, pdfs: List[str]) -> int:
+    """Rewrite out/index.jsonl from the manifest (one row per current PDF, no duplicates)."""
+    entries = manifest.compact(pdfs)
+    seen = set()
+    tmp = OUT_INDEX + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in entries:
+            if entry["id"] in seen:
+                continue  # identical bytes under two file names
+            seen.add(entry["id"])
+            f.write(json.dumps(entry["index_row"], ensure_ascii=False) + "\n")
+    os.replace(tmp, OUT_INDEX)
+    return len(seen)
+
+
+# Aggregated by the writer stage (main thread only), printed at the end of a run.
+RUN_STATS: Dict[str, Any] = {
+    "extracted": 0,
+    "reused": 0,
+    "versions": 0,
+    "llm_calls": 0,
+    "llm_seconds": 0.0,
+    "paths": {},
+    "field_sources": {},
+}
+
+
+def update_run_stats(merged: Dict[str, Any], reused: bool) -> None:
+    if reused:
+        RUN_STATS["reused"] += 1
+        return
+    info = merged.get("extraction") or {}
+    RUN_STATS["extracted"] += 1
+    RUN_STATS["llm_calls"] += info.get("llm_calls") or 0
+    RUN_STATS["llm_seconds"] += info.get("llm_seconds") or 0.0
+    path = info.get("path") or "llm"
+    RUN_STATS["paths"][path] = RUN_STATS["paths"].get(path, 0) + 1
+    for field, source in (info.get("field_sources") or {}).items():
+        counts = RUN_STATS["field_sources"].setdefault(field, {})
+        counts[str(source)] = counts.get(str(source), 0) + 1
+
+
+def print_run_stats() -> None:
+    n = RUN_STATS["extracted"]
+    if not n:
         return
+    print(f"Extracted {n} papers ({RUN_STATS['reused']} reused): "
+          f"{RUN_STATS['llm_calls']} LLM calls, {RUN_STATS['llm_seconds']:.1f}s in LLM "
+          f"({RUN_STATS['llm_seconds'] / n:.2f}s/paper)")
+    print(f"  paths: {RUN_STATS['paths']}")
+    for field, counts in RUN_STATS["field_sources"].items():
+        print(f"  {field:<10} {counts}")
+
+
+def write_outputs(
+    prep: PreparedPdf,
+    merged: Dict[str, Any],
+    raw_log: Optional[Dict[str, Any]],
+    manifest: Manifest,
+    config_hash: str,
+) -> None:
+    """Writer stage: the only place that writes the corpus store, out/json, out/logs and the manifest."""
+    paper_id = merged["id"]
+
+    if raw_log is not None:
+        old = get_corpus().get(paper_id)
+        if old is not None and old.get("versions"):
+            merged["versions"] = old["versions"]    # re-extracted: keep the versions grouped under it
+        get_corpus().put(merged)
+        if WRITE_JSON:
+            write_json_atomic(os.path.join(OUT_JSON_DIR, f"{paper_id}.json"), merged)
+        write_json_atomic(os.path.join(OUT_LOG_DIR, f"{paper_id}_raw.json"), raw_log)
+    elif paper_id not in get_corpus():
+        get_corpus().put(merged)    # reused from an old out/json file
+
+    if _near_dup is not None:
+        _near_dup.add(paper_id, prep.signature, prep.dedup_text)
+    _written_ids.add(paper_id)
+    manifest.record(prep, merged, (merged.get("extraction") or {}).get("config_hash") or config_hash)
+    update_run_stats(merged, reused=raw_log is None)
+
+
+# Opened in main() unless --no-dedup; only used from the main process.
+_near_dup: Optional[NearDupIndex] = None
+_dedup_embeddings = None         # EmbeddingStore, with --dedup-embeddings
+_written_ids = set()             # papers written in this run
+
+
+def embedding_similarity(text_a: str, text_b: str) -> float:
+    a, b = _dedup_embeddings.encode([text_a, text_b])
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denom if denom else 0.0
+
+
+def find_canonical(prep: PreparedPdf, config_hash: str, force: bool) -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    (stored result of the paper prep is a version of, MinHash similarity), or
+    None when prep is a paper of its own. Costs BANDS indexed lookups plus a
+    signature comparison per bucket hit, independent of the corpus size.
+    """
+    if _near_dup is None or prep.signature is None:
+        return None
+    hit = _near_dup.find(prep.signature, exclude=prep.paper_id)
+    if hit is None:
+        return None
+    canonical_id, sim = hit
+    if force and canonical_id not in _written_ids:
+        return None     # --force: only reuse results re-extracted in this run
+    canonical = load_current_result(canonical_id, config_hash)
+    if canonical is None:
+        return None
+    if _dedup_embeddings is not None:
+        if embedding_similarity(prep.dedup_text, _near_dup.front_text(canonical_id)) < DEDUP_EMBED_MIN:
+            return None
+    return canonical, sim
+
+
+def write_version(
+    prep: PreparedPdf,
+    canonical: Dict[str, Any],
+    sim: float,
+    manifest: Manifest,
+    config_hash: str,
+) -> None:
+    """Writer stage for a near-duplicate: list it under the canonical paper instead of storing it."""
+    paper_id, canonical_id = prep.paper_id, canonical["id"]
+    version = {
+        "id": paper_id,
+        "path": prep.file_info["path"],
+        "filename": prep.file_info["filename"],
+        "similarity": round(sim, 3),
+    }
+    canonical["versions"] = [v for v in canonical.get("versions") or [] if v["id"] != paper_id] + [version]
+    corpus = get_corpus()
+    corpus.put(canonical)
+    if paper_id in corpus:
+        corpus.delete(paper_id)     # stored as a paper of its own before the match was known
+    if WRITE_JSON:
+        write_json_atomic(os.path.join(OUT_JSON_DIR, f"{canonical_id}.json"), canonical)
+    stale = os.path.join(OUT_JSON_DIR, f"{paper_id}.json")
+    if os.path.exists(stale):
+        os.remove(stale)
+
+    _near_dup.add_version(paper_id, canonical_id, prep.file_info["path"], sim)
+    manifest.record(prep, canonical, config_hash)
+    RUN_STATS["versions"] += 1
+
+
+def process_pdf(pdf_path: str, manifest: Manifest, config_hash: str, force: bool = False) -> Dict[str, Any]:
+    prep = prepare_pdf(pdf_path, None if force else config_hash, USE_HEURISTICS, _near_dup is not None)
+    dup = find_canonical(prep, config_hash, force)
+    if dup is not None:
+        canonical, sim = dup
+        print(f"    Near-duplicate of {canonical['file']['filename']} (similarity {sim:.2f}), reusing its result.")
+        write_version(prep, canonical, sim, manifest, config_hash)
+        return canonical
+
+    if prep.existing is not None:
+        print("    Unchanged content, reusing stored result.")
+        write_outputs(prep, prep.existing, None, manifest, config_hash)
+        return prep.existing
+
+    print("    Extracting front matter...")
+    front_parsed, front_log, info = extract_front(prep)
+
+    merged, raw_log = build_records(prep, front_parsed, front_log, info, config_hash)
+    write_outputs(prep, merged, raw_log, manifest, config_hash)
+    return merged
 
-    # Fresh run
-    if os.path.exists(OUT_INDEX):
-        os.remove(OUT_INDEX)
 
-    print(f"Found {len(pdfs)} PDFs.")
+def run_sequential(pdfs: List[str], manifest: Manifest, config_hash: str, force: bool) -> None:
     for i, pdf_path in enumerate(pdfs, 1):
         print(f"[{i}/{len(pdfs)}] Processing: {os.path.basename(pdf_path)}")
         try:
-            merged = process_pdf(pdf_path)
+            merged = process_pdf(pdf_path, manifest, config_hash, force)
             title = merged["front"].get("title") or ""
             print(f"  -> OK | title: {title[:90]}")
         except Exception as e:
@@ -323,9 +1100,187 @@ def main() -> None:
                 print("Full error details for first failure:")
                 traceback.print_exc()
 
+
+def run_pipeline(
+    pdfs: List[str],
+    manifest: Manifest,
+    config_hash: str,
+    force: bool,
+    cpu_workers: int,
+    llm_workers: int,
+    max_in_flight: int,
+) -> None:
+    """
+    Three overlapping stages:
+      prepare (process pool) -> LLM (thread pool) -> write (this thread).
+
+    At most `max_in_flight` PDFs are admitted at a time, so memory stays flat
+    no matter how many PDFs are queued: a new PDF is only admitted once an
+    earlier one has been written (or failed).
+    """
+    total = len(pdfs)
+    reuse_hash = None if force else config_hash
+    pending = iter(enumerate(pdfs, 1))
+    # future -> (stage, position, path, prepared pdf for the LLM stage)
+    in_flight: Dict[Future, Tuple[str, int, str, Optional[PreparedPdf]]] = {}
+    done_n = 0
+    failed_n = 0
+
+    with ProcessPoolExecutor(max_workers=cpu_workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=llm_workers) as llm_pool:
+
+        def admit() -> None:
+            while len(in_flight) < max_in_flight:
+                nxt = next(pending, None)
+                if nxt is None:
+                    return
+                i, pdf_path = nxt
+                fut = cpu_pool.submit(prepare_pdf, pdf_path, reuse_hash, USE_HEURISTICS, _near_dup is not None)
+                in_flight[fut] = ("prepare", i, pdf_path, None)
+
+        admit()
+        while in_flight:
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, i, pdf_path, prep = in_flight.pop(fut)
+                name = os.path.basename(pdf_path)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    failed_n += 1
+                    print(f"[{i}/{total}] FAILED ({stage}): {name}: {e}")
+                    continue
+
+                if stage == "prepare":
+                    prep = result
+                    dup = find_canonical(prep, config_hash, force)
+                    if dup is None and prep.existing is None:
+                        in_flight[llm_pool.submit(extract_front, prep)] = ("llm", i, pdf_path, prep)
+                        continue
+                    merged, raw_log = prep.existing, None
+                else:
+                    # a near-duplicate admitted alongside this PDF may have been written since
+                    dup = find_canonical(prep, config_hash, force)
+                    merged, raw_log = build_records(prep, *result, config_hash=config_hash)
+
+                try:
+                    if dup is not None:
+                        merged = dup[0]
+                        write_version(prep, *dup, manifest, config_hash)
+                    else:
+                        write_outputs(prep, merged, raw_log, manifest, config_hash)
+                except Exception as e:
+                    failed_n += 1
+                    print(f"[{i}/{total}] FAILED (write): {name}: {e}")
+                    continue
+
+                done_n += 1
+                title = merged["front"].get("title") or ""
+                print(f"[{done_n}/{total}] OK: {name} | title: {title[:90]}")
+            admit()
+
+    print(f"Pipeline finished: {done_n} ok, {failed_n} failed.")
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Extract front-matter metadata from PDFs with Ollama.")
+    ap.add_argument("--force", action="store_true",
+                    help="re-extract every PDF even if a current result exists")
+    ap.add_argument("--no-heuristics", action="store_true",
+                    help="send the full front text to the LLM for every field")
+    ap.add_argument("--heuristic-only", action="store_true",
+                    help="never call the LLM; fields the heuristics miss stay empty")
+    ap.add_argument("--no-llm-cache", action="store_true",
+                    help=f"always call Ollama instead of replaying {LLM_CACHE_PATH}")
+    ap.add_argument("--write-json", action="store_true",
+                    help=f"also write one {OUT_JSON_DIR}/<id>.json per paper next to {OUT_CORPUS}")
+    ap.add_argument("--no-dedup", action="store_true",
+                    help=f"store near-duplicate PDFs as separate papers (skips {NEAR_DUP_PATH})")
+    ap.add_argument("--dedup-embeddings", action="store_true",
+                    help=f"also require front-page embedding similarity >= {DEDUP_EMBED_MIN} for a near-duplicate")
+    ap.add_argument("--pipeline", action="store_true",
+                    help="overlap hashing/slicing, LLM calls and writes across PDFs")
+    ap.add_argument("--cpu-workers", type=int, default=CPU_WORKERS,
+                    help=f"processes for hashing + PyMuPDF (default: {CPU_WORKERS})")
+    ap.add_argument("--llm-workers", type=int, default=LLM_WORKERS,
+                    help=f"concurrent Ollama requests (default: {LLM_WORKERS})")
+    ap.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                    help=f"max PDFs held in the pipeline at once (default: {MAX_IN_FLIGHT})")
+    return ap.parse_args()
+
+
+def main() -> None:
+    global _llm_cache, _near_dup, _dedup_embeddings, USE_HEURISTICS, LLM_ENABLED, WRITE_JSON
+
+    args = parse_args()
+    # Both are part of the config hash.
+    USE_HEURISTICS = not args.no_heuristics
+    LLM_ENABLED = not args.heuristic_only
+    WRITE_JSON = args.write_json
+    ensure_dirs()
+    pdfs = sorted(glob.glob(DATA_GLOB))
+    if not pdfs:
+        print(f"No PDFs found at: {DATA_GLOB}")
+        return
+
+    config_hash = extraction_config_hash()
+    manifest = Manifest(OUT_MANIFEST)
+    if not args.no_llm_cache:
+        _llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES)
+    if not args.no_dedup:
+        _near_dup = NearDupIndex(NEAR_DUP_PATH)
+        if args.dedup_embeddings:
+            from embedding_store import EmbeddingStore
+            _dedup_embeddings = EmbeddingStore()
+
+    if args.force:
+        todo = pdfs
+    else:
+        current = {p for p in pdfs if manifest.is_current(p, config_hash)}
+        # PDFs extracted before near-duplicate detection (or with --no-dedup) are signed once, no LLM
+        unsigned = {p for p in current if _near_dup is not None and manifest.by_path[p]["id"] not in _near_dup}
+        todo = [p for p in pdfs if p not in current or p in unsigned]
+        if unsigned:
+            print(f"Signing {len(unsigned)} up-to-date PDFs for near-duplicate detection.")
+
+    print(f"Found {len(pdfs)} PDFs ({len(pdfs) - len(todo)} up to date, {len(todo)} to process).")
+    try:
+        if not todo:
+            pass
+        elif args.pipeline:
+            run_pipeline(
+                todo,
+                manifest,
+                config_hash,
+                force=args.force,
+                cpu_workers=max(1, args.cpu_workers),
+                llm_workers=max(1, args.llm_workers),
+                max_in_flight=max(1, args.max_in_flight),
+            )
+        else:
+            run_sequential(todo, manifest, config_hash, args.force)
+    finally:
+        # Also runs on Ctrl-C so the index always reflects what is checkpointed.
+        n = rebuild_index(manifest, pdfs)
+        print(f"Index rebuilt with {n} papers.")
+        print_run_stats()
+        if _llm_cache is not None:
+            stats = _llm_cache.stats()
+            print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['entries']} entries, {stats['evictions']} evicted")
+            _llm_cache.close()
+        if _near_dup is not None:
+            stats = _near_dup.stats()
+            print(f"Near-duplicates: {RUN_STATS['versions']} PDFs grouped as versions this run; "
+                  f"{stats['papers']} papers, {stats['versions']} versions in {NEAR_DUP_PATH}")
+            _near_dup.close()
+
     print("Done. Outputs:")
-    print(f"  - {OUT_JSON_DIR}/<id>.json")
+    print(f"  - {OUT_CORPUS} ({len(get_corpus())} papers)")
+    if WRITE_JSON:
+        print(f"  - {OUT_JSON_DIR}/<id>.json")
     print(f"  - {OUT_LOG_DIR}/<id>_raw.json")
+    print(f"  - {OUT_PAGES} (page text cache, reused by re-extraction and the full-text index)")
     print(f"  - {OUT_INDEX}")
 
 
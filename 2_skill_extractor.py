@@ -1,76 +1,339 @@
 #!/usr/bin/env python3
+"""
+Author skill profiles (out_main/employee/<author_id>.json), updated incrementally.
 
+A persistent count store (out_main/skill_counts.sqlite) holds, for every
+paper already applied, its authors, skills and activity year, and the
+resulting author x skill x year paper counts. Each run compares the corpus
+against it with a fingerprint per paper and only applies the deltas: papers
+added, changed (old contribution subtracted, new one added) or removed. Only
+the profiles of authors touched by a delta are rewritten, and profiles of
+authors left without papers are deleted. Authors are the canonical names from
+author_resolution.py (name variants of one person share a profile), and
+the profile id is that name's author id (expert_ranking.author_id, the id
+in out_main/author_map.json), so it is stable across runs and machines and
+joins with the map and the index. Skills are the canonical skill ids from skill_vocab.py (spelling
+variants and near-synonyms of a keyword count once), shown by their label.
+A paper whose authors or skills resolve differently than before counts as
+changed.
+
+The author map (out_main/author_map.json) and the skill vocabulary
+(out_main/skill_vocab.json) are loaded as they are, not rebuilt: papers
+whose author names or terms are all known are applied during the column
+scan, and only the few with unseen names or terms are held back. Those names
+are added to the map (AuthorMap.extend) and those terms to the vocabulary
+(the embedding store is opened only for terms no known spelling matches),
+then the held-back papers are applied. --rebuild (or a missing map or
+vocabulary) regroups everything from the full corpus.
+
+The year buckets make recency cheap for any reference year: per skill,
+recent_count is the papers of the last RECENT_YEARS years and score is
+log1p of the paper count decayed with expert_ranking.RECENCY_HALF_LIFE_YEARS,
+both one vectorized reduction over an author's buckets. The activity year is
+the paper's year, else the year of the PDF's modified time. When the
+reference year changes (a new calendar year, or --ref-year), every profile is
+rewritten from the buckets without re-reading any paper.
+
+Usage:
+  python 2_skill_extractor.py                 # apply changes since the last run
+  python 2_skill_extractor.py --rebuild       # recount everything, rewrite all profiles
+  python 2_skill_extractor.py --ref-year 2020 # scores as of 2020
+"""
 import os
 import json
+import hashlib
+import sqlite3
+import argparse
 from pathlib import Path
 from collections import defaultdict
 from datetime import datetime
-import math
+from typing import Dict, List, Sequence, Set, Tuple
 
-IN_DIR = Path("out_main/json")
+import numpy as np
+
+from author_resolution import AUTHOR_MAP_PATH, AuthorMap, build_author_map
+from corpus_store import CORPUS_PATH, open_corpus
+from expert_ranking import activity_year, author_id, recency_weights
+from embedding_store import EMBED_MODEL
+from skill_vocab import SKILL_VOCAB_PATH, SkillVocab, build_skill_vocab
+
+IN_DIR = Path("out_main/json")     # fallback when there is no corpus store (CORPUS_PATH)
 OUT_DIR = Path("out_main/employee")
+SKILL_DB = Path("out_main/skill_counts.sqlite")
+SCHEMA_VERSION = 3                 # bump to recount from scratch after a layout change
+RECENT_YEARS = 3                   # recent_count window, reference year included
 
-def main():
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+def paper_fingerprint(authors: Sequence[str], skills: Sequence[str], year: int) -> str:
+    blob = json.dumps([list(authors), list(skills), year], ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
 
-    # author -> { skill -> set(doc_ids) }
-    author_skills = defaultdict(lambda: defaultdict(set))
-    author_projects = defaultdict(set)
+class SkillCounts:
+    """Author x skill x year paper counts plus the per-paper contributions they were built from."""
 
-    for file_path in IN_DIR.glob("*.json"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    def __init__(self, path: Path = SKILL_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript(
+                """
+                DROP TABLE IF EXISTS applied;
+                DROP TABLE IF EXISTS author_skill;
+                DROP TABLE IF EXISTS author_skill_year;
+                DROP TABLE IF EXISTS author_papers;
+                DROP TABLE IF EXISTS dirty;
+                DROP TABLE IF EXISTS meta;
+                """
+            )
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS applied (
+                id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, authors TEXT NOT NULL, skills TEXT NOT NULL,
+                year INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS author_skill_year (
+                author TEXT NOT NULL, skill TEXT NOT NULL, year INTEGER NOT NULL, doc_count INTEGER NOT NULL,
+                PRIMARY KEY (author, skill, year)
+            );
+            CREATE TABLE IF NOT EXISTS author_papers (author TEXT PRIMARY KEY, project_count INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS dirty (author TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
 
-        doc_id = data.get("id")
-        front = data.get("front", {})
+    def clear(self) -> None:
+        for table in ("applied", "author_skill_year", "author_papers", "dirty", "meta"):
+            self._conn.execute(f"DELETE FROM {table}")
+        self._conn.commit()
 
-        authors = front.get("authors", [])
-        keywords = front.get("keywords", [])
-        categories = front.get("categories", [])
+    def fingerprints(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT id, fingerprint FROM applied"))
 
-        # combine skills
-        skills = set(keywords + categories)
+    def _bump(self, authors: Sequence[str], skills: Sequence[str], year: int, delta: int) -> None:
+        self._conn.executemany(
+            "INSERT INTO author_papers (author, project_count) VALUES (?, ?) "
+            "ON CONFLICT (author) DO UPDATE SET project_count = project_count + excluded.project_count",
+            [(a, delta) for a in authors],
+        )
+        self._conn.executemany(
+            "INSERT INTO author_skill_year (author, skill, year, doc_count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (author, skill, year) DO UPDATE SET doc_count = doc_count + excluded.doc_count",
+            [(a, s, year, delta) for a in authors for s in skills],
+        )
+        self._conn.executemany("INSERT OR IGNORE INTO dirty (author) VALUES (?)", [(a,) for a in authors])
 
-        for author in authors:
-            author_projects[author].add(doc_id)
+    def add(self, paper_id: str, authors: Sequence[str], skills: Sequence[str], year: int,
+            fingerprint: str) -> None:
+        self._bump(authors, skills, year, 1)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO applied (id, fingerprint, authors, skills, year) VALUES (?, ?, ?, ?, ?)",
+            (paper_id, fingerprint, json.dumps(list(authors), ensure_ascii=False),
+             json.dumps(list(skills), ensure_ascii=False), year),
+        )
 
-            for skill in skills:
-                author_skills[author][skill].add(doc_id)
+    def remove(self, paper_id: str) -> None:
+        row = self._conn.execute("SELECT authors, skills, year FROM applied WHERE id = ?", (paper_id,)).fetchone()
+        if row is None:
+            return
+        self._bump(json.loads(row[0]), json.loads(row[1]), row[2], -1)
+        self._conn.execute("DELETE FROM applied WHERE id = ?", (paper_id,))
 
-    # build profiles
-    for author, skills_map in author_skills.items():
-        employee_id = f"E{abs(hash(author)) % 100000}"  # simple stable-ish ID
-        project_count = len(author_projects[author])
+    def commit(self) -> None:
+        """Drop zero counts and commit the run's deltas together with the dirty set."""
+        self._conn.execute("DELETE FROM author_skill_year WHERE doc_count <= 0")
+        self._conn.execute("DELETE FROM author_papers WHERE project_count <= 0")
+        self._conn.commit()
 
-        top_skills = []
+    def set_ref_year(self, ref_year: int) -> bool:
+        """Record the reference year; if it changed, mark every author dirty. Returns whether it changed."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'ref_year'").fetchone()
+        if row is not None and int(row[0]) == ref_year:
+            return False
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ref_year', ?)", (str(ref_year),))
+        self._conn.execute("INSERT OR IGNORE INTO dirty (author) SELECT author FROM author_papers")
+        self._conn.commit()
+        return row is not None
+
+    def dirty(self) -> List[str]:
+        return [a for (a,) in self._conn.execute("SELECT author FROM dirty ORDER BY author")]
+
+    def done(self, authors: Sequence[str]) -> None:
+        self._conn.executemany("DELETE FROM dirty WHERE author = ?", [(a,) for a in authors])
+        self._conn.commit()
+
+    def profile(self, author: str) -> Tuple[int, List[Tuple[str, int, int]]]:
+        """(project_count, [(skill id, year, doc_count)] buckets); (0, []) if the author is gone."""
+        row = self._conn.execute("SELECT project_count FROM author_papers WHERE author = ?", (author,)).fetchone()
+        if row is None:
+            return 0, []
+        buckets = self._conn.execute(
+            "SELECT skill, year, doc_count FROM author_skill_year WHERE author = ? ORDER BY skill, year", (author,)
+        ).fetchall()
+        return row[0], buckets
 
-        for skill, doc_ids in skills_map.items():
-            doc_count = len(doc_ids)
-            score = round(math.log1p(doc_count), 2)
+def skill_activity(buckets: List[Tuple[str, int, int]], ref_year: int) -> Dict[str, np.ndarray]:
+    """
+    Per-skill totals from (skill, year, count) buckets: doc_count, recent_count
+    (known years within RECENT_YEARS of ref_year) and the recency-decayed count.
+    """
+    skills, inv = np.unique([b[0] for b in buckets], return_inverse=True)
+    years = np.array([b[1] for b in buckets], dtype=np.int64)
+    counts = np.array([b[2] for b in buckets], dtype=np.float64)
+    recent = (years > ref_year - RECENT_YEARS) & (years <= ref_year)
+    n = len(skills)
+    return {
+        "skills": skills,
+        "doc_count": np.bincount(inv, weights=counts, minlength=n).astype(np.int64),
+        "recent_count": np.bincount(inv, weights=counts * recent, minlength=n).astype(np.int64),
+        "decayed": np.bincount(inv, weights=counts * recency_weights(years, ref_year), minlength=n),
+    }
 
-            top_skills.append({
-                "skill": skill,
-                "doc_count": doc_count,
-                "recent_count": 0,     # not implemented yet
-                "score": score
-            })
+def write_json_atomic(path: Path, obj) -> None:
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
 
-        # sort by doc_count descending
-        top_skills.sort(key=lambda x: x["doc_count"], reverse=True)
+def write_profiles(store: SkillCounts, authors: List[str], vocab: SkillVocab, ref_year: int) -> Tuple[int, int]:
+    """Rewrite the profiles of the given authors; delete those with no papers left."""
+    written = deleted = 0
+    today = datetime.now().date().isoformat()
+    for author in authors:
+        out_file = OUT_DIR / f"{author_id(author)}.json"
+        project_count, buckets = store.profile(author)
+        if not project_count:
+            if out_file.exists():
+                out_file.unlink()
+                deleted += 1
+            continue
 
+        top_skills = []
+        if buckets:
+            act = skill_activity(buckets, ref_year)
+            years: Dict[str, Dict[str, int]] = {}
+            for sid, year, count in buckets:
+                years.setdefault(sid, {})[str(year) if year else "unknown"] = count
+            # most used skills first, then the most recently active, then by id
+            order = np.lexsort((act["skills"], -act["decayed"], -act["doc_count"]))
+            for i in order:
+                sid = str(act["skills"][i])
+                top_skills.append({
+                    "skill": vocab.label(sid),
+                    "skill_id": sid,
+                    "doc_count": int(act["doc_count"][i]),
+                    "recent_count": int(act["recent_count"][i]),
+                    "score": round(float(np.log1p(act["decayed"][i])), 2),
+                    "years": years[sid],
+                })
         profile = {
-            "employee_id": employee_id,
+            "employee_id": author_id(author),
             "name": author,
             "project_count": project_count,
             "top_skills": top_skills,
-            "last_updated": datetime.now().date().isoformat()
+            "ref_year": ref_year,
+            "last_updated": today,
         }
+        write_json_atomic(out_file, profile)
+        written += 1
+    return written, deleted
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or update author skill profiles from the corpus.")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="forget the stored counts and skill vocabulary and rebuild every profile")
+    ap.add_argument("--ref-year", type=int, default=datetime.now().year,
+                    help="year that recent_count and the decayed score are relative to (default: this year)")
+    args = ap.parse_args()
+
+    corpus = open_corpus(CORPUS_PATH, IN_DIR)
+    if corpus is None:
+        raise SystemExit(f"Missing input: neither {CORPUS_PATH} nor {IN_DIR} exists")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    if args.rebuild or not AUTHOR_MAP_PATH.exists():
+        amap, _ = build_author_map(corpus, rebuild=True)
+    else:
+        amap = AuthorMap.load()
+    vocab = SkillVocab.load()
+    if args.rebuild or not SKILL_VOCAB_PATH.exists() or vocab.model != EMBED_MODEL:
+        vocab, _ = build_skill_vocab(corpus, rebuild=True)
+
+    store = SkillCounts(SKILL_DB)
+    if args.rebuild:
+        store.clear()
+    applied = store.fingerprints()
+    if not applied:
+        # first run (or rebuild): drop profiles written under any earlier id scheme
+        for p in OUT_DIR.glob("*.json"):
+            p.unlink()
+    rescored = store.set_ref_year(args.ref_year)
+
+    counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+    def apply(doc_id: str, authors: List[str], terms: Set[str], year: int) -> None:
+        authors = amap.resolve(authors)
+        skills = sorted({vocab.skill_of(t) for t in terms} - {None})
+        fp = paper_fingerprint(authors, skills, year)
+        old = applied.get(doc_id)
+        if old == fp:
+            counts["unchanged"] += 1
+            return
+        if old is not None:
+            store.remove(doc_id)
+            counts["changed"] += 1
+        else:
+            counts["added"] += 1
+        store.add(doc_id, authors, skills, year, fp)
+
+    seen: Set[str] = set()
+    held: List[Tuple[str, List[str], Set[str], int]] = []
+    # narrow column scan: no full records parsed
+    for doc_id, authors, keywords, categories, year, mtime in corpus.iter_columns(
+            "id", "authors", "keywords", "categories", "year", "modified_time"):
+        seen.add(doc_id)
+        terms = set(keywords) | set(categories)
+        row = (doc_id, authors, terms, activity_year(year, mtime))
+        if all(amap.is_known(a) for a in authors) and all(vocab.is_known(t) for t in terms):
+            apply(*row)
+        else:
+            held.append(row)
+
+    # only papers with unseen names or terms grow the map and the vocabulary
+    new_names: Dict[str, int] = defaultdict(int)
+    new_terms: Dict[str, int] = defaultdict(int)
+    for _, authors, terms, _ in held:
+        for a in set(authors):
+            if not amap.is_known(a):
+                new_names[a] += 1
+        for t in terms:
+            if not vocab.is_known(t):
+                new_terms[t] += 1
+    extended = amap.extend(new_names)
+    if extended["new"]:
+        amap.save()
+    if new_terms:
+        vocab.update(new_terms)
+        vocab.save()
+    for row in held:
+        apply(*row)
+
+    for doc_id in sorted(applied.keys() - seen):
+        store.remove(doc_id)
+        counts["removed"] += 1
+    store.commit()
 
-        out_file = OUT_DIR / f"{employee_id}.json"
-        with open(out_file, "w", encoding="utf-8") as f:
-            json.dump(profile, f, indent=2, ensure_ascii=False)
+    dirty = store.dirty()
+    written, deleted = write_profiles(store, dirty, vocab, args.ref_year)
+    store.done(dirty)
 
-    print("Profiles generated.")
+    print(f"Authors: {len(amap.names)} names -> {len(set(amap.names.values()))} people "
+          f"({extended['new']} new names, {extended['joined']} joined an existing person)")
+    print(f"Skills: {len(vocab.skills)} keywords/categories -> {len(vocab)} skills ({len(new_terms)} new terms)")
+    print(f"Papers: added={counts['added']} changed={counts['changed']} "
+          f"removed={counts['removed']} unchanged={counts['unchanged']}")
+    if rescored:
+        print(f"Reference year is now {args.ref_year}: every profile rescored from the year buckets")
+    print(f"Profiles: {written} written, {deleted} deleted -> {OUT_DIR}")
 
 if __name__ == "__main__":
     main()
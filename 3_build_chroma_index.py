@@ -1,12 +1,52 @@
 #!/usr/bin/env python3
+import os
 import json
+import hashlib
+import argparse
+from datetime import datetime
 from pathlib import Path
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+import numpy as np
 
-IN_DIR = Path("out_main/json")
-PERSIST_DIR = Path("out_main/chroma")
+from author_resolution import AUTHOR_MAP_PATH, AuthorMap, build_author_map
+from bm25_index import BM25_INDEX_PATH, BM25Index
+from corpus_store import CORPUS_PATH, open_corpus
+from embedding_store import CachedEmbeddingFunction
+from fulltext import CHUNK_COLLECTION_NAME, build_chunk_collection, state_path
+from page_cache import PAGE_CACHE_PATH, PageCache
+from search_filters import FACETS_PATH, build_facets, filter_fields, save_facets
+from expert_ranking import (
+    AUTHOR_COLLECTION_NAME,
+    AUTHOR_INDEX_PATH,
+    AUTHOR_PROFILE_WEIGHTING,
+    AuthorIndex,
+    AuthorProfileBuilder,
+    activity_year,
+    author_id,
+    iter_metadata_log,
+)
+from vector_store import (
+    BACKENDS,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_M,
+    HNSW_NUM_THREADS,
+    HNSW_SEARCH_EF,
+    PERSIST_DIR,
+    QUANTIZATIONS,
+    SHARD_KEYS,
+    VECTOR_BACKEND,
+    drop_store,
+    hnsw_metadata,
+    load_shard_config,
+    open_store,
+    save_shard_config,
+    store_path,
+)
+
+IN_DIR = Path("out_main/json")     # fallback when there is no corpus store (CORPUS_PATH)
 COLLECTION_NAME = "projects"
+BATCH = 256
+LOG_FILE = PERSIST_DIR.parent / "metadata_log.jsonl"              # one line per indexed doc
+CHECKPOINT_FILE = PERSIST_DIR.parent / "index_checkpoint.json"    # only present mid-build
 
 def make_embedding_text(doc: dict) -> str:
     front = doc.get("front", {}) or {}
@@ -28,37 +68,32 @@ def make_embedding_text(doc: dict) -> str:
 
     return "\n".join(parts).strip()
 
-def main():
-    if not IN_DIR.exists():
-        raise SystemExit(f"Missing input folder: {IN_DIR}")
-
-    # Embedding model (small + fast, good for PoC)
-    embed_fn = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+def fingerprint(text: str, metadata: dict) -> str:
+    """Hash of everything we store per doc; unchanged fingerprint => skip re-embedding."""
+    blob = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
 
-    client = chromadb.PersistentClient(path=str(PERSIST_DIR))
+def resolved_front(data: dict, amap: AuthorMap) -> dict:
+    """Front matter with author names replaced by their canonical names."""
+    front = data.get("front", {}) or {}
+    return {**front, "authors": amap.resolve(front.get("authors") or [])}
 
-    # cosine distance is better for text embeddings
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embed_fn,
-        metadata={"hnsw:space": "cosine"},
-    )
+def iter_docs(corpus, amap: AuthorMap, start_after: str = ""):
+    """
+    Stream (key, doc_id, text, metadata) from the corpus in key order (paper
+    id, or file name for the JSON fallback). Only one paper is held in memory
+    at a time. Docs with nothing to embed are yielded with text "" so stale
+    index entries can be dropped.
+    """
+    for name, data in corpus.iter_papers(start_after):
+        doc_id = data["id"]
 
-    ids, docs, metas = [], [], []
-
-    for p in sorted(IN_DIR.glob("*.json")):
-        with p.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        doc_id = data.get("id")
-        if not doc_id:
-            continue
-
-        front = data.get("front", {}) or {}
+        front = resolved_front(data, amap)
         fileinfo = data.get("file", {}) or {}
 
         text = make_embedding_text(data)
         if not text:
+            yield name, doc_id, "", None
             continue
 
         metadata = {
@@ -66,51 +101,349 @@ def main():
             "path": fileinfo.get("path") or "",
             "modified_time": fileinfo.get("modified_time") or "",
             "year": str(front.get("year")) if front.get("year") is not None else "",
-            # store authors as a JSON string to keep it simple
-            "authors_json": json.dumps(front.get("authors") or [], ensure_ascii=False),
+            # canonical author names (author_resolution.py), as a JSON string to keep it simple
+            "authors_json": json.dumps(front["authors"], ensure_ascii=False),
             "title": front.get("title") or "",
+            # typed filter fields: year_num, author:<name>, cat:<category>
+            **filter_fields(front),
         }
+        metadata["fingerprint"] = fingerprint(text, metadata)
+        yield name, doc_id, text, metadata
 
-        ids.append(doc_id)
-        docs.append(text)
-        metas.append(metadata)
+def batched(iterable, n: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    if not ids:
-        raise SystemExit("No documents to index (check your JSON files).")
+def load_checkpoint() -> dict:
+    if not CHECKPOINT_FILE.exists():
+        return {}
+    with CHECKPOINT_FILE.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(state: dict) -> None:
+    tmp = CHECKPOINT_FILE.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+def remove_orphans(collection, corpus) -> list:
+    """Delete indexed ids no longer in the corpus (paged, constant memory); returns them."""
+    removed = []
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=5000, offset=offset)
+        if not page["ids"]:
+            break
+        gone = [doc_id for doc_id in page["ids"] if doc_id not in corpus]
+        if gone:
+            collection.delete(ids=gone)
+            removed.extend(gone)
+        offset += len(page["ids"]) - len(gone)
+    return removed
+
+def iter_pdf_paths(corpus, amap: AuthorMap):
+    """(paper id, pdf path, filter fields) for every extracted paper, one at a time."""
+    for _, data in corpus.iter_papers():
+        yield (data["id"], (data.get("file", {}) or {}).get("path") or "",
+               filter_fields(resolved_front(data, amap)))
 
-    # Minimal approach: delete and rebuild each time (safe for PoC)
-    # If you want incremental updates later, we’ll add upsert logic.
-    try:
-        client.delete_collection(COLLECTION_NAME)
-    except Exception:
-        pass
-
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embed_fn,
-        metadata={"hnsw:space": "cosine"},
-    )
-
-    # Add in batches (kept minimal)
-    BATCH = 256
+def iter_logged_metadata():
+    with LOG_FILE.open("r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)["metadata"]
+
+def profiles_current(authors) -> bool:
+    """True if the author collection has profiles built with the current weighting (and reference year)."""
+    page = authors.get(include=["metadatas"], limit=1)
+    if not page["ids"]:
+        return False
+    md = page["metadatas"][0] or {}
+    if md.get("weighting") != AUTHOR_PROFILE_WEIGHTING:
+        return False
+    return AUTHOR_PROFILE_WEIGHTING != "recency" or md.get("ref_year") == datetime.now().year
+
+def build_author_collection(collection, authors, author_index, dirty=None) -> tuple:
+    """
+    Second collection (authors) of per-author profile vectors (mean or
+    recency-weighted paper embeddings), so experts can be found with a single
+    kNN query.
+    Paper vectors are read back from the paper collection; nothing is re-embedded.
+
+    dirty: names of the authors whose papers were added, changed or removed
+    in this run; only their profiles are recomputed (from just their papers)
+    and only those left without papers are deleted. None rebuilds every
+    profile. Returns (profiles written, profiles deleted).
+    """
+    if dirty is not None and not dirty:
+        return 0, 0
+    index = author_index if dirty is None else author_index.restrict(dirty)
+
+    def pages():
+        if dirty is not None:
+            for i in range(0, len(index.paper_ids), 1000):
+                yield collection.get(ids=index.paper_ids[i:i + 1000].tolist(), include=["embeddings", "metadatas"])
+            return
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "metadatas"], limit=1000, offset=offset)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+
+    builder = None
+    for page in pages():
+        if not len(page["ids"]):
+            continue
+        vecs = np.asarray(page["embeddings"], dtype=np.float32)
+        if builder is None:
+            builder = AuthorProfileBuilder(index, vecs.shape[1], ref_year=datetime.now().year)
+        years = [activity_year((md or {}).get("year"), (md or {}).get("modified_time")) for md in page["metadatas"]]
+        builder.add(page["ids"], vecs, years)
+
+    ids, vecs, metas = builder.profiles() if builder else ([], np.zeros((0, 0)), [])
     for i in range(0, len(ids), BATCH):
-        collection.add(
-            ids=ids[i:i+BATCH],
-            documents=docs[i:i+BATCH],
-            metadatas=metas[i:i+BATCH],
-        )
-
-    # Log metadata to JSON file
-    log_data = [
-        {"id": doc_id, "metadata": meta}
-        for doc_id, meta in zip(ids, metas)
-    ]
-    log_file = Path(PERSIST_DIR).parent / "metadata_log.json"
-    with log_file.open("w", encoding="utf-8") as f:
-        json.dump(log_data, f, indent=2, ensure_ascii=False)
-
-    print(f"Indexed {len(ids)} projects into {PERSIST_DIR}/{COLLECTION_NAME}")
-    print(f"Metadata logged to {log_file}")
+        authors.upsert(ids=ids[i:i+BATCH], embeddings=vecs[i:i+BATCH], metadatas=metas[i:i+BATCH])
+
+    keep = set(ids)
+    if dirty is not None:
+        stale = [a for a in map(author_id, sorted(dirty)) if a not in keep]
+    else:
+        stale = []
+        offset = 0
+        while True:
+            page = authors.get(include=[], limit=5000, offset=offset)
+            if not page["ids"]:
+                break
+            stale.extend(a for a in page["ids"] if a not in keep)
+            offset += len(page["ids"])
+    for i in range(0, len(stale), BATCH):
+        authors.delete(ids=stale[i:i+BATCH])
+    authors.compact()
+    return len(ids), len(stale)
+
+def check_hnsw(store, args) -> None:
+    """
+    Apply query-time HNSW settings passed on the command line (otherwise the
+    stored ones, e.g. from tune_hnsw.py, are kept); warn when build-time ones
+    differ from the existing index.
+    """
+    if args.search_ef or args.hnsw_threads:
+        store.set_search_params(args.search_ef, args.hnsw_threads)
+    if store.backend != "chroma":
+        return
+    have = store.hnsw
+    if (have["M"], have["construction_ef"]) != (args.hnsw_m, args.construction_ef):
+        print(f"Note: {store.name} was built with M={have['M']} construction_ef={have['construction_ef']}; "
+              f"run with --rebuild to use M={args.hnsw_m} construction_ef={args.construction_ef}")
+
+def print_footprint(store) -> None:
+    fp = store.footprint()
+    print(f"  {fp['rows']} x {fp['dim']} {fp['dtype']} vectors: {fp['vectors_bytes'] / 1e6:.2f} MB memory-mapped; "
+          f"first-stage scan ({fp['quantization']}) holds {fp['scan_bytes'] / 1e6:.2f} MB")
+
+def make_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description=f"Build or update the vector index from {CORPUS_PATH} (or {IN_DIR}).")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="drop the collection and re-embed everything")
+    ap.add_argument("--fulltext", action="store_true",
+                    help=f"also chunk and embed the full text of every PDF into '{CHUNK_COLLECTION_NAME}'")
+    ap.add_argument("--backend", choices=BACKENDS, default=VECTOR_BACKEND,
+                    help="vector store to build (see vector_store.py)")
+    ap.add_argument("--quantize", choices=QUANTIZATIONS,
+                    help="exact backend: first-stage codes kept in RAM, full vectors rescored from disk "
+                         "(default: keep the store's current setting)")
+    ap.add_argument("--hnsw-m", type=int, default=HNSW_M,
+                    help="chroma: HNSW graph degree (new collections; use with --rebuild)")
+    ap.add_argument("--construction-ef", type=int, default=HNSW_CONSTRUCTION_EF,
+                    help="chroma: HNSW build beam width (new collections; use with --rebuild)")
+    ap.add_argument("--search-ef", type=int,
+                    help=f"chroma: HNSW query beam width, stored with the collection "
+                         f"(default: keep the stored value; {HNSW_SEARCH_EF} for new collections)")
+    ap.add_argument("--hnsw-threads", type=int,
+                    help="chroma: HNSW build/query threads, stored with the collection "
+                         "(default: keep the stored value; all cores for new collections)")
+    ap.add_argument("--shards", type=int,
+                    help="split every collection over N stores, written and queried in parallel "
+                         "(changing it needs --rebuild; default: keep the current layout)")
+    ap.add_argument("--shard-by", choices=SHARD_KEYS, default="hash",
+                    help="with --shards: place papers by id hash, by year or by first category")
+    return ap
+
+def main():
+    ap = make_parser()
+    args = ap.parse_args()
+    if args.quantize and args.backend != "exact":
+        ap.error("--quantize needs --backend exact")
+
+    corpus = open_corpus(CORPUS_PATH, IN_DIR)
+    if corpus is None:
+        raise SystemExit(f"Missing input: neither {CORPUS_PATH} nor {IN_DIR} exists")
+    # stops at the first paper with text, before anything is dropped or written
+    if not any(make_embedding_text(data) for _, data in corpus.iter_papers()):
+        raise SystemExit("No documents to index (check your JSON files).")
+
+    # One canonical name per author, used for authors_json, filters and the expert index
+    amap, resolved = build_author_map(corpus)
+
+    # Embedding model (small + fast, good for PoC), cached on disk by text hash
+    embed_fn = CachedEmbeddingFunction()
+
+    layout = load_shard_config(args.backend)
+    reshard = args.shards is not None and (max(args.shards, 1), args.shard_by) != (layout["shards"], layout["by"])
+    if reshard and not args.rebuild:
+        try:
+            open_store(COLLECTION_NAME, args.backend)
+        except Exception:
+            pass    # nothing indexed yet: just record the new layout
+        else:
+            raise SystemExit(f"Index is split into {layout['shards']} shard(s) by {layout['by']}; "
+                             f"add --rebuild to re-shard it")
+
+    if args.rebuild or reshard:
+        drop_store(COLLECTION_NAME, args.backend)
+        drop_store(AUTHOR_COLLECTION_NAME, args.backend)
+        CHECKPOINT_FILE.unlink(missing_ok=True)
+        if args.fulltext or reshard:
+            drop_store(CHUNK_COLLECTION_NAME, args.backend)
+            state_path(args.backend).unlink(missing_ok=True)
+    if reshard:
+        save_shard_config(args.backend, args.shards, args.shard_by)
+        layout = load_shard_config(args.backend)
+
+    hnsw = hnsw_metadata(args.hnsw_m, args.construction_ef, args.search_ef or HNSW_SEARCH_EF,
+                         args.hnsw_threads or HNSW_NUM_THREADS)
+    collection = open_store(COLLECTION_NAME, args.backend, create=True, embed_fn=embed_fn, hnsw=hnsw)
+    check_hnsw(collection, args)
+    if args.quantize:
+        collection.set_quantization(args.quantize)
+    out_dir = store_path(args.backend)
+    if layout["shards"] > 1:
+        out_dir = out_dir.with_name(out_dir.name + "_shard*")
+
+    # Resume an interrupted build: skip finished files and drop any log lines
+    # written after the last checkpoint (of a build into the same backend).
+    state = load_checkpoint()
+    if state.get("backend", "chroma") != args.backend:
+        state = {}
+    if state:
+        print(f"Resuming after {state['last_file']}")
+        with LOG_FILE.open("a", encoding="utf-8") as f:
+            f.truncate(min(state["log_bytes"], f.tell()))
+    else:
+        state = {"backend": args.backend, "last_file": "", "log_bytes": 0,
+                 "counts": {"added": 0, "updated": 0, "unchanged": 0, "dropped": 0}, "touched": []}
+        LOG_FILE.write_text("", encoding="utf-8")
+    counts = state["counts"]
+    touched = state.setdefault("touched", [])   # ids added/changed/dropped/removed, for the author profiles
+
+    with LOG_FILE.open("a", encoding="utf-8") as log:
+        docs = () if state.get("indexed") else iter_docs(corpus, amap, state["last_file"])
+        for batch in batched(docs, BATCH):
+            live = [b for b in batch if b[2]]
+            empty = [b[1] for b in batch if not b[2]]
+
+            # Compare against what is indexed for just this batch.
+            stored = {}
+            if live:
+                got = collection.get(ids=[b[1] for b in live], include=["metadatas"])
+                stored = {i: (md or {}).get("fingerprint", "") for i, md in zip(got["ids"], got["metadatas"])}
+
+            changed = [b for b in live if stored.get(b[1]) != b[3]["fingerprint"]]
+            if changed:
+                collection.upsert(
+                    ids=[b[1] for b in changed],
+                    embeddings=embed_fn.store.encode([b[2] for b in changed]),
+                    documents=[b[2] for b in changed],
+                    metadatas=[b[3] for b in changed],
+                )
+            gone = collection.get(ids=empty, include=[])["ids"] if empty else []
+            if gone:
+                collection.delete(ids=gone)
+
+            added = sum(1 for b in changed if b[1] not in stored)
+            counts["added"] += added
+            counts["updated"] += len(changed) - added
+            counts["unchanged"] += len(live) - len(changed)
+            counts["dropped"] += len(gone)
+            touched.extend(b[1] for b in changed)
+            touched.extend(gone)
+
+            for _, doc_id, _, meta in live:
+                log.write(json.dumps({"id": doc_id, "metadata": meta}, ensure_ascii=False) + "\n")
+            log.flush()
+
+            state["last_file"] = batch[-1][0]
+            state["log_bytes"] = log.tell()
+            save_checkpoint(state)
+
+    if not state.get("indexed"):
+        removed = remove_orphans(collection, corpus)
+        counts["removed"] = len(removed)
+        touched.extend(removed)
+        state["indexed"] = True     # a resume from here only redoes the steps below
+        save_checkpoint(state)
+    collection.compact()
+
+    # Author x paper matrix for expert ranking, from the complete metadata log
+    # (also covers docs handled before a resume). Profiles are only recomputed
+    # for authors of touched papers, before and after this run.
+    author_index = AuthorIndex.build(iter_metadata_log(LOG_FILE))
+    old_index = AuthorIndex.load(AUTHOR_INDEX_PATH)
+    authors_store = open_store(AUTHOR_COLLECTION_NAME, args.backend, create=True, embed_fn=embed_fn, hnsw=hnsw)
+    dirty = None
+    if old_index is not None and profiles_current(authors_store):
+        dirty = old_index.authors_of(touched) | author_index.authors_of(touched)
+    n_profiles, n_stale = build_author_collection(collection, authors_store, author_index, dirty)
+    author_index.save(AUTHOR_INDEX_PATH)
+    CHECKPOINT_FILE.unlink(missing_ok=True)
+
+    # Lexical index over the same text that is embedded
+    bm25 = BM25Index.build((doc_id, text) for _, doc_id, text, _ in iter_docs(corpus, amap) if text)
+    bm25.save(BM25_INDEX_PATH)
+
+    # Values available to filter on (app.py sidebar)
+    facets = build_facets(iter_logged_metadata())
+    save_facets(facets, FACETS_PATH)
+
+    if args.fulltext:
+        chunks = open_store(CHUNK_COLLECTION_NAME, args.backend, create=True, embed_fn=embed_fn, hnsw=hnsw)
+        check_hnsw(chunks, args)
+        if args.quantize:
+            chunks.set_quantization(args.quantize)
+        ft = build_chunk_collection(chunks, iter_pdf_paths(corpus, amap), embed_fn.store.encode_uncached,
+                                    PageCache(PAGE_CACHE_PATH))
+        chunks.compact()
+
+    indexed = counts["added"] + counts["updated"] + counts["unchanged"]
+    sharded = f" ({layout['shards']} shards by {layout['by']})" if layout["shards"] > 1 else ""
+    print(f"Indexed {indexed} projects into {out_dir}/{COLLECTION_NAME}{sharded}")
+    print(f"  added={counts['added']} updated={counts['updated']} "
+          f"unchanged={counts['unchanged']} removed={counts['removed'] + counts['dropped']}")
+    if args.backend == "exact":
+        print_footprint(collection)
+    else:
+        print("  HNSW: " + " ".join(f"{k}={v}" for k, v in collection.hnsw.items() if v is not None))
+    print(f"Metadata logged to {LOG_FILE}")
+    print(f"Author names: {resolved['names']} variants -> {resolved['people']} people -> {AUTHOR_MAP_PATH}")
+    print(f"Author index: {len(author_index.authors)} authors, {author_index.n_edges} edges -> {AUTHOR_INDEX_PATH}")
+    print(f"Author profiles: {authors_store.count()} vectors in {out_dir}/{AUTHOR_COLLECTION_NAME} "
+          f"({'all' if dirty is None else n_profiles} recomputed, {n_stale} deleted)")
+    print(f"BM25 index: {len(bm25)} docs, {len(bm25.terms)} terms -> {BM25_INDEX_PATH}")
+    print(f"Filter facets: years {'-'.join(map(str, facets['years'])) or 'n/a'}, "
+          f"{len(facets['authors'])} authors, {len(facets['categories'])} categories -> {FACETS_PATH}")
+    if args.fulltext:
+        print(f"Full text: {ft['chunks']} chunks from {ft['papers']} papers into "
+              f"{out_dir}/{CHUNK_COLLECTION_NAME} (unchanged={ft['skipped']} refreshed={ft['refreshed']} "
+              f"missing pdf={ft['missing']} removed={ft['removed']})")
+        if args.backend == "exact":
+            print_footprint(chunks)
 
 if __name__ == "__main__":
     main()
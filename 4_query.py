@@ -1,69 +1,177 @@
 #!/usr/bin/env python3
-import json
+import os
 import sys
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from collections import defaultdict
-from pathlib import Path
+import json
+import argparse
+import urllib.error
+import urllib.request
 
-PERSIST_DIR = Path("out_main/chroma")
-COLLECTION_NAME = "projects"
+from search_filters import make_where
 
-def main():
-    if len(sys.argv) < 2:
-        print('Usage: python query.py "your project description" [top_k]')
-        raise SystemExit(1)
+QUERY_SERVER_URL = os.getenv("QUERY_SERVER_URL", "http://127.0.0.1:8765")
+QUERY_BATCH = 256   # queries encoded + sent per call in --batch mode
 
-    query_text = sys.argv[1]
-    top_k = int(sys.argv[2]) if len(sys.argv) >= 3 else 10
+class ServerClient:
+    """Thin client for query_server.py (no chromadb / model imports)."""
 
-    embed_fn = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    client = chromadb.PersistentClient(path=str(PERSIST_DIR))
+    def __init__(self, url):
+        self.url = url.rstrip("/")
 
-    collection = client.get_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embed_fn,
-    )
+    def available(self):
+        try:
+            with urllib.request.urlopen(self.url + "/health", timeout=0.5) as r:
+                return r.status == 200
+        except (OSError, ValueError):
+            return False
 
-    res = collection.query(
-        query_texts=[query_text],
-        n_results=top_k,
-        include=["metadatas", "documents", "distances"],
-    )
+    def search(self, queries, top_k, experts_mode="papers", mode="vector", where=None, recent=False):
+        body = json.dumps({
+            "queries": queries, "top_k": top_k, "experts": experts_mode, "mode": mode, "where": where,
+            "recent": recent,
+        }).encode("utf-8")
+        req = urllib.request.Request(
+            self.url + "/search", data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=600) as r:
+                return json.loads(r.read())["results"]
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise
+            raise RuntimeError(json.loads(e.read() or b"{}").get("error") or str(e)) from None
+
+def get_searcher(use_server, backend=None):
+    """Warm query server if one is running, else load everything in-process."""
+    if use_server:
+        client = ServerClient(QUERY_SERVER_URL)
+        if client.available():
+            return client
+    from paper_search import PaperSearcher  # heavy imports only when needed
+    from vector_store import VECTOR_BACKEND
+    searcher = PaperSearcher(backend=backend or VECTOR_BACKEND)
+    return searcher
 
-    ids = res["ids"][0]
-    metas = res["metadatas"][0]
-    dists = res["distances"][0]  # with cosine space: dist ≈ (1 - cosine_similarity)
+def read_queries(path):
+    """Yield (id, query) from a file or stdin: plain lines or JSONL {"id", "query"}."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                obj = json.loads(line)
+                yield obj.get("id", n), obj["query"]
+            else:
+                yield n, line
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
+def batched(iterable, n):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def print_result(result, mode="vector"):
     print("\nTop similar projects:\n")
-    employee_scores = defaultdict(float)
-    employee_evidence = defaultdict(list)
-
-    for rank, (doc_id, md, dist) in enumerate(zip(ids, metas, dists), start=1):
-        # Convert distance -> similarity score in [~0..1]
-        sim = 1.0 - float(dist)
-
-        title = md.get("title", "")
-        filename = md.get("filename", "")
-        authors = json.loads(md.get("authors_json", "[]"))
-
-        print(f"{rank:>2}. sim={sim:.3f}  doc_id={doc_id}  file={filename}")
-        if title:
-            print(f"    title: {title}")
-        if authors:
-            print(f"    authors: {', '.join(authors)}")
-
-        # Rank employees by summed similarity from matched projects
-        for a in authors:
-            employee_scores[a] += sim
-            employee_evidence[a].append({"doc_id": doc_id, "sim": round(sim, 3)})
-
-    ranked = sorted(employee_scores.items(), key=lambda x: x[1], reverse=True)
-
-    print("\nTop employees (by summed similarity):\n")
-    for i, (name, score) in enumerate(ranked[:10], start=1):
-        evidence = employee_evidence[name][:3]  # show first 3
-        print(f"{i:>2}. score={score:.3f}  {name}  evidence={evidence}")
+    for p in result["papers"]:
+        score = f"  {mode}={p['score']:.4f}" if mode != "vector" else ""
+        print(f"{p['rank']:>2}. sim={p['sim']:.3f}{score}  doc_id={p['doc_id']}  file={p['filename']}")
+        if p["title"]:
+            print(f"    title: {p['title']}")
+        if p["authors"]:
+            print(f"    authors: {', '.join(p['authors'])}")
+        if p.get("passage"):
+            print(f"    p.{p['page']}: {p['passage'][:160]}...")
+
+    print("\nTop employees:\n")
+    for e in result["experts"]:
+        evidence = [{"doc_id": ev["doc_id"], "sim": ev["sim"]} for ev in e["evidence"][:3]]
+        print(f"{e['rank']:>2}. score={e['score']:.3f}  {e['name']}  evidence={evidence}")
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Find similar projects and rank experts.",
+        epilog="HNSW search_ef is stored with the collection: set it with "
+               "3_build_chroma_index.py --search-ef N (tune_hnsw.py to pick a value).",
+        usage='python 4_query.py "your project description" [top_k]\n'
+              '       python 4_query.py --batch queries.txt [--out results.jsonl] [--top-k 10]',
+    )
+    ap.add_argument("query", nargs="?")
+    ap.add_argument("top_k", nargs="?", type=int)
+    ap.add_argument("--top-k", dest="top_k_opt", type=int, default=10)
+    ap.add_argument("--batch", metavar="FILE",
+                    help='queries, one per line or JSONL {"id", "query"}; "-" for stdin')
+    ap.add_argument("--out", metavar="FILE", default="-", help="JSONL output for --batch (default stdout)")
+    ap.add_argument("--mode", choices=["vector", "lexical", "hybrid", "fulltext"], default="vector",
+                    help="paper retrieval: embeddings, BM25, both fused with reciprocal rank fusion, "
+                         "or full-text chunks (needs 3_build_chroma_index.py --fulltext)")
+    ap.add_argument("--experts", choices=["papers", "profiles"], default="papers",
+                    help="rank experts by matched papers, or by kNN over author profile vectors")
+    ap.add_argument("--recent", action="store_true",
+                    help="with --experts papers: weight each paper by recency (rank by recent activity)")
+    ap.add_argument("--author", action="append", default=[], metavar="NAME",
+                    help="only papers by this author (repeat for any of several)")
+    ap.add_argument("--category", action="append", default=[], metavar="CAT",
+                    help="only papers in this category (repeat for any of several)")
+    ap.add_argument("--year-from", type=int, metavar="YEAR", help="only papers from this year on")
+    ap.add_argument("--year-to", type=int, metavar="YEAR", help="only papers up to this year")
+    ap.add_argument("--no-server", action="store_true",
+                    help="always search in-process, even if query_server.py is running")
+    ap.add_argument("--backend", choices=["chroma", "exact"],
+                    help="vector store for in-process search (implies --no-server; default VECTOR_BACKEND)")
+    ap.add_argument("--rescore", type=int, metavar="N",
+                    help="quantized exact store: rescore k*N candidates at full precision (implies --no-server)")
+    args = ap.parse_args()
+
+    if not args.query and not args.batch:
+        ap.print_usage()
+        raise SystemExit(1)
+
+    top_k = args.top_k if args.top_k is not None else args.top_k_opt
+    authors = args.author
+    if authors:
+        from author_resolution import AuthorMap
+        amap = AuthorMap.load()     # index stores canonical names; accept any spelling of a known author
+        authors = [amap.lookup(a) for a in authors]
+    where = make_where(args.year_from, args.year_to, authors, args.category)
+
+    in_process = args.no_server or args.backend or args.rescore
+    searcher = get_searcher(use_server=not in_process, backend=args.backend)
+    extra = {"rescore": args.rescore} if args.rescore else {}   # in-process only
+
+    if not args.batch:
+        try:
+            result = searcher.search([args.query], top_k, experts_mode=args.experts, mode=args.mode,
+                                     where=where, recent=args.recent, **extra)[0]
+        except RuntimeError as e:   # an optional index is missing, e.g. chunks for --mode fulltext
+            raise SystemExit(f"Error: {e}")
+        print_result(result, args.mode)
+        return
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    n = 0
+    try:
+        for batch in batched(read_queries(args.batch), QUERY_BATCH):
+            try:
+                results = searcher.search([q for _, q in batch], top_k,
+                                          experts_mode=args.experts, mode=args.mode, where=where,
+                                          recent=args.recent, **extra)
+            except RuntimeError as e:
+                raise SystemExit(f"Error: {e}")
+            for (qid, _), result in zip(batch, results):
+                out.write(json.dumps({"id": qid, **result}, ensure_ascii=False) + "\n")
+            n += len(batch)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Answered {n} queries.", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -2,52 +2,40 @@
 """
 Streamlit web app for semantic paper search
 """
-import json
 import base64
 import os
 import streamlit as st
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from collections import defaultdict
 from pathlib import Path
 
-PERSIST_DIR = Path("out_main/chroma")
-COLLECTION_NAME = "projects"
+from expert_ranking import RECENCY_HALF_LIFE_YEARS
+from paper_search import COLLECTION_NAME, PaperSearcher
+from search_filters import make_where
+from vector_store import EXACT_RESCORE, VECTOR_BACKEND, store_paths
 
 # Detect if running locally or on Streamlit Cloud
 IS_LOCAL = not os.getenv("STREAMLIT_SHARING_MODE") and os.path.exists("data")
 
 @st.cache_resource
-def load_collection():
-    """Load ChromaDB collection (cached for performance)"""
+def load_searcher():
+    """Load model, vector store collection and author index (cached for performance)"""
+    index_dir = store_paths(VECTOR_BACKEND)[0]
     try:
-        if not PERSIST_DIR.exists():
-            st.error(f"ChromaDB directory not found: {PERSIST_DIR}")
+        if not index_dir.exists():
+            st.error(f"Index directory not found: {index_dir}")
             st.stop()
         
-        embed_fn = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-        client = chromadb.PersistentClient(path=str(PERSIST_DIR))
-        collection = client.get_collection(
-            name=COLLECTION_NAME,
-            embedding_function=embed_fn,
-        )
-        return collection
+        return PaperSearcher(COLLECTION_NAME, VECTOR_BACKEND)
     except Exception as e:
-        st.error(f"Error loading ChromaDB collection: {str(e)}")
-        st.error(f"Please ensure the ChromaDB index exists in {PERSIST_DIR}")
+        st.error(f"Error loading {VECTOR_BACKEND} collection: {str(e)}")
+        st.error(f"Please ensure the index exists in {index_dir}")
         st.stop()
 
-def search_papers(query_text: str, top_k: int = 10):
-    """Search for similar papers"""
-    collection = load_collection()
-    
-    res = collection.query(
-        query_texts=[query_text],
-        n_results=top_k,
-        include=["metadatas", "documents", "distances"],
-    )
-    
-    return res
+def search_papers(query_text: str, top_k: int = 10, experts_mode: str = "papers", mode: str = "vector",
+                  where=None, recent: bool = False, rescore=None):
+    """Search for similar papers and rank experts"""
+    searcher = load_searcher()   # shared by every session: settings go with the call, not on the searcher
+    return searcher.search([query_text], top_k, experts_mode=experts_mode, mode=mode, where=where,
+                           recent=recent, rescore=rescore)[0]
 
 def get_pdf_display_link(pdf_path: str):
     """Create HTML link to display PDF inline (local only)"""
@@ -80,6 +68,51 @@ def main():
     with st.sidebar:
         st.header("⚙️ Settings")
         top_k = st.slider("Number of results", min_value=1, max_value=20, value=10)
+        fp = load_searcher().footprint()
+        if fp:
+            st.caption(f"Index: {VECTOR_BACKEND} ({fp['quantization']}), {fp['rows']} papers, "
+                       f"{fp['scan_bytes'] / 1e6:.1f} MB scanned per query")
+        rescore = None
+        if fp and fp["quantization"] != "none":
+            rescore = st.slider(
+                "Rescore factor", min_value=1, max_value=16, value=EXACT_RESCORE,
+                help="Rescore top_k x N quantized candidates at full precision (higher: better recall, slower)",
+            )
+        mode = st.radio(
+            "Search mode",
+            options=["vector", "hybrid", "lexical", "fulltext"],
+            format_func={"vector": "Semantic", "hybrid": "Hybrid (semantic + keywords)",
+                         "lexical": "Keywords (BM25)", "fulltext": "Full text"}.get,
+            help="Hybrid merges semantic and exact-term results with reciprocal rank fusion",
+        )
+        experts_mode = st.radio(
+            "Find experts by",
+            options=["papers", "profiles"],
+            format_func=lambda m: "Matching papers" if m == "papers" else "Author profiles",
+            help="Author profiles: one nearest-neighbour search over per-author embeddings",
+        )
+        recent = st.checkbox(
+            "Rank experts by recent activity",
+            disabled=experts_mode != "papers",
+            help=f"Weight each matching paper by its age (half-life {RECENCY_HALF_LIFE_YEARS:g} years)",
+        )
+
+        st.markdown("### Filters")
+        facets = load_searcher().facets
+        year_from = year_to = None
+        if len(facets["years"]) == 2 and facets["years"][0] < facets["years"][1]:
+            lo, hi = facets["years"]
+            year_from, year_to = st.slider("Year", min_value=lo, max_value=hi, value=(lo, hi))
+            if (year_from, year_to) == (lo, hi):
+                year_from = year_to = None   # full range: no filter (keeps papers without a year)
+        authors = st.multiselect("Authors", options=list(facets["authors"]),
+                                 help="Papers by any of the selected authors")
+        categories = st.multiselect(
+            "Categories", options=list(facets["categories"]),
+            format_func=lambda c: f"{c} ({facets['categories'][c]})",
+            help="Papers in any of the selected categories",
+        )
+        where = make_where(year_from, year_to, authors, categories)
         
         st.markdown("---")
         st.markdown("### Example Queries")
@@ -103,68 +136,64 @@ def main():
     
     if query:
         with st.spinner("🔎 Searching..."):
-            res = search_papers(query, top_k)
-            
-            ids = res["ids"][0]
-            metas = res["metadatas"][0]
-            dists = res["distances"][0]
+            try:
+                res = search_papers(query, top_k, experts_mode, mode, where, recent and experts_mode == "papers",
+                                    rescore)
+            except RuntimeError as e:   # an optional index is missing, e.g. chunks for full-text mode
+                st.error(str(e))
+                return
+            papers = res["papers"]
             
-            if not ids:
+            if not papers:
                 st.warning("No results found. Try a different query.")
                 return
             
-            # Calculate employee scores
-            employee_scores = defaultdict(float)
-            employee_evidence = defaultdict(list)
-            
-            for doc_id, md, dist in zip(ids, metas, dists):
-                sim = 1.0 - float(dist)
-                authors = json.loads(md.get("authors_json", "[]"))
-                
-                for author in authors:
-                    employee_scores[author] += sim
-                    employee_evidence[author].append({
-                        "doc_id": doc_id,
-                        "title": md.get("title", ""),
-                        "sim": round(sim, 3)
-                    })
-            
             # Display results in tabs
             tab1, tab2 = st.tabs(["👥 Experts", "📄 Papers"])
             
             with tab1:
-                st.subheader("Top Experts by Cumulative Similarity")
-                
-                ranked = sorted(employee_scores.items(), key=lambda x: x[1], reverse=True)
+                if experts_mode == "profiles":
+                    st.subheader("Top Experts by Author Profile Similarity")
+                elif recent:
+                    st.subheader("Top Experts by Recent Activity")
+                else:
+                    st.subheader("Top Experts by Cumulative Similarity")
+                # profile scores are single cosine similarities, not sums
+                hi, mid = (0.4, 0.2) if experts_mode == "profiles" else (1.0, 0.5)
                 
-                for i, (name, score) in enumerate(ranked[:10], start=1):
-                    evidence = employee_evidence[name]
+                for expert in res["experts"]:
+                    i = expert["rank"]
+                    name = expert["name"]
+                    score = expert["score"]
+                    evidence = expert["evidence"]
                     
                     # Color-code by score
-                    if score > 1.0:
+                    if score > hi:
                         color = "🟢"
-                    elif score > 0.5:
+                    elif score > mid:
                         color = "🟡"
                     else:
                         color = "🔴"
                     
                     with st.expander(f"{color} **{i}. {name}** (score: {score:.3f})", expanded=(i <= 3)):
                         st.markdown(f"**Total Relevance Score:** {score:.3f}")
-                        st.markdown(f"**Number of Relevant Papers:** {len(evidence)}")
+                        st.markdown(f"**Number of Relevant Papers:** {expert['paper_count']}")
                         
                         st.markdown("**Top Papers:**")
                         for j, ev in enumerate(evidence[:5], 1):
                             st.markdown(f"{j}. {ev['title']} (sim: {ev['sim']:.3f})")
             
             with tab2:
-                st.subheader(f"Top {len(ids)} Similar Papers")
+                st.subheader(f"Top {len(papers)} Similar Papers")
                 
-                for rank, (doc_id, md, dist) in enumerate(zip(ids, metas, dists), start=1):
-                    sim = 1.0 - float(dist)
-                    title = md.get("title", "Untitled")
-                    filename = md.get("filename", "")
-                    authors = json.loads(md.get("authors_json", "[]"))
-                    year = md.get("year", "")
+                for paper in papers:
+                    rank = paper["rank"]
+                    doc_id = paper["doc_id"]
+                    sim = paper["sim"]
+                    title = paper["title"] or "Untitled"
+                    filename = paper["filename"]
+                    authors = paper["authors"]
+                    year = paper["year"]
                     
                     # Color-code by similarity
                     if sim > 0.4:
@@ -183,13 +212,15 @@ def main():
                             if year:
                                 st.markdown(f"**Year:** {year}")
                             st.markdown(f"**File:** `{filename}`")
+                            if paper.get("passage"):
+                                st.markdown(f"**Best passage (p. {paper['page']}):** {paper['passage']}")
                         
                         with col2:
                             st.metric("Similarity", f"{sim:.1%}")
                         
                         # PDF viewing options (local only)
                         if IS_LOCAL:
-                            pdf_path = md.get("path", "")
+                            pdf_path = paper["path"]
                             if pdf_path and Path(pdf_path).exists():
                                 col_btn1, col_btn2 = st.columns(2)
                                 
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Author name resolution: one canonical name (and author id) per person.
+
+The LLM returns authors as free text, so one person shows up as
+"A.J. Roberts", "A. J. Roberts", "Roberts, A. J." or "Andrew J. Roberts".
+This stage groups such variants and writes out_main/author_map.json
+(raw name -> canonical name, canonical name -> author id), which
+2_skill_extractor.py (profiles) and 3_build_chroma_index.py (authors_json,
+author:<name> filter fields, expert index) apply before using any author.
+
+Names are reduced to a key: lower-case tokens without accents, surname last,
+initials split ("AJ" / "A.J." -> "a", "j"). Only keys in the same block
+(surname + first initial) are ever compared, so the number of comparisons
+follows the block sizes, not the square of the number of names. Within a
+block two keys match when their given names agree token by token (an initial
+matches any name with that letter; a shorter list matches a longer one), and
+matches are merged with union-find. A key that matches two keys that
+disagree with each other ("A. Roberts" vs "Andrew Roberts" and "Alice
+Roberts") is ambiguous and left alone, and two groups are only merged when
+every key in one matches every key in the other, so merges never chain
+across different people.
+
+The canonical name of a group is its most frequent variant (then the
+longest, then the first alphabetically), so results are deterministic.
+
+The map is grown incrementally: names already in it keep their canonical
+name, so ids and profiles stay stable. Unseen names are grouped among
+themselves the same way, then each group joins the one existing person in
+its block that all of its keys match. A group that matches nobody, or more
+than one person, becomes a person of its own. --rebuild regroups every name.
+
+Usage:
+  python author_resolution.py            # add unseen corpus names to the map, list merged groups
+  python author_resolution.py --rebuild  # regroup every name from scratch
+"""
+import re
+import json
+import unicodedata
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from corpus_store import CORPUS_PATH, open_corpus
+from expert_ranking import author_id
+
+AUTHOR_MAP_PATH = Path("out_main/author_map.json")
+IN_DIR = Path("out_main/json")     # fallback when there is no corpus store (CORPUS_PATH)
+
+_SUFFIXES = {"jr", "sr", "ii", "iii", "iv"}
+_TOKEN = re.compile(r"[^\W\d_]+")
+
+NameKey = Tuple[str, ...]
+
+
+def _fold(text: str) -> str:
+    """Strip accents ("Kwaśniewski" -> "Kwasniewski"); other letters are kept."""
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def _given(tokens: Iterable[str]) -> List[str]:
+    out = []
+    for tok in tokens:
+        # "AJ" (all caps, no dots) is two initials, not a first name
+        if 1 < len(tok) <= 3 and tok.isupper():
+            out.extend(tok.lower())
+        else:
+            out.append(tok.lower())
+    return out
+
+
+def name_key(name: str) -> NameKey:
+    """Normalized tokens, given names first and surname last ("Roberts, A.J." -> a, j, roberts)."""
+    if "," in name:
+        surname, given = name.split(",", 1)
+        given_toks, surname_toks = _TOKEN.findall(_fold(given)), _TOKEN.findall(_fold(surname))
+    else:
+        toks = [t for t in _TOKEN.findall(_fold(name)) if t.lower() not in _SUFFIXES]
+        given_toks, surname_toks = toks[:-1], toks[-1:]
+    key = _given(given_toks) + [t.lower() for t in surname_toks]
+    return tuple(t for t in key if t not in _SUFFIXES)
+
+
+def block_key(key: NameKey) -> Optional[Tuple[str, str]]:
+    """(surname, first initial); None for single-token names, which are never merged."""
+    if len(key) < 2:
+        return None
+    return key[-1], key[0][0]
+
+
+def compatible(a: NameKey, b: NameKey) -> bool:
+    """Same surname and given names that agree token by token (initials match any same-letter name)."""
+    if a[-1] != b[-1]:
+        return False
+    for x, y in zip(a[:-1], b[:-1]):
+        if len(x) == 1 or len(y) == 1:
+            if x[0] != y[0]:
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+class _UnionFind:
+    def __init__(self, items: Sequence):
+        self.parent = {x: x for x in items}
+        self.members = {x: [x] for x in items}
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if len(self.members[ra]) < len(self.members[rb]):
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.members[ra].extend(self.members.pop(rb))
+
+
+def resolve_names(name_counts: Dict[str, int]) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Group raw names into people. Returns ({raw name: canonical name}, stats)
+    where stats counts names, keys, blocks and pairwise comparisons made.
+    """
+    variants: Dict[NameKey, List[str]] = defaultdict(list)
+    for name in sorted(name_counts):
+        if name.strip():
+            variants[name_key(name) or (name.strip(),)].append(name)
+
+    blocks: Dict[Tuple[str, str], List[NameKey]] = defaultdict(list)
+    for key in sorted(variants):
+        block = block_key(key)
+        if block is not None:
+            blocks[block].append(key)
+
+    uf = _UnionFind(list(variants))
+    comparisons = 0
+    for keys in blocks.values():
+        if len(keys) < 2:
+            continue
+        matches = {k: set() for k in keys}
+        for i, a in enumerate(keys):
+            for b in keys[i + 1:]:
+                comparisons += 1
+                if compatible(a, b):
+                    matches[a].add(b)
+                    matches[b].add(a)
+        ambiguous = {
+            k for k, ms in matches.items()
+            if any(not compatible(x, y) for x in ms for y in ms if x < y)
+        }
+        for a in keys:
+            if a in ambiguous:
+                continue
+            for b in sorted(matches[a]):
+                if b in ambiguous:
+                    continue
+                ra, rb = uf.find(a), uf.find(b)
+                if ra != rb and all(compatible(x, y) for x in uf.members[ra] for y in uf.members[rb]):
+                    uf.union(a, b)
+
+    mapping: Dict[str, str] = {}
+    groups = 0
+    for root, keys in uf.members.items():
+        names = [n for k in keys for n in variants[k]]
+        canonical = min(names, key=lambda n: (-name_counts[n], -len(n), n))
+        groups += 1
+        for n in names:
+            mapping[n] = canonical
+    stats = {
+        "names": len(mapping),
+        "keys": len(variants),
+        "blocks": len(blocks),
+        "people": groups,
+        "comparisons": comparisons,
+    }
+    return mapping, stats
+
+
+class AuthorMap:
+    """Raw author name -> canonical name / author id (unknown names map to themselves)."""
+
+    def __init__(self, names: Optional[Dict[str, str]] = None):
+        self.names = dict(names or {})
+
+    def canonical(self, name: str) -> str:
+        return self.names.get(name, name.strip())
+
+    def lookup(self, name: str) -> str:
+        """
+        Canonical name for a name typed by a user: an exact variant, else the
+        person whose variants share its key ("j. smith" -> "J. Smith", "Jose"
+        -> "José"), else the one person in its block it is compatible with.
+        """
+        if name in self.names:
+            return self.names[name]
+        key = name_key(name)
+        if not key:
+            return name.strip()
+        same: set = set()
+        near: set = set()
+        block = block_key(key)
+        for raw, canonical in self.names.items():
+            other = name_key(raw)
+            if other == key:
+                same.add(canonical)
+            elif block is not None and block_key(other) == block and compatible(key, other):
+                near.add(canonical)
+        for found in (same, near):
+            if len(found) == 1:
+                return found.pop()
+        return name.strip()
+
+    def resolve(self, names: Iterable) -> List[str]:
+        """Canonical names in first-seen order, without duplicates or empty names."""
+        out = (self.canonical(str(n)) for n in names or [])
+        return list(dict.fromkeys(n for n in out if n))
+
+    def author_id(self, name: str) -> str:
+        return author_id(self.canonical(name))
+
+    def is_known(self, name: str) -> bool:
+        """False for names extend() would still have to place."""
+        return name in self.names or not name.strip()
+
+    def extend(self, name_counts: Dict[str, int]) -> Dict[str, int]:
+        """
+        Place unseen names without changing any existing assignment. Only the
+        blocks of the new names are looked at. Returns counts of names added
+        and of those that joined an existing person.
+        """
+        new = {n: c for n, c in name_counts.items() if not self.is_known(n)}
+        stats = {"new": len(new), "joined": 0}
+        if not new:
+            return stats
+        mapping, _ = resolve_names(new)
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for raw, canonical in sorted(mapping.items()):
+            groups[canonical].append(raw)
+
+        wanted = {block_key(name_key(n)) for n in new} - {None}
+        # block -> canonical name -> keys of its variants
+        people: Dict[Tuple[str, str], Dict[str, List[NameKey]]] = defaultdict(lambda: defaultdict(list))
+        for raw, canonical in self.names.items():
+            key = name_key(raw)
+            block = block_key(key)
+            if block in wanted:
+                people[block][canonical].append(key)
+
+        for canonical, raws in sorted(groups.items()):
+            keys = [name_key(r) for r in raws]
+            block = block_key(keys[0]) if keys[0] else None
+            target = canonical
+            if block is not None:
+                matches = [
+                    c for c, members in people[block].items()
+                    if all(compatible(k, m) for k in keys for m in members)
+                ]
+                if len(matches) == 1:
+                    target = matches[0]
+                    stats["joined"] += len(raws)
+                people[block][target].extend(keys)
+            for raw in raws:
+                self.names[raw] = target
+        return stats
+
+    def groups(self) -> Dict[str, List[str]]:
+        """Canonical name -> all raw variants."""
+        out: Dict[str, List[str]] = defaultdict(list)
+        for raw, canonical in sorted(self.names.items()):
+            out[canonical].append(raw)
+        return dict(out)
+
+    def save(self, path: Path = AUTHOR_MAP_PATH) -> None:
+        canonical = sorted(set(self.names.values()))
+        data = {
+            "names": dict(sorted(self.names.items())),
+            "ids": {n: author_id(n) for n in canonical},
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = AUTHOR_MAP_PATH) -> "AuthorMap":
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as f:
+            return cls(json.load(f)["names"])
+
+
+def build_author_map(corpus, path: Path = AUTHOR_MAP_PATH, rebuild: bool = False) -> Tuple[AuthorMap, Dict[str, int]]:
+    """
+    Add every unseen author name in the corpus to the saved map (or, with
+    rebuild or no saved map, resolve all names from scratch) and save it.
+    Returns (map, stats); stats always has "names" and "people".
+    """
+    amap = None if rebuild else AuthorMap.load(path) if path.exists() else None
+    counts: Dict[str, int] = defaultdict(int)
+    for (authors,) in corpus.iter_columns("authors"):
+        for name in set(authors):
+            if amap is None or not amap.is_known(name):
+                counts[name] += 1
+    if amap is None:
+        mapping, stats = resolve_names(counts)
+        amap = AuthorMap(mapping)
+        amap.save(path)
+        return amap, stats
+    stats = amap.extend(counts)
+    if stats["new"]:
+        amap.save(path)
+    stats.update(names=len(amap.names), people=len(set(amap.names.values())))
+    return amap, stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=f"Resolve author name variants into {AUTHOR_MAP_PATH}.")
+    ap.add_argument("--rebuild", action="store_true", help="regroup every name instead of adding unseen ones")
+    args = ap.parse_args()
+
+    corpus = open_corpus(CORPUS_PATH, IN_DIR)
+    if corpus is None:
+        raise SystemExit(f"Missing input: neither {CORPUS_PATH} nor {IN_DIR} exists")
+    amap, stats = build_author_map(corpus, rebuild=args.rebuild)
+    n = stats["names"]
+    if "comparisons" in stats:
+        print(f"{n} author names -> {stats['people']} people in {stats['blocks']} blocks; "
+              f"{stats['comparisons']} comparisons (all pairs: {n * (n - 1) // 2}) -> {AUTHOR_MAP_PATH}")
+    else:
+        print(f"{n} author names -> {stats['people']} people ({stats['new']} new, "
+              f"{stats['joined']} joined an existing person) -> {AUTHOR_MAP_PATH}")
+    for canonical, raws in amap.groups().items():
+        if len(raws) > 1:
+            print(f"  {canonical}: " + ", ".join(r for r in raws if r != canonical))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+BM25 inverted index for lexical retrieval, plus reciprocal rank fusion.
+
+Built by 3_build_chroma_index.py from the same text that is embedded
+(make_embedding_text: title, abstract, keywords, categories) and saved as one
+.npz: a sorted term list and CSR postings (term row -> doc ids, term
+frequencies). The per-posting BM25 weight is precomputed on load, so a query
+is a handful of vector adds over the postings of its terms plus one
+argpartition, which takes milliseconds.
+
+Used by paper_search.py for the "lexical" and "hybrid" retrieval modes.
+
+Usage:
+  python bm25_index.py "Clifford algebras"     # query the saved index
+"""
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BM25_INDEX_PATH = Path("out_main/bm25_index.npz")
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60      # reciprocal rank fusion constant
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in is it its of on or that the
+    this to was we were which with
+    title abstract keywords categories
+""".split())   # last line: field labels added by make_embedding_text
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, doc_ids, terms, indptr, postings, tfs, doc_len, k1: float = BM25_K1, b: float = BM25_B):
+        self.doc_ids = np.asarray(doc_ids, dtype=str)
+        self.terms = np.asarray(terms, dtype=str)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.postings = np.asarray(postings, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.float32)
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.term_pos: Dict[str, int] = {t: i for i, t in enumerate(self.terms.tolist())}
+
+        n = self.doc_ids.size
+        df = np.diff(self.indptr).astype(np.float64)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(self.doc_len.mean()) if n else 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / max(avgdl, 1e-9))
+        self.weights = self.tfs * (self.k1 + 1.0) / (self.tfs + norm[self.postings])
+
+    def __len__(self) -> int:
+        return int(self.doc_ids.size)
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str]], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """docs: (doc_id, text) per document."""
+        doc_ids: List[str] = []
+        doc_len: List[int] = []
+        term_docs: Dict[str, List[int]] = defaultdict(list)
+        term_tfs: Dict[str, List[int]] = defaultdict(list)
+        for doc_id, text in docs:
+            tokens = tokenize(text)
+            d = len(doc_ids)
+            doc_ids.append(doc_id)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_docs[term].append(d)
+                term_tfs[term].append(tf)
+
+        terms = sorted(term_docs)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(term_docs[t]) for t in terms])
+        postings = np.fromiter((d for t in terms for d in term_docs[t]), dtype=np.int32, count=int(indptr[-1]))
+        tfs = np.fromiter((tf for t in terms for tf in term_tfs[t]), dtype=np.float32, count=int(indptr[-1]))
+        return cls(doc_ids, terms, indptr, postings, tfs, doc_len, k1, b)
+
+    def save(self, path: Path = BM25_INDEX_PATH) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp,
+            doc_ids=self.doc_ids,
+            terms=self.terms,
+            indptr=self.indptr,
+            postings=self.postings,
+            tfs=np.minimum(self.tfs, 65535).astype(np.uint16),
+            doc_len=self.doc_len.astype(np.uint32),
+            params=np.array([self.k1, self.b]),
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = BM25_INDEX_PATH):
+        if not Path(path).exists():
+            return None
+        with np.load(path) as z:
+            k1, b = z["params"].tolist()
+            return cls(z["doc_ids"], z["terms"], z["indptr"], z["postings"], z["tfs"], z["doc_len"], k1, b)
+
+    def mask(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """Boolean mask over the index's docs, True for the given ids (see search's allowed)."""
+        return np.isin(self.doc_ids, np.asarray(list(doc_ids), dtype=str))
+
+    def search(self, query: str, top_k: int = 10, allowed: Optional[np.ndarray] = None) -> Tuple[List[str], np.ndarray]:
+        """
+        (doc_ids, scores) of the best top_k docs with any query term, best
+        first. allowed (see mask) restricts the ranking to a filtered subset.
+        """
+        rows = [self.term_pos[t] for t in dict.fromkeys(tokenize(query)) if t in self.term_pos]
+        if not rows or top_k <= 0:
+            return [], np.zeros(0, dtype=np.float32)
+
+        scores = np.zeros(self.doc_ids.size, dtype=np.float32)
+        for r in rows:
+            s, e = self.indptr[r], self.indptr[r + 1]
+            scores[self.postings[s:e]] += self.idf[r] * self.weights[s:e]   # doc ids unique per term
+        if allowed is not None:
+            scores *= allowed
+
+        hits = np.flatnonzero(scores)
+        if hits.size > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return self.doc_ids[hits].tolist(), scores[hits]
+
+
+def rrf_merge(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion: score(d) = sum over rankings of 1 / (k + rank)."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
+
+
+if __name__ == "__main__":
+    index = BM25Index.load()
+    if index is None:
+        raise SystemExit(f"No index at {BM25_INDEX_PATH}; run 3_build_chroma_index.py")
+    query = " ".join(sys.argv[1:])
+    t0 = time.perf_counter()
+    ids, scores = index.search(query, 10)
+    ms = (time.perf_counter() - t0) * 1000
+    for rank, (doc_id, score) in enumerate(zip(ids, scores), start=1):
+        print(f"{rank:>2}. bm25={score:.3f}  doc_id={doc_id}")
+    print(f"{len(index)} docs, {len(index.terms)} terms, {ms:.2f} ms")
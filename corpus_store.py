@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Single-file corpus store for extracted paper metadata.
+
+1_initial_script.py appends every extracted paper to one SQLite file instead
+of writing one JSON file per paper; 2_skill_extractor.py and
+3_build_chroma_index.py read it back without touching the filesystem once per
+paper. Layout:
+
+  papers          seq (append order), id, flat columns (filename, path,
+                  modified_time, title, year, authors/keywords/categories
+                  as JSON), config_hash and the full record as JSON
+  paper_authors   (id, pos, name)      indexed by name and id
+  paper_keywords  (id, kind, term)     kind "keyword" or "category",
+                                       indexed by (kind, term) and id
+
+so "all authors" / "all keywords" are scans of one narrow indexed table,
+a paper is a primary-key lookup, and narrow column scans (iter_columns)
+never parse the full records. Re-extracting a paper replaces its row
+(appended with a new seq); nothing else is rewritten.
+
+Readers go through open_corpus(), which falls back to the per-paper JSON
+files (out_main/json) when no corpus file exists yet.
+
+Usage:
+  python corpus_store.py import [out_main/json] [--db out_main/corpus.sqlite]
+  python corpus_store.py stats  [--db out_main/corpus.sqlite]
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CORPUS_PATH = Path("out_main/corpus.sqlite")
+JSON_DIR = Path("out_main/json")
+SCAN_BATCH = 2000   # rows fetched per round trip when iterating
+
+COLUMNS = ("id", "filename", "path", "modified_time", "title", "year",
+           "authors", "keywords", "categories", "config_hash")
+
+
+def paper_columns(merged: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat column values of one merged record (as written by 1_initial_script.py)."""
+    front = merged.get("front") or {}
+    fileinfo = merged.get("file") or {}
+    year = front.get("year")
+    return {
+        "id": merged["id"],
+        "filename": fileinfo.get("filename") or "",
+        "path": fileinfo.get("path") or "",
+        "modified_time": fileinfo.get("modified_time") or "",
+        "title": front.get("title") or "",
+        "year": year if isinstance(year, int) else None,
+        "authors": [str(a) for a in front.get("authors") or []],
+        "keywords": [str(k) for k in front.get("keywords") or []],
+        "categories": [str(c) for c in front.get("categories") or []],
+        "config_hash": (merged.get("extraction") or {}).get("config_hash"),
+    }
+
+
+class CorpusStore:
+    """SQLite corpus: append/replace by paper id, point lookups and column scans."""
+
+    def __init__(self, path: Path = CORPUS_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                seq           INTEGER PRIMARY KEY AUTOINCREMENT,
+                id            TEXT UNIQUE NOT NULL,
+                filename      TEXT,
+                path          TEXT,
+                modified_time TEXT,
+                title         TEXT,
+                year          INTEGER,
+                authors       TEXT,
+                keywords      TEXT,
+                categories    TEXT,
+                config_hash   TEXT,
+                doc           TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS paper_authors (id TEXT NOT NULL, pos INTEGER NOT NULL, name TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS paper_authors_name ON paper_authors (name);
+            CREATE INDEX IF NOT EXISTS paper_authors_id ON paper_authors (id);
+            CREATE TABLE IF NOT EXISTS paper_keywords (id TEXT NOT NULL, kind TEXT NOT NULL, term TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS paper_keywords_term ON paper_keywords (kind, term);
+            CREATE INDEX IF NOT EXISTS paper_keywords_id ON paper_keywords (id);
+            """
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # ---- writing ----
+
+    def _put(self, merged: Dict[str, Any]) -> None:
+        cols = paper_columns(merged)
+        pid = cols["id"]
+        self._conn.execute("DELETE FROM paper_authors WHERE id = ?", (pid,))
+        self._conn.execute("DELETE FROM paper_keywords WHERE id = ?", (pid,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO papers (id, filename, path, modified_time, title, year, authors, keywords,"
+            " categories, config_hash, doc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                pid, cols["filename"], cols["path"], cols["modified_time"], cols["title"], cols["year"],
+                json.dumps(cols["authors"], ensure_ascii=False),
+                json.dumps(cols["keywords"], ensure_ascii=False),
+                json.dumps(cols["categories"], ensure_ascii=False),
+                cols["config_hash"],
+                json.dumps(merged, ensure_ascii=False),
+            ),
+        )
+        self._conn.executemany(
+            "INSERT INTO paper_authors (id, pos, name) VALUES (?, ?, ?)",
+            [(pid, i, name) for i, name in enumerate(cols["authors"])],
+        )
+        self._conn.executemany(
+            "INSERT INTO paper_keywords (id, kind, term) VALUES (?, ?, ?)",
+            [(pid, "keyword", t) for t in cols["keywords"]] + [(pid, "category", t) for t in cols["categories"]],
+        )
+
+    def put(self, merged: Dict[str, Any]) -> None:
+        """Add or replace one paper (committed immediately)."""
+        with self._conn:
+            self._put(merged)
+
+    def put_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Add or replace many papers in one transaction."""
+        n = 0
+        with self._conn:
+            for merged in records:
+                self._put(merged)
+                n += 1
+        return n
+
+    def delete(self, paper_id: str) -> None:
+        """Drop one paper (e.g. when it turns out to be a version of another)."""
+        with self._conn:
+            self._conn.execute("DELETE FROM paper_authors WHERE id = ?", (paper_id,))
+            self._conn.execute("DELETE FROM paper_keywords WHERE id = ?", (paper_id,))
+            self._conn.execute("DELETE FROM papers WHERE id = ?", (paper_id,))
+
+    # ---- reading ----
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def __contains__(self, paper_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM papers WHERE id = ?", (paper_id,)).fetchone() is not None
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT doc FROM papers WHERE id = ?", (paper_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def ids(self) -> List[str]:
+        return [pid for (pid,) in self._conn.execute("SELECT id FROM papers ORDER BY id")]
+
+    def _scan(self, sql: str, params: Tuple = ()) -> Iterator[tuple]:
+        cur = self._conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(SCAN_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+    def iter_papers(self, start_after: str = "") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(key, full record) in key order; the key is the paper id."""
+        for pid, doc in self._scan("SELECT id, doc FROM papers WHERE id > ? ORDER BY id", (start_after,)):
+            yield pid, json.loads(doc)
+
+    def iter_columns(self, *columns: str) -> Iterator[tuple]:
+        """Tuples of the named COLUMNS, in id order, without parsing full records."""
+        for c in columns:
+            if c not in COLUMNS:
+                raise ValueError(f"unknown column: {c} (expected one of {COLUMNS})")
+        for row in self._scan(f"SELECT {', '.join(columns)} FROM papers ORDER BY id"):
+            yield tuple(json.loads(v) if c in ("authors", "keywords", "categories") else v
+                        for c, v in zip(columns, row))
+
+    def author_counts(self) -> Dict[str, int]:
+        """Every author name -> number of papers."""
+        return dict(self._conn.execute("SELECT name, COUNT(DISTINCT id) FROM paper_authors GROUP BY name"))
+
+    def term_counts(self, kind: str = "keyword") -> Dict[str, int]:
+        """Every keyword (or category) -> number of papers."""
+        return dict(self._conn.execute(
+            "SELECT term, COUNT(DISTINCT id) FROM paper_keywords WHERE kind = ? GROUP BY term", (kind,)
+        ))
+
+    def papers_by_author(self, name: str) -> List[str]:
+        return [pid for (pid,) in self._conn.execute(
+            "SELECT DISTINCT id FROM paper_authors WHERE name = ? ORDER BY id", (name,)
+        )]
+
+
+class JsonCorpus:
+    """Read-only fallback over one JSON file per paper (the pre-corpus layout)."""
+
+    def __init__(self, json_dir: Path = JSON_DIR):
+        self.dir = Path(json_dir)
+
+    def _names(self) -> List[str]:
+        return sorted(e.name for e in os.scandir(self.dir) if e.name.endswith(".json"))
+
+    def __len__(self) -> int:
+        return len(self._names())
+
+    def __contains__(self, paper_id: str) -> bool:
+        return (self.dir / f"{paper_id}.json").exists()
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with (self.dir / f"{paper_id}.json").open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def ids(self) -> List[str]:
+        return [pid for pid, _ in self.iter_papers()]
+
+    def iter_papers(self, start_after: str = "") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(key, full record) in key order; the key is the file name."""
+        for name in self._names():
+            if name <= start_after:
+                continue
+            with (self.dir / name).open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("id"):
+                yield name, data
+
+    def iter_columns(self, *columns: str) -> Iterator[tuple]:
+        for _, data in self.iter_papers():
+            cols = paper_columns(data)
+            yield tuple(cols[c] for c in columns)
+
+
+def open_corpus(path: Path = CORPUS_PATH, json_dir: Path = JSON_DIR):
+    """The corpus store if it exists, else the per-paper JSON files (None if neither)."""
+    if Path(path).exists():
+        return CorpusStore(path)
+    if Path(json_dir).is_dir():
+        return JsonCorpus(json_dir)
+    return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Corpus store tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ic = sub.add_parser("import", help="load per-paper JSON files into the corpus store")
+    ic.add_argument("json_dir", nargs="?", default=str(JSON_DIR))
+    sc = sub.add_parser("stats", help="row counts and a timed full column scan")
+    for p in (ic, sc):
+        p.add_argument("--db", default=str(CORPUS_PATH))
+    args = ap.parse_args()
+
+    store = CorpusStore(Path(args.db))
+    if args.cmd == "import":
+        t0 = time.perf_counter()
+        n = store.put_many(data for _, data in JsonCorpus(Path(args.json_dir)).iter_papers())
+        print(f"Imported {n} papers from {args.json_dir} into {args.db} in {time.perf_counter() - t0:.1f}s")
+        return
+
+    t0 = time.perf_counter()
+    authors = store.author_counts()
+    keywords = store.term_counts("keyword")
+    t_terms = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    n = sum(1 for _ in store.iter_columns("id", "authors", "keywords", "categories"))
+    t_scan = time.perf_counter() - t0
+    print(f"{args.db}: {n} papers, {len(authors)} authors, {len(keywords)} keywords, "
+          f"{len(store.term_counts('category'))} categories")
+    print(f"  author/keyword counts {t_terms * 1000:.1f} ms; column scan {t_scan * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
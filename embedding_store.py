@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Shared on-disk embedding cache for the indexer and the query paths.
+
+Vectors are keyed by (model name, SHA-1 of the text) and stored in an
+append-only matrix that is memory-mapped for reads, so known text is never
+re-encoded: rebuilding the index, swapping vector backends or re-running a
+benchmark only pays for text the model has not seen yet.
+
+Layout (one directory per model):
+  out_main/embeddings/<model>/meta.json     {"model", "dim", "dtype"}
+  out_main/embeddings/<model>/keys.txt      text hash per line; line i = row i
+  out_main/embeddings/<model>/vectors.bin   row-major float32/float16 matrix
+
+Writers append vectors first and keys last under a file lock, so a crash can
+only leave unreferenced bytes at the end of vectors.bin (trimmed on the next
+append). Several processes can share one store.
+
+Usage:
+  python embedding_store.py        # print store stats
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+try:
+    from chromadb import EmbeddingFunction as _ChromaEmbeddingFunction
+except ImportError:
+    _ChromaEmbeddingFunction = object
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+STORE_ROOT = Path("out_main/embeddings")
+STORE_DTYPE = "float32"     # "float16" halves disk and page cache
+ENCODE_BATCH = 64
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, model_name: str = EMBED_MODEL, root: Path = STORE_ROOT, dtype: str = STORE_DTYPE):
+        self.model_name = model_name
+        self.dir = Path(root) / model_name.replace("/", "__")
+        self.meta_path = self.dir / "meta.json"
+        self.keys_path = self.dir / "keys.txt"
+        self.vectors_path = self.dir / "vectors.bin"
+        self.lock_path = self.dir / ".lock"
+
+        self.dim: Optional[int] = None
+        self.dtype = np.dtype(dtype)
+        if self.meta_path.exists():
+            with self.meta_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+
+        self.rows: Dict[str, int] = {}
+        self._keys_offset = 0               # bytes of keys.txt already loaded
+        self._matrix: Optional[np.ndarray] = None
+        self._model = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._refresh()
+
+    # ---- reading ----
+
+    def _refresh(self) -> None:
+        """Pick up rows appended since the last look (possibly by another process)."""
+        if not self.keys_path.exists():
+            return
+        with self.keys_path.open("rb") as f:
+            f.seek(self._keys_offset)
+            chunk = f.read()
+        # ignore a trailing partial line from a writer that is mid-append
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            self.rows.setdefault(line.decode("ascii"), len(self.rows))
+        self._keys_offset += end
+
+    def matrix(self) -> np.ndarray:
+        """All stored vectors as a read-only memory map (rows follow keys.txt)."""
+        n = len(self.rows)
+        if self._matrix is None or self._matrix.shape[0] != n:
+            if n == 0 or self.dim is None:
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def row_of(self, text: str) -> Optional[int]:
+        return self.rows.get(text_key(text))
+
+    # ---- encoding ----
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """float32 (len(texts), dim) embeddings; only unseen texts go through the model."""
+        texts = list(texts)
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            self._refresh()
+            missing = list(dict.fromkeys(k for k in keys if k not in self.rows))
+            self.misses += len(missing)
+            self.hits += len(set(keys)) - len(missing)
+
+            if missing:
+                first = {k: t for k, t in zip(keys, texts)}
+                vecs = self.model.encode(
+                    [first[k] for k in missing],
+                    batch_size=ENCODE_BATCH,
+                    convert_to_numpy=True,
+                ).astype(np.float32)
+                try:
+                    self._append(missing, vecs)
+                except OSError:
+                    # read-only deployment: serve freshly encoded vectors without caching
+                    fresh = dict(zip(missing, vecs))
+                    mat = self.matrix()
+                    return np.stack([
+                        fresh[k] if k in fresh else np.asarray(mat[self.rows[k]], dtype=np.float32)
+                        for k in keys
+                    ])
+
+            mat = self.matrix()
+            idx = np.fromiter((self.rows[k] for k in keys), dtype=np.int64, count=len(keys))
+            return np.asarray(mat[idx], dtype=np.float32)
+
+    def encode_uncached(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode without reading or growing the store, for write-once bulk text (full-text chunks)."""
+        return self.model.encode(list(texts), batch_size=ENCODE_BATCH, convert_to_numpy=True).astype(np.float32)
+
+    def _append(self, keys: List[str], vecs: np.ndarray) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            with self.meta_path.open("w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+
+        with self.lock_path.open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                new = [(k, v) for k, v in zip(keys, vecs) if k not in self.rows]
+                if not new:
+                    return
+                row_bytes = self.dim * self.dtype.itemsize
+                with self.vectors_path.open("ab") as f:
+                    f.truncate(len(self.rows) * row_bytes)   # drop bytes of a torn append
+                    f.write(np.stack([v for _, v in new]).astype(self.dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with self.keys_path.open("ab") as f:
+                    f.write("".join(k + "\n" for k, _ in new).encode("ascii"))
+                self._refresh()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, object]:
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        return {
+            "model": self.model_name,
+            "rows": len(self.rows),
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CachedEmbeddingFunction(_ChromaEmbeddingFunction):
+    """
+    Chroma embedding function backed by an EmbeddingStore.
+
+    Vectors are the same as Chroma's own sentence-transformer function, so it
+    reports that name/config: newer Chroma versions persist the embedding
+    function per collection and refuse to open a collection with a different one.
+    """
+
+    def __init__(self, store: Optional[EmbeddingStore] = None):
+        self.store = store or EmbeddingStore()
+
+    def __call__(self, input):
+        return self.store.encode(list(input)).tolist()
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def get_config(self) -> Dict[str, object]:
+        return {
+            "model_name": self.store.model_name,
+            "device": "cpu",
+            "normalize_embeddings": False,
+            "kwargs": {},
+        }
+
+    @staticmethod
+    def build_from_config(config: Dict[str, object]) -> "CachedEmbeddingFunction":
+        return CachedEmbeddingFunction(EmbeddingStore(str(config.get("model_name") or EMBED_MODEL)))
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def supported_spaces(self) -> List[str]:
+        return ["cosine", "l2", "ip"]
+
+
+if __name__ == "__main__":
+    print(json.dumps(EmbeddingStore().stats(), indent=2))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Author <-> paper index and vectorized expert ranking.
+
+The index is a sparse author x paper incidence matrix stored in CSR form by
+paper (paper row -> author columns), built once at index time by
+3_build_chroma_index.py. Ranking a query is then a gather over the edges of
+the candidate papers plus one bincount, with the evidence lists coming out
+of the same pass, so it stays fast with hundreds of thousands of edges and
+is not limited to the papers shown on screen.
+
+Used by paper_search.py (4_query.py, query_server.py, app.py).
+"""
+import json
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from search_filters import parse_year
+
+AUTHOR_INDEX_PATH = Path("out_main/author_index.npz")
+EXPERT_CANDIDATES = 200   # papers retrieved for expert ranking, independent of top_k
+RECENCY_HALF_LIFE_YEARS = 5.0
+
+
+def activity_year(year, modified_time="") -> int:
+    """Paper year, else the year of the file's modified time; 0 when neither is known."""
+    return parse_year(year) or parse_year(modified_time) or 0
+
+
+def recency_weights(years, ref_year: int, half_life: float = RECENCY_HALF_LIFE_YEARS) -> np.ndarray:
+    """0.5 ** (age / half_life) per year (future years count as age 0); unknown years (0) weigh 1."""
+    years = np.asarray(years, dtype=np.float64)
+    age = np.clip(ref_year - years, 0, None)
+    return np.where(years > 0, 0.5 ** (age / half_life), 1.0)
+
+
+class AuthorIndex:
+    def __init__(self, paper_ids, titles, authors, indptr, indices, years=None):
+        self.paper_ids = np.asarray(paper_ids, dtype=str)
+        self.titles = np.asarray(titles, dtype=str)
+        # activity year per paper (activity_year), 0 = unknown
+        self.years = np.zeros(len(self.paper_ids), dtype=np.int32) if years is None else \
+            np.asarray(years, dtype=np.int32)
+        self.authors = np.asarray(authors, dtype=str)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.paper_pos: Dict[str, int] = {pid: i for i, pid in enumerate(self.paper_ids.tolist())}
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.indices.shape[0])
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[str, str, Sequence[str], int]]) -> "AuthorIndex":
+        """records: (paper_id, title, authors, activity year) per paper."""
+        author_pos: Dict[str, int] = {}
+        paper_ids: List[str] = []
+        titles: List[str] = []
+        years: List[int] = []
+        indptr = [0]
+        indices: List[int] = []
+        for paper_id, title, authors, year in records:
+            paper_ids.append(paper_id)
+            titles.append(title or "")
+            years.append(year)
+            for a in dict.fromkeys(authors):   # dedupe, keep order
+                indices.append(author_pos.setdefault(a, len(author_pos)))
+            indptr.append(len(indices))
+        return cls(paper_ids, titles, list(author_pos), indptr, indices, years)
+
+    def authors_of(self, paper_ids: Iterable[str]) -> set:
+        """Names of the authors of the given papers (unknown ids are ignored)."""
+        out = set()
+        for pid in paper_ids:
+            p = self.paper_pos.get(pid)
+            if p is not None:
+                out.update(self.authors[self.indices[self.indptr[p]:self.indptr[p + 1]]].tolist())
+        return out
+
+    def restrict(self, names: Iterable[str]) -> "AuthorIndex":
+        """Sub-index of every paper of the given authors, listing only those authors."""
+        keep = np.isin(self.authors, np.asarray(list(names), dtype=str))
+        paper_of_edge = np.repeat(np.arange(len(self.paper_ids)), np.diff(self.indptr))
+        papers = np.unique(paper_of_edge[keep[self.indices]])
+        return AuthorIndex.build(
+            (str(self.paper_ids[p]), str(self.titles[p]),
+             [str(self.authors[a]) for a in self.indices[self.indptr[p]:self.indptr[p + 1]] if keep[a]],
+             int(self.years[p]))
+            for p in papers
+        )
+
+    @classmethod
+    def from_hits(cls, ids: Sequence[str], metadatas: Sequence[Dict]) -> "AuthorIndex":
+        """Small index over just the retrieved papers (when no prebuilt index exists)."""
+        return cls.build(
+            (doc_id, md.get("title", ""), json.loads(md.get("authors_json", "[]")),
+             activity_year(md.get("year"), md.get("modified_time")))
+            for doc_id, md in zip(ids, metadatas)
+        )
+
+    def save(self, path: Path = AUTHOR_INDEX_PATH) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp,
+            paper_ids=self.paper_ids,
+            titles=self.titles,
+            authors=self.authors,
+            indptr=self.indptr,
+            indices=self.indices,
+            years=self.years,
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = AUTHOR_INDEX_PATH) -> Optional["AuthorIndex"]:
+        if not Path(path).exists():
+            return None
+        with np.load(path) as z:
+            years = z["years"] if "years" in z.files else None   # indexes built before years were stored
+            return cls(z["paper_ids"], z["titles"], z["authors"], z["indptr"], z["indices"], years)
+
+    def rank(
+        self,
+        doc_ids: Sequence[str],
+        sims: Sequence[float],
+        top_n: int = 10,
+        evidence_n: int = 3,
+        recent: bool = False,
+        ref_year: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Score every author of the candidate papers by summed similarity.
+
+        doc_ids/sims are the retrieved papers, best first. Unknown ids are
+        ignored. With recent=True each paper's similarity is weighted by
+        recency_weights (half-life RECENCY_HALF_LIFE_YEARS, relative to
+        ref_year, default this year), so recent activity ranks first.
+        Returns ranked experts with paper_count and evidence.
+        """
+        pos = np.fromiter((self.paper_pos.get(d, -1) for d in doc_ids), dtype=np.int64, count=len(doc_ids))
+        sims = np.asarray(sims, dtype=np.float64)
+        keep = pos >= 0
+        pos, sims = pos[keep], sims[keep]
+        if pos.size == 0:
+            return []
+
+        # Expand each candidate paper into its author edges (CSR row gather).
+        starts = self.indptr[pos]
+        counts = self.indptr[pos + 1] - starts
+        hit_of_edge = np.repeat(np.arange(pos.size), counts)
+        first_edge = np.repeat(np.cumsum(counts) - counts, counts)
+        edge = starts[hit_of_edge] + (np.arange(hit_of_edge.size) - first_edge)
+        edge_author = self.indices[edge]
+        weight = sims
+        if recent:
+            weight = sims * recency_weights(self.years[pos], ref_year or datetime.now().year)
+        edge_sim = weight[hit_of_edge]
+        if edge_author.size == 0:
+            return []
+
+        authors, inv = np.unique(edge_author, return_inverse=True)
+        scores = np.bincount(inv, weights=edge_sim)
+        paper_counts = np.bincount(inv)
+
+        n = min(top_n, authors.size)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.lexsort((authors[top], -scores[top]))]
+
+        # Evidence from the same edges: group by author, best similarity first.
+        order = np.lexsort((-edge_sim, inv))
+        bounds = np.concatenate(([0], np.cumsum(paper_counts)))
+
+        experts = []
+        for rank, a in enumerate(top, start=1):
+            ev_edges = order[bounds[a]:min(bounds[a] + evidence_n, bounds[a + 1])]
+            evidence = [
+                {
+                    "doc_id": str(self.paper_ids[pos[h]]),
+                    "title": str(self.titles[pos[h]]),
+                    "sim": round(float(sims[h]), 3),
+                }
+                for h in hit_of_edge[ev_edges]
+            ]
+            experts.append({
+                "rank": rank,
+                "name": str(self.authors[authors[a]]),
+                "score": round(float(scores[a]), 3),
+                "paper_count": int(paper_counts[a]),
+                "evidence": evidence,
+            })
+        return experts
+
+
+def iter_metadata_log(path: Path) -> Iterable[Tuple[str, str, List[str], int]]:
+    """(paper_id, title, authors, activity year) from the indexer's metadata_log.jsonl."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            md = row["metadata"]
+            yield (row["id"], md.get("title", ""), json.loads(md.get("authors_json", "[]")),
+                   activity_year(md.get("year"), md.get("modified_time")))
+
+
+# ----------------------------
+# Author profile vectors (direct kNN expert search)
+# ----------------------------
+
+AUTHOR_COLLECTION_NAME = "authors"
+AUTHOR_PROFILE_WEIGHTING = "mean"    # "mean" or "recency"
+
+
+def author_id(name: str) -> str:
+    return "A" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+
+class AuthorProfileBuilder:
+    """
+    Accumulates per-author (weighted) sums of paper embeddings, a page of
+    papers at a time, and turns them into unit-length profile vectors.
+    """
+
+    def __init__(self, index: AuthorIndex, dim: int, weighting: str = AUTHOR_PROFILE_WEIGHTING,
+                 ref_year: Optional[int] = None, half_life: float = RECENCY_HALF_LIFE_YEARS):
+        self.index = index
+        self.weighting = weighting
+        self.ref_year = ref_year
+        self.half_life = half_life
+        self.sums = np.zeros((len(index.authors), dim), dtype=np.float32)
+        self.weights = np.zeros(len(index.authors), dtype=np.float64)
+
+    def add(self, doc_ids: Sequence[str], vectors: np.ndarray, years: Sequence[Optional[int]]) -> None:
+        pos = np.fromiter((self.index.paper_pos.get(d, -1) for d in doc_ids), dtype=np.int64, count=len(doc_ids))
+        keep = pos >= 0
+        pos, vectors = pos[keep], np.asarray(vectors, dtype=np.float32)[keep]
+        years = [y for y, k in zip(years, keep) if k]
+        if pos.size == 0:
+            return
+
+        w = np.ones(pos.size, dtype=np.float64)
+        if self.weighting == "recency" and self.ref_year is not None:
+            w = recency_weights([y or 0 for y in years], self.ref_year, self.half_life)
+
+        starts = self.index.indptr[pos]
+        counts = self.index.indptr[pos + 1] - starts
+        hit_of_edge = np.repeat(np.arange(pos.size), counts)
+        first_edge = np.repeat(np.cumsum(counts) - counts, counts)
+        edge_author = self.index.indices[starts[hit_of_edge] + (np.arange(hit_of_edge.size) - first_edge)]
+
+        np.add.at(self.sums, edge_author, vectors[hit_of_edge] * w[hit_of_edge, None].astype(np.float32))
+        np.add.at(self.weights, edge_author, w[hit_of_edge])
+
+    def profiles(self) -> Tuple[List[str], np.ndarray, List[Dict]]:
+        """(ids, unit vectors, metadatas) for every author with at least one paper vector."""
+        have = np.nonzero(self.weights > 0)[0]
+        vecs = self.sums[have]
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms > 0, norms, 1.0)
+
+        paper_counts = np.bincount(self.index.indices, minlength=len(self.index.authors))
+        names = [str(self.index.authors[a]) for a in have]
+        metas = [
+            {"name": name, "paper_count": int(paper_counts[a]), "weighting": self.weighting}
+            for name, a in zip(names, have)
+        ]
+        if self.weighting == "recency" and self.ref_year is not None:
+            for md in metas:
+                md["ref_year"] = self.ref_year
+        return [author_id(n) for n in names], vecs, metas
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Ollama HTTP API, for offline tests and benchmarks.
+
+Answers POST /api/generate from the LLM response cache (llm_cache.py) and
+falls back to a canned response for prompts it has never seen. Canned
+responses carry "fake": true. 1_initial_script.py never stores those in its
+LLM cache, and papers extracted from them are written under a config hash no
+real run matches, so a fake run cannot poison later runs against a real
+Ollama: they re-extract those papers.
+
+Usage:
+  python fake_ollama.py                                  # port 11435, out/llm_cache.sqlite
+  python fake_ollama.py --canned canned.json --latency 0.5
+  python fake_ollama.py --strict                         # 404 on cache misses
+
+Point the extractor at it:
+  OLLAMA_URL=http://localhost:11435/api/generate python 1_initial_script.py --force
+"""
+
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+from llm_cache import DEFAULT_PATH, LLMCache
+
+DEFAULT_PORT = 11435
+
+# Same schema as PROMPT_FRONT in 1_initial_script.py, all fields empty.
+DEFAULT_CANNED = json.dumps({
+    "title": None,
+    "authors": [],
+    "year": None,
+    "abstract": None,
+    "keywords": [],
+    "categories": [],
+})
+
+
+class FakeOllama:
+    def __init__(self, cache: Optional[LLMCache], canned: str, latency: float, strict: bool):
+        self.cache = cache
+        self.canned = canned
+        self.latency = latency
+        self.strict = strict
+        self.replayed = 0
+        self.canned_n = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+    def generate(self, payload: Dict[str, Any]) -> Optional[Tuple[str, bool]]:
+        """(response, canned) or None when --strict rejects an uncached prompt."""
+        model = payload.get("model") or ""
+        prompt = payload.get("prompt") or ""
+        options = payload.get("options") or {}
+
+        cached = self.cache.get(model, options, prompt) if self.cache else None
+        if cached is not None:
+            with self._lock:
+                self.replayed += 1
+            return cached, False
+
+        if self.strict:
+            with self._lock:
+                self.missed += 1
+            return None
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.canned_n += 1
+        return self.canned, True
+
+
+def make_handler(app: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, obj: Dict[str, Any]) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json(200, {"models": []})
+            elif self.path == "/":
+                body = b"Ollama is running"
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "invalid JSON body"})
+                return
+
+            answer = app.generate(payload)
+            if answer is None:
+                self._send_json(404, {"error": "prompt not in cache (--strict)"})
+                return
+
+            response, canned = answer
+            body = {
+                "model": payload.get("model"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": response,
+                "done": True,
+            }
+            if canned:
+                body["fake"] = True
+            self._send_json(200, body)
+
+        def log_message(self, fmt, *args):
+            pass  # keep benchmark output clean
+
+    return Handler
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fake Ollama server backed by the LLM response cache.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--cache", default=DEFAULT_PATH, help="LLM cache file to replay from")
+    ap.add_argument("--no-cache", action="store_true", help="always answer with the canned response")
+    ap.add_argument("--canned", help="file whose contents are returned for uncached prompts")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds to sleep per canned answer")
+    ap.add_argument("--strict", action="store_true", help="return 404 for uncached prompts")
+    args = ap.parse_args()
+
+    canned = DEFAULT_CANNED
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = f.read().strip()
+
+    cache = None if args.no_cache else LLMCache(args.cache)
+    app = FakeOllama(cache, canned, args.latency, args.strict)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(app))
+
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Replayed: {app.replayed}  canned: {app.canned_n}  rejected: {app.missed}")
+        if cache:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Optional full-text index: every page of every PDF, chunked and embedded.
+
+Only the front matter goes into the "projects" collection. With
+`python 3_build_chroma_index.py --fulltext` the whole body is also streamed
+page by page through a chunker into a "chunks" collection whose entries carry
+their paper id; at query time chunk hits are collapsed to one score per paper
+(max, or mean of the best FULLTEXT_TOP_N chunks). Chunks also carry their
+paper's filter fields (search_filters.py), so filtered full-text queries
+are pre-filtered by the vector store like paper queries.
+
+Page text comes from the page cache written by 1_initial_script.py
+(page_cache.py); PyMuPDF only opens a PDF for pages that are not cached yet,
+and those pages are added to the cache.
+
+Everything is a generator: one page of one PDF plus one embedding batch is
+held in memory at a time, however many papers and chunks there are. Chunk
+ids are deterministic (<paper id>:<n>), and paper ids are content hashes, so
+a small state file (paper id -> chunk count, filter fields hash) is enough
+to skip unchanged papers and delete the chunks of removed ones without
+scanning the collection. When only a paper's filter fields change, its
+chunks are re-written with their stored vectors instead of re-embedded.
+"""
+import os
+import json
+import itertools
+import hashlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from page_cache import PageCache
+
+CHUNK_COLLECTION_NAME = "chunks"
+CHUNK_CHARS = 1200          # target chunk size
+CHUNK_OVERLAP = 200         # chars repeated at the start of the next chunk (< CHUNK_CHARS / 2)
+CHUNK_BATCH = 256           # chunks embedded + upserted per call
+CHUNK_CANDIDATES = 500      # chunk hits retrieved per query before collapsing
+FULLTEXT_AGG = "max"        # "max" or "topn"
+FULLTEXT_TOP_N = 3          # chunks averaged per paper with "topn"
+FULLTEXT_STATE = Path("out_main/fulltext_index.json")
+
+
+def chunk_config() -> str:
+    return f"{CHUNK_CHARS}/{CHUNK_OVERLAP}"
+
+
+def iter_page_texts(pdf_path: str, paper_id: str = "",
+                    pages: Optional[PageCache] = None) -> Iterator[Tuple[int, str]]:
+    """(page number, text) for each page, one page at a time; cached pages skip PyMuPDF."""
+    doc = None
+    new: Dict[int, str] = {}
+    n = pages.page_count(paper_id) if pages is not None else None
+    try:
+        for i in itertools.count():
+            if n is not None and i >= n:
+                break
+            text = pages.get(paper_id, i) if pages is not None else None
+            if text is None:
+                if doc is None:
+                    import fitz  # PyMuPDF; only needed on a cache miss
+                    doc = fitz.open(pdf_path)
+                    n = doc.page_count
+                    if i >= n:
+                        break
+                text = (doc.load_page(i).get_text("text") or "").strip()
+                new[i] = text
+            yield i + 1, text
+    finally:
+        if doc is not None:
+            doc.close()
+        if pages is not None and new:
+            pages.put(paper_id, n, new)
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], size: int = CHUNK_CHARS,
+                overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, str]]:
+    """
+    (page, text) chunks of about `size` chars, split on whitespace, with
+    `overlap` chars carried over. A chunk's page is the page it starts on.
+    The buffer never holds more than one page plus one chunk.
+    """
+    buf = ""
+    start_page = 1
+    for page_no, text in pages:
+        text = " ".join(text.split())
+        if not text:
+            continue
+        if not buf:
+            start_page = page_no
+        buf = f"{buf} {text}" if buf else text
+        while len(buf) >= size:
+            cut = buf.rfind(" ", size // 2, size)
+            cut = cut if cut > 0 else size
+            yield start_page, buf[:cut]
+            tail = buf[max(0, cut - overlap):]
+            buf = tail[tail.find(" ") + 1:] if overlap else buf[cut:].lstrip()
+            start_page = page_no
+    if buf.strip():
+        yield start_page, buf
+
+
+def iter_paper_chunks(paper_id: str, pdf_path: str, fields: Optional[Dict] = None,
+                      pages: Optional[PageCache] = None) -> Iterator[Tuple[str, str, Dict]]:
+    """(chunk id, text, metadata) for one paper; fields are added to every chunk's metadata."""
+    for n, (page, text) in enumerate(chunk_pages(iter_page_texts(pdf_path, paper_id, pages))):
+        yield f"{paper_id}:{n}", text, {**(fields or {}), "paper_id": paper_id, "page": page, "chunk": n}
+
+
+def fully_cached(pages: Optional[PageCache], paper_id: str) -> bool:
+    if pages is None:
+        return False
+    n = pages.page_count(paper_id)
+    return n is not None and all(pages.get(paper_id, i) is not None for i in range(n))
+
+
+def fields_hash(fields: Dict) -> str:
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def state_path(backend: str = "chroma") -> Path:
+    """One state file per vector backend (see vector_store.py)."""
+    return FULLTEXT_STATE if backend == "chroma" else FULLTEXT_STATE.with_suffix(f".{backend}.json")
+
+
+def load_state(path: Path = FULLTEXT_STATE) -> Dict[str, Dict]:
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: Dict[str, Dict], path: Path = FULLTEXT_STATE) -> None:
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def build_chunk_collection(collection, papers: Iterable[Tuple[str, str, Dict]], encode,
+                           pages: Optional[PageCache] = None) -> Dict[str, int]:
+    """
+    Index the chunks of every (paper id, pdf path, filter fields) whose
+    chunks are missing or were made with another chunk config; update the
+    filter fields of unchanged chunks; drop chunks of papers not listed.
+
+    encode: texts -> (n, dim) array. pages: page text cache; a paper whose
+    PDF is gone is still indexed when all its pages are cached. Chunk vectors go straight to the
+    collection rather than through the embedding cache, whose in-memory key
+    map would not scale to tens of millions of chunks.
+    """
+    path = state_path(collection.backend)
+    state = load_state(path)
+    config = chunk_config()
+    counts = {"papers": 0, "skipped": 0, "refreshed": 0, "missing": 0, "chunks": 0, "removed": 0}
+    seen = set()
+
+    ids: List[str] = []
+    texts: List[str] = []
+    metas: List[Dict] = []
+    pending: Dict[str, tuple] = {}  # papers whose last chunk is in the buffer
+
+    def flush():
+        if ids:
+            collection.upsert(ids=ids, embeddings=encode(texts).tolist(), documents=texts, metadatas=metas)
+            counts["chunks"] += len(ids)
+            ids.clear()
+            texts.clear()
+            metas.clear()
+        for pid, (n, fields) in pending.items():
+            state[pid] = {"config": config, "chunks": n, "fields": fields}
+        pending.clear()
+        save_state(state, path)
+
+    for paper_id, pdf_path, fields in papers:
+        seen.add(paper_id)
+        old = state.get(paper_id)
+        fhash = fields_hash(fields)
+        if old and old["config"] == config:
+            if old.get("fields") != fhash:
+                refresh_fields(collection, paper_id, old["chunks"], fields)
+                old["fields"] = fhash
+                counts["refreshed"] += 1
+            else:
+                counts["skipped"] += 1
+            continue
+        if (not pdf_path or not Path(pdf_path).exists()) and not fully_cached(pages, paper_id):
+            counts["missing"] += 1
+            continue
+
+        n = 0
+        for chunk_id, text, meta in iter_paper_chunks(paper_id, pdf_path, fields, pages):
+            ids.append(chunk_id)
+            texts.append(text)
+            metas.append(meta)
+            n += 1
+            if len(ids) >= CHUNK_BATCH:
+                flush()
+        if old and old["chunks"] > n:   # re-chunked shorter: drop the leftover tail
+            delete_chunks(collection, paper_id, n, old["chunks"])
+        pending[paper_id] = (n, fhash)
+        counts["papers"] += 1
+    flush()
+
+    for paper_id in [p for p in state if p not in seen]:
+        delete_chunks(collection, paper_id, 0, state[paper_id]["chunks"])
+        counts["removed"] += 1
+        del state[paper_id]
+    save_state(state, path)
+    return counts
+
+
+def refresh_fields(collection, paper_id: str, n_chunks: int, fields: Dict) -> None:
+    """Re-write a paper's chunks with new filter fields, reusing their stored vectors."""
+    for i in range(0, n_chunks, CHUNK_BATCH):
+        got = collection.get(ids=[f"{paper_id}:{n}" for n in range(i, min(i + CHUNK_BATCH, n_chunks))],
+                             include=["embeddings", "metadatas", "documents"])
+        if not len(got["ids"]):
+            continue
+        metas = [
+            {**fields, "paper_id": md["paper_id"], "page": md["page"], "chunk": md["chunk"]}
+            for md in got["metadatas"]
+        ]
+        collection.upsert(ids=got["ids"], embeddings=np.asarray(got["embeddings"], dtype=np.float32),
+                          documents=got["documents"], metadatas=metas)
+
+
+def delete_chunks(collection, paper_id: str, start: int, stop: int) -> None:
+    for i in range(start, stop, CHUNK_BATCH):
+        collection.delete(ids=[f"{paper_id}:{n}" for n in range(i, min(i + CHUNK_BATCH, stop))])
+
+
+def collapse(paper_ids: Sequence[str], sims: Sequence[float], agg: str = FULLTEXT_AGG,
+             top_n: int = FULLTEXT_TOP_N) -> List[Tuple[str, float, int]]:
+    """
+    Chunk hits (best first) -> [(paper id, score, index of its best hit)],
+    best paper first. agg "max" keeps each paper's best chunk; "topn" averages
+    its best top_n chunks.
+    """
+    if not len(paper_ids):
+        return []
+    papers, inv = np.unique(np.asarray(paper_ids, dtype=str), return_inverse=True)
+    sims = np.asarray(sims, dtype=np.float64)
+
+    order = np.lexsort((-sims, inv))                  # by paper, best chunk first
+    counts = np.bincount(inv)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    best = order[starts]                              # best hit per paper
+
+    if agg == "max":
+        scores = sims[best]
+    elif agg == "topn":
+        rank_in_paper = np.arange(order.size) - np.repeat(starts, counts)
+        keep = order[rank_in_paper < top_n]
+        scores = np.bincount(inv[keep], weights=sims[keep]) / np.minimum(counts, top_n)
+    else:
+        raise ValueError(f"unknown aggregation: {agg}")
+
+    ranked = np.lexsort((best, -scores))
+    return [(str(papers[p]), float(scores[p]), int(best[p])) for p in ranked]
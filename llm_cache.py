@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk cache for LLM responses.
+
+Entries are keyed by a hash of (model, options, rendered prompt), so retries,
+re-runs and unchanged papers never pay LLM latency twice. Storage is a single
+SQLite file; when it grows past `max_bytes` the least recently used entries
+are evicted.
+
+Used by 1_initial_script.py (ollama_generate) and fake_ollama.py.
+
+Usage:
+  python llm_cache.py [path]      # print cache stats
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+DEFAULT_PATH = os.path.join("out", "llm_cache.sqlite")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024   # 512 MB
+EVICT_TO_FRACTION = 0.9                 # evict down to 90% of the cap
+
+
+def cache_key(model: str, options: Optional[Dict[str, Any]], prompt: str) -> str:
+    blob = json.dumps(
+        {"model": model, "options": options or {}, "prompt": prompt},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Thread-safe, size-bounded LRU cache of raw LLM responses."""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key       TEXT PRIMARY KEY,
+                model     TEXT NOT NULL,
+                response  TEXT NOT NULL,
+                size      INTEGER NOT NULL,
+                created   REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get_by_key(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def get(self, model: str, options: Optional[Dict[str, Any]], prompt: str) -> Optional[str]:
+        return self.get_by_key(cache_key(model, options, prompt))
+
+    def put(self, model: str, options: Optional[Dict[str, Any]], prompt: str, response: str) -> None:
+        key = cache_key(model, options, prompt)
+        size = len(response.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is below the target size."""
+        # Other processes may share the file, so start from the true size.
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        target = int(self.max_bytes * EVICT_TO_FRACTION)
+        cur = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC")
+        doomed = []
+        for key, size in cur:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    cache = LLMCache(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for ingested PDFs (MinHash + LSH).
+
+Paper ids are the SHA-1 of the PDF bytes, so a re-export, an arXiv v2 or a
+watermarked copy of a paper gets a new id. 1_initial_script.py signs the
+front-page text of every PDF it prepares:
+
+  shingles   overlapping SHINGLE_WORDS-word windows of the normalized text
+  signature  NUM_PERM MinHash values (one vectorized pass per PDF)
+  LSH        BANDS bands of NUM_PERM // BANDS rows; each band hashes to a
+             bucket key stored in an indexed SQLite table
+
+A lookup reads only the buckets the new signature falls into (BANDS indexed
+point queries) and compares the few canonical papers found there, so the
+cost per PDF stays flat as the corpus grows. A candidate whose estimated
+Jaccard similarity is >= DUP_THRESHOLD is a version of that paper: its
+stored extraction is reused and it is recorded in the versions table instead
+of becoming a separate paper.
+
+Usage:
+  python near_dup.py [path]      # print index stats and version groups
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join("out", "near_dup.sqlite")
+SHINGLE_WORDS = 4
+NUM_PERM = 64
+BANDS = 16                 # 16 bands x 4 rows: pairs with Jaccard 0.8 share a bucket with p > 0.999
+DUP_THRESHOLD = 0.8        # estimated Jaccard similarity to count as the same paper
+MIN_WORDS = 30             # shorter texts (scans, empty pages) are never matched
+
+_WORD = re.compile(r"[a-z0-9]+")
+_MERSENNE = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+
+def signature(text: str) -> Optional[bytes]:
+    """MinHash signature of the text's word shingles (NUM_PERM uint64), None if too short to sign."""
+    words = _WORD.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # a*h + b stays below 2**63 (a, b < 2**31, h < 2**32)
+    perm = (h[:, None] * _A[None, :] + _B[None, :]) % _MERSENNE
+    return perm.min(axis=0).astype(np.uint64).tobytes()
+
+
+def similarity(sig_a: bytes, sig_b: bytes) -> float:
+    """Estimated Jaccard similarity: fraction of equal MinHash values."""
+    a = np.frombuffer(sig_a, dtype=np.uint64)
+    b = np.frombuffer(sig_b, dtype=np.uint64)
+    return float(np.mean(a == b))
+
+
+def band_keys(sig: bytes) -> List[int]:
+    rows = NUM_PERM // BANDS
+    size = rows * 8
+    return [
+        int.from_bytes(hashlib.sha1(sig[i * size:(i + 1) * size]).digest()[:8], "big", signed=True)
+        for i in range(BANDS)
+    ]
+
+
+class NearDupIndex:
+    """Signatures and LSH buckets of canonical papers, plus the versions grouped under them."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (paper_id TEXT PRIMARY KEY, sig BLOB, front_text TEXT);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, key INTEGER NOT NULL, paper_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS buckets_key ON buckets (band, key);
+            CREATE INDEX IF NOT EXISTS buckets_paper ON buckets (paper_id);
+            CREATE TABLE IF NOT EXISTS versions (
+                paper_id     TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                path         TEXT,
+                similarity   REAL
+            );
+            CREATE INDEX IF NOT EXISTS versions_canonical ON versions (canonical_id);
+            """
+        )
+        self._conn.commit()
+
+    def __contains__(self, paper_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM papers WHERE paper_id = ? UNION ALL SELECT 1 FROM versions WHERE paper_id = ?",
+                (paper_id, paper_id),
+            ).fetchone() is not None
+
+    def find(self, sig: bytes, exclude: str = "") -> Optional[Tuple[str, float]]:
+        """(canonical paper id, estimated similarity) of the closest match >= DUP_THRESHOLD, or None."""
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(band_keys(sig)):
+                candidates.update(pid for (pid,) in self._conn.execute(
+                    "SELECT paper_id FROM buckets WHERE band = ? AND key = ?", (band, key)
+                ))
+            candidates.discard(exclude)
+            best = None
+            for pid in sorted(candidates):
+                row = self._conn.execute("SELECT sig FROM papers WHERE paper_id = ?", (pid,)).fetchone()
+                sim = similarity(sig, row[0])
+                if sim >= DUP_THRESHOLD and (best is None or sim > best[1]):
+                    best = (pid, sim)
+            return best
+
+    def front_text(self, paper_id: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT front_text FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        return (row[0] or "") if row else ""
+
+    def add(self, paper_id: str, sig: Optional[bytes], front_text: str = "") -> None:
+        """
+        Register a canonical paper (replaces its old signature; it stops being
+        anyone's version). Papers without a signature are recorded as seen but
+        never matched.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE paper_id = ?", (paper_id,))
+            self._conn.execute("DELETE FROM versions WHERE paper_id = ?", (paper_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO papers (paper_id, sig, front_text) VALUES (?, ?, ?)",
+                (paper_id, sig, front_text),
+            )
+            if sig is not None:
+                self._conn.executemany(
+                    "INSERT INTO buckets (band, key, paper_id) VALUES (?, ?, ?)",
+                    [(band, key, paper_id) for band, key in enumerate(band_keys(sig))],
+                )
+            self._conn.commit()
+
+    def add_version(self, paper_id: str, canonical_id: str, path: str, sim: float) -> None:
+        """Group paper_id under canonical_id (and drop it as a canonical paper if it was one)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE paper_id = ?", (paper_id,))
+            self._conn.execute("DELETE FROM papers WHERE paper_id = ?", (paper_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO versions (paper_id, canonical_id, path, similarity) VALUES (?, ?, ?, ?)",
+                (paper_id, canonical_id, path, sim),
+            )
+            self._conn.commit()
+
+    def groups(self) -> Dict[str, List[Tuple[str, str, float]]]:
+        """Canonical id -> [(version id, path, similarity)]."""
+        out: Dict[str, List[Tuple[str, str, float]]] = {}
+        with self._lock:
+            for pid, canonical, path, sim in self._conn.execute(
+                "SELECT paper_id, canonical_id, path, similarity FROM versions ORDER BY canonical_id, path"
+            ):
+                out.setdefault(canonical, []).append((pid, path, sim))
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            papers = self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            unsigned = self._conn.execute("SELECT COUNT(*) FROM papers WHERE sig IS NULL").fetchone()[0]
+            versions = self._conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+        return {"papers": papers, "unsigned": unsigned, "versions": versions}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    index = NearDupIndex(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
+    print(json.dumps(index.stats(), indent=2))
+    for canonical, versions in index.groups().items():
+        print(f"{canonical}:")
+        for pid, path, sim in versions:
+            print(f"  {pid}  {path}  (similarity {sim:.2f})")
+    index.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of extracted PDF page text, keyed by (paper id, page).
+
+1_initial_script.py's PdfReader writes every page it extracts (and the
+layout lines of the first page, used by the heuristic extractor), so
+re-extraction with new prompts or settings reads text from here instead of
+parsing the PDF again. fulltext.py streams pages from the cache too and only
+opens the PDF with PyMuPDF for pages it has not seen. Paper ids are content
+hashes, so cached text never goes stale.
+
+Pages are numbered from 0, like PyMuPDF.
+
+Usage:
+  python page_cache.py [path]      # print cache stats
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PAGE_CACHE_PATH = Path("out_main/pages.sqlite")
+
+
+class PageCache:
+    """Page count, page text and first-page layout lines per paper (SQLite, safe across processes)."""
+
+    def __init__(self, path: Path = PAGE_CACHE_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (paper_id TEXT PRIMARY KEY, page_count INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS pages (
+                paper_id TEXT NOT NULL,
+                page     INTEGER NOT NULL,
+                text     TEXT NOT NULL,
+                PRIMARY KEY (paper_id, page)
+            );
+            CREATE TABLE IF NOT EXISTS layouts (
+                paper_id TEXT NOT NULL,
+                page     INTEGER NOT NULL,
+                lines    TEXT NOT NULL,
+                PRIMARY KEY (paper_id, page)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def page_count(self, paper_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT page_count FROM docs WHERE paper_id = ?", (paper_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, paper_id: str, page: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM pages WHERE paper_id = ? AND page = ?", (paper_id, page)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_layout(self, paper_id: str, page: int) -> Optional[List[Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lines FROM layouts WHERE paper_id = ? AND page = ?", (paper_id, page)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(
+        self,
+        paper_id: str,
+        page_count: int,
+        pages: Dict[int, str],
+        layouts: Optional[Dict[int, List[Any]]] = None,
+    ) -> None:
+        """Store newly extracted pages (and layout lines) of one paper in one transaction."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO docs (paper_id, page_count) VALUES (?, ?)", (paper_id, page_count)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (paper_id, page, text) VALUES (?, ?, ?)",
+                [(paper_id, i, text) for i, text in pages.items()],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO layouts (paper_id, page, lines) VALUES (?, ?, ?)",
+                [(paper_id, i, json.dumps(lines, ensure_ascii=False)) for i, lines in (layouts or {}).items()],
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            papers = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            chars = self._conn.execute("SELECT COALESCE(SUM(LENGTH(text)), 0) FROM pages").fetchone()[0]
+        size = os.path.getsize(self.path) if self.path.exists() else 0
+        return {"papers": papers, "pages": pages, "chars": chars, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    cache = PageCache(Path(sys.argv[1]) if len(sys.argv) > 1 else PAGE_CACHE_PATH)
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Search core shared by 4_query.py and query_server.py.
+
+PaperSearcher keeps the embedding model and the vector store collections
+open (Chroma or exact, see vector_store.py), so a long-running process
+(query_server.py) pays the cold start once.
+"""
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bm25_index import BM25_INDEX_PATH, BM25Index, rrf_merge
+from embedding_store import CachedEmbeddingFunction
+from fulltext import CHUNK_CANDIDATES, CHUNK_COLLECTION_NAME, collapse
+from expert_ranking import AUTHOR_COLLECTION_NAME, AUTHOR_INDEX_PATH, EXPERT_CANDIDATES, AuthorIndex
+from search_filters import load_facets
+from vector_store import VECTOR_BACKEND, open_store
+
+# "papers": sum similarity over retrieved papers; "profiles": kNN over author vectors
+EXPERT_MODES = ("papers", "profiles")
+# "vector": embeddings only; "lexical": BM25 only; "hybrid": both, merged with RRF;
+# "fulltext": full-text chunks collapsed to papers (3_build_chroma_index.py --fulltext)
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid", "fulltext")
+
+COLLECTION_NAME = "projects"
+
+class PaperSearcher:
+    def __init__(self, collection_name: str = COLLECTION_NAME, backend: str = VECTOR_BACKEND):
+        self.embed_fn = CachedEmbeddingFunction()
+        self.backend = backend
+        self.collection = open_store(collection_name, backend, embed_fn=self.embed_fn)
+        self.count = self.collection.count()
+        # Prebuilt by 3_build_chroma_index.py; without it experts are ranked
+        # from the retrieved candidates' metadata only.
+        self.author_index = AuthorIndex.load(AUTHOR_INDEX_PATH)
+        try:
+            self.author_collection = open_store(AUTHOR_COLLECTION_NAME, backend, embed_fn=self.embed_fn)
+            self.author_count = self.author_collection.count()
+        except Exception:
+            self.author_collection = None   # built by 3_build_chroma_index.py
+            self.author_count = 0
+        self.bm25 = BM25Index.load(BM25_INDEX_PATH)
+        try:
+            self.chunk_collection = open_store(CHUNK_COLLECTION_NAME, backend, embed_fn=self.embed_fn)
+            self.chunk_count = self.chunk_collection.count()
+        except Exception:
+            self.chunk_collection = None   # optional: 3_build_chroma_index.py --fulltext
+            self.chunk_count = 0
+        self.facets = load_facets()     # filterable years / authors / categories
+
+    def footprint(self) -> Dict[str, object]:
+        """Vector memory of the paper collection (exact backend only)."""
+        return self.collection.footprint() if hasattr(self.collection, "footprint") else {}
+
+    def warm_up(self) -> None:
+        """Load the model now instead of on the first uncached query."""
+        self.embed_fn.store.model
+
+    def find_experts(self, embeddings, experts_n: int, rescore: Optional[int] = None) -> List[List[Dict]]:
+        """Experts straight from the author profile collection (one kNN per query)."""
+        if self.author_collection is None:
+            raise RuntimeError(f"No '{AUTHOR_COLLECTION_NAME}' collection; run 3_build_chroma_index.py")
+        if self.author_count == 0:
+            return [[] for _ in embeddings]
+        res = self.author_collection.query(
+            query_embeddings=embeddings,
+            n_results=max(1, min(experts_n, self.author_count)),
+            include=["metadatas", "distances"],
+            rescore=rescore,
+        )
+        return [
+            [
+                {
+                    "rank": rank,
+                    "name": md.get("name", ""),
+                    "score": round(1.0 - float(dist), 3),
+                    "paper_count": md.get("paper_count", 0),
+                    "evidence": [],
+                }
+                for rank, (md, dist) in enumerate(zip(metas, dists), start=1)
+            ]
+            for metas, dists in zip(res["metadatas"], res["distances"])
+        ]
+
+    def _fetch(self, ids, with_embeddings: bool) -> Dict[str, tuple]:
+        """doc_id -> (metadata, embedding or None) for papers found outside the vector query."""
+        if not ids:
+            return {}
+        include = ["metadatas", "embeddings"] if with_embeddings else ["metadatas"]
+        got = self.collection.get(ids=list(ids), include=include)
+        embs = got["embeddings"] if with_embeddings else [None] * len(got["ids"])
+        return {i: (md or {}, e) for i, md, e in zip(got["ids"], got["metadatas"], embs)}
+
+    def matching_ids(self, where: Dict) -> List[str]:
+        """Ids of all papers matching a where filter (one ids-only read, not paged)."""
+        return list(self.collection.get(include=[], where=where)["ids"])
+
+    def _candidates(self, queries: List[str], embeddings, n_candidates: int, mode: str,
+                    where: Optional[Dict] = None, rescore: Optional[int] = None) -> List[tuple]:
+        """
+        Per query (ids, metadatas, sims, scores, passages), best first. sims
+        are cosine similarities (normalized BM25 in lexical mode); scores are
+        what the ranking used (cosine, BM25, fused RRF or collapsed chunk
+        similarity). passages holds (page, text) of the best chunk in
+        fulltext mode, else None. where restricts every retriever to the
+        matching papers before ranking.
+        """
+        if mode == "fulltext":
+            return self._fulltext_candidates(embeddings, n_candidates, where, rescore)
+
+        vec = [([], [], [])] * len(queries)
+        if mode in ("vector", "hybrid"):
+            res = self.collection.query(
+                query_embeddings=embeddings,
+                n_results=n_candidates,
+                include=["metadatas", "distances"],
+                where=where,
+                rescore=rescore,
+            )
+            # with cosine space: dist ≈ (1 - cosine_similarity)
+            vec = [
+                (ids, metas, [1.0 - float(d) for d in dists])
+                for ids, metas, dists in zip(res["ids"], res["metadatas"], res["distances"])
+            ]
+            if mode == "vector":
+                return [(ids, metas, sims, sims, [None] * len(ids)) for ids, metas, sims in vec]
+
+        if self.bm25 is None:
+            raise RuntimeError(f"No BM25 index at {BM25_INDEX_PATH}; run 3_build_chroma_index.py")
+        allowed = self.bm25.mask(self.matching_ids(where)) if where is not None else None
+        lex = [self.bm25.search(q, n_candidates, allowed) for q in queries]
+
+        if mode == "lexical":
+            fetched = self._fetch({d for ids, _ in lex for d in ids}, with_embeddings=False)
+            out = []
+            for ids, scores in lex:
+                hits = [(d, float(x)) for d, x in zip(ids, scores) if d in fetched]
+                top = hits[0][1] if hits else 1.0
+                out.append((
+                    [d for d, _ in hits],
+                    [fetched[d][0] for d, _ in hits],
+                    [x / top for _, x in hits],
+                    [x for _, x in hits],
+                    [None] * len(hits),
+                ))
+            return out
+
+        # hybrid: fuse both rankings; cosine for lexical-only hits from their stored vectors
+        fused = [rrf_merge([v[0], l[0]])[:n_candidates] for v, l in zip(vec, lex)]
+        known = [dict(zip(v[0], zip(v[1], v[2]))) for v in vec]
+        fetched = self._fetch(
+            {d for f, k in zip(fused, known) for d, _ in f if d not in k}, with_embeddings=True
+        )
+        out = []
+        for q_emb, f, k in zip(embeddings, fused, known):
+            q_emb = np.asarray(q_emb, dtype=np.float32)
+            q_emb = q_emb / (np.linalg.norm(q_emb) or 1.0)
+            ids, metas, sims, scores = [], [], [], []
+            for d, rrf in f:
+                if d in k:
+                    md, sim = k[d]
+                elif d in fetched:
+                    md, emb = fetched[d]
+                    emb = np.asarray(emb, dtype=np.float32)
+                    sim = float(q_emb @ emb / (np.linalg.norm(emb) or 1.0))
+                else:
+                    continue
+                ids.append(d)
+                metas.append(md)
+                sims.append(sim)
+                scores.append(rrf)
+            out.append((ids, metas, sims, scores, [None] * len(ids)))
+        return out
+
+    def _fulltext_candidates(self, embeddings, n_candidates: int, where: Optional[Dict] = None,
+                             rescore: Optional[int] = None) -> List[tuple]:
+        if self.chunk_collection is None:
+            raise RuntimeError(f"No '{CHUNK_COLLECTION_NAME}' collection; run 3_build_chroma_index.py --fulltext")
+        res = self.chunk_collection.query(
+            query_embeddings=embeddings,
+            n_results=max(1, min(max(CHUNK_CANDIDATES, n_candidates), self.chunk_count)),
+            include=["metadatas", "distances", "documents"],
+            where=where,    # chunks carry their paper's filter fields
+            rescore=rescore,
+        )
+        per_query = []
+        for metas, dists in zip(res["metadatas"], res["distances"]):
+            per_query.append(collapse([md["paper_id"] for md in metas], [1.0 - float(d) for d in dists])[:n_candidates])
+        fetched = self._fetch({pid for papers in per_query for pid, _, _ in papers}, with_embeddings=False)
+
+        out = []
+        for papers, metas, docs in zip(per_query, res["metadatas"], res["documents"]):
+            papers = [p for p in papers if p[0] in fetched]   # only papers with front matter indexed
+            scores = [score for _, score, _ in papers]
+            out.append((
+                [pid for pid, _, _ in papers],
+                [fetched[pid][0] for pid, _, _ in papers],
+                scores,
+                scores,
+                [(metas[best]["page"], docs[best]) for _, _, best in papers],
+            ))
+        return out
+
+    def search(self, queries: List[str], top_k: int = 10, experts_n: int = 10,
+               experts_mode: str = "papers", mode: str = "vector", where: Optional[Dict] = None,
+               recent: bool = False, rescore: Optional[int] = None) -> List[Dict]:
+        """
+        Encode all queries in one batched pass and send them as one multi-query call.
+
+        mode picks the paper retriever (RETRIEVAL_MODES). In "papers" experts
+        mode experts are ranked over EXPERT_CANDIDATES papers, not just the
+        top_k shown; in "profiles" mode they come from one kNN query over
+        author profile vectors. where (search_filters.make_where) limits the
+        papers searched, and so the papers experts are ranked on; author
+        profiles themselves are not filtered. recent=True weights each
+        paper's contribution to an expert's score by its recency ("papers"
+        experts mode; profile vectors use their build-time weighting). rescore
+        overrides, for this call only, how many candidates per result quantized
+        exact stores rescore (see vector_store.py).
+        """
+        if not queries:
+            return []
+        if experts_mode not in EXPERT_MODES:
+            raise ValueError(f"experts_mode must be one of {EXPERT_MODES}")
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"mode must be one of {RETRIEVAL_MODES}")
+
+        if experts_mode == "papers":
+            n_candidates = min(max(top_k, EXPERT_CANDIDATES), self.count)
+        else:
+            n_candidates = min(top_k, self.count)
+        if n_candidates <= 0:
+            # empty collection (or top_k 0): nothing to query, and n_results=0 is rejected
+            return [{"query": q, "papers": [], "experts": []} for q in queries]
+        embeddings = None
+        if mode != "lexical" or experts_mode == "profiles":
+            embeddings = self.embed_fn.store.encode(queries).tolist()
+        candidates = self._candidates(queries, embeddings, n_candidates, mode, where, rescore)
+        profile_experts = self.find_experts(embeddings, experts_n, rescore) if experts_mode == "profiles" else None
+
+        results = []
+        for qi, (q, (ids, metas, sims, scores, passages)) in enumerate(zip(queries, candidates)):
+            papers = []
+            for rank, (doc_id, md, sim, score, passage) in enumerate(
+                zip(ids[:top_k], metas, sims, scores, passages), start=1
+            ):
+                paper = {
+                    "rank": rank,
+                    "doc_id": doc_id,
+                    "sim": sim,
+                    "score": score,
+                    "title": md.get("title", ""),
+                    "filename": md.get("filename", ""),
+                    "path": md.get("path", ""),
+                    "year": md.get("year", ""),
+                    "authors": json.loads(md.get("authors_json", "[]")),
+                }
+                if passage:
+                    paper["page"], paper["passage"] = passage
+                papers.append(paper)
+
+            if profile_experts is not None:
+                experts = profile_experts[qi]
+                for e in experts:   # evidence: their papers among the hits shown
+                    e["evidence"] = [
+                        {"doc_id": p["doc_id"], "title": p["title"], "sim": round(p["sim"], 3)}
+                        for p in papers if e["name"] in p["authors"]
+                    ][:5]
+            else:
+                index = self.author_index or AuthorIndex.from_hits(ids, metas)
+                experts = index.rank(ids, sims, top_n=experts_n, evidence_n=5, recent=recent)
+            results.append({"query": q, "papers": papers, "experts": experts})
+        return results
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Long-running local query service: keeps the model and collection warm.
+
+Usage:
+  python query_server.py [--host 127.0.0.1] [--port 8765]
+
+API (JSON):
+  GET  /health   -> {"status": "ok", "collection": ..., "backend": ..., "count": n}
+  POST /search   {"queries": [...], "top_k": 10, "experts": "papers"|"profiles",
+                  "mode": "vector"|"lexical"|"hybrid"|"fulltext",
+                  "where": {...}}   (optional filter, see search_filters.make_where)
+                 -> {"results": [...]}
+
+4_query.py uses it automatically when it is running.
+"""
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from paper_search import COLLECTION_NAME, PaperSearcher
+from vector_store import BACKENDS, VECTOR_BACKEND
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_QUERIES_PER_REQUEST = 1024
+
+def make_handler(searcher: PaperSearcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {
+                    "status": "ok",
+                    "collection": COLLECTION_NAME,
+                    "backend": searcher.backend,
+                    "count": searcher.collection.count(),
+                })
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/search":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(length) or b"{}")
+                queries = [str(q) for q in req.get("queries") or []]
+                top_k = int(req.get("top_k") or 10)
+                experts_mode = str(req.get("experts") or "papers")
+                mode = str(req.get("mode") or "vector")
+                where = req.get("where") or None
+                recent = bool(req.get("recent"))
+                if where is not None and not isinstance(where, dict):
+                    raise ValueError("where must be an object")
+            except (ValueError, TypeError):
+                self._send_json(400, {"error": "expected {\"queries\": [...], \"top_k\": n}"})
+                return
+            if len(queries) > MAX_QUERIES_PER_REQUEST:
+                self._send_json(400, {"error": f"at most {MAX_QUERIES_PER_REQUEST} queries per request"})
+                return
+
+            try:
+                results = searcher.search(queries, top_k, experts_mode=experts_mode, mode=mode, where=where,
+                                          recent=recent)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except RuntimeError as e:   # index not built (e.g. no chunks for mode "fulltext")
+                self._send_json(503, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"results": results})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve paper + expert search over localhost HTTP.")
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--backend", choices=BACKENDS, default=VECTOR_BACKEND)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    searcher = PaperSearcher(backend=args.backend)
+    searcher.warm_up()
+    print(f"Loaded {COLLECTION_NAME} ({searcher.collection.count()} docs, {args.backend}) "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(searcher))
+    print(f"Query server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Typed filter fields on paper metadata and Chroma-style `where` filters.
+
+3_build_chroma_index.py adds these to every paper's metadata (and to its
+full-text chunks), next to the display fields (year string, authors_json):
+
+  year_num          int, only when the year is known
+  author:<name>     True, one per author
+  cat:<category>    True, one per category (lower-cased)
+
+so a filter is a native `where` clause that the vector store applies before
+ranking: Chroma restricts its HNSW / brute-force search to the matching ids,
+and the exact backend (vector_store.ExactStore) scans only the matching rows,
+found through its SQLite side index. Nothing is over-fetched and discarded.
+
+make_where() turns the 4_query.py flags / app.py sidebar choices into such
+a clause; the facet file lists the values available in the index.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+YEAR_FIELD = "year_num"
+AUTHOR_PREFIX = "author:"
+CATEGORY_PREFIX = "cat:"
+FACETS_PATH = Path("out_main/filter_facets.json")
+
+
+def parse_year(value) -> Optional[int]:
+    """Year as an int, from an int or a string starting with 4 digits."""
+    text = str(value or "").strip()[:4]
+    return int(text) if len(text) == 4 and text.isdigit() else None
+
+
+def author_field(name: str) -> str:
+    return AUTHOR_PREFIX + name.strip()
+
+
+def category_field(category: str) -> str:
+    return CATEGORY_PREFIX + category.strip().lower()
+
+
+def filter_fields(front: Dict) -> Dict:
+    """Typed filter metadata for one paper's front matter."""
+    fields: Dict = {}
+    year = parse_year(front.get("year"))
+    if year is not None:
+        fields[YEAR_FIELD] = year
+    for name in front.get("authors") or []:
+        if str(name).strip():
+            fields[author_field(str(name))] = True
+    for cat in front.get("categories") or []:
+        if str(cat).strip():
+            fields[category_field(str(cat))] = True
+    return fields
+
+
+def make_where(year_from: Optional[int] = None, year_to: Optional[int] = None,
+               authors: Sequence[str] = (), categories: Sequence[str] = ()) -> Optional[Dict]:
+    """
+    `where` clause: year within [year_from, year_to], by any of `authors`,
+    in any of `categories` (all given conditions must hold). None = no filter.
+    """
+    clauses: List[Dict] = []
+    if year_from is not None:
+        clauses.append({YEAR_FIELD: {"$gte": int(year_from)}})
+    if year_to is not None:
+        clauses.append({YEAR_FIELD: {"$lte": int(year_to)}})
+    for fields in ([author_field(a) for a in authors if a.strip()],
+                   [category_field(c) for c in categories if c.strip()]):
+        if len(fields) == 1:
+            clauses.append({fields[0]: True})
+        elif fields:
+            clauses.append({"$or": [{f: True} for f in fields]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def build_facets(metadatas: Iterable[Dict]) -> Dict:
+    """Year range, authors and categories (with paper counts) present in the index."""
+    years: List[int] = []
+    authors: Dict[str, int] = {}
+    categories: Dict[str, int] = {}
+    for md in metadatas:
+        for key, value in md.items():
+            if key == YEAR_FIELD:
+                years.append(value)
+            elif key.startswith(AUTHOR_PREFIX):
+                name = key[len(AUTHOR_PREFIX):]
+                authors[name] = authors.get(name, 0) + 1
+            elif key.startswith(CATEGORY_PREFIX):
+                cat = key[len(CATEGORY_PREFIX):]
+                categories[cat] = categories.get(cat, 0) + 1
+    return {
+        "years": [min(years), max(years)] if years else [],
+        "authors": dict(sorted(authors.items())),
+        "categories": dict(sorted(categories.items(), key=lambda kv: (-kv[1], kv[0]))),
+    }
+
+
+def save_facets(facets: Dict, path: Path = FACETS_PATH) -> None:
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(facets, f, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def load_facets(path: Path = FACETS_PATH) -> Dict:
+    if not path.exists():
+        return {"years": [], "authors": {}, "categories": {}}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
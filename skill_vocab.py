@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Canonical skill vocabulary: raw keyword / category strings -> skill ids.
+
+Extracted keywords come in many spellings of one idea ("Rotational
+symmetry", "rotational symmetries", "Rotational Symmetry."). Building the
+vocabulary takes two steps:
+
+  1. surface grouping: strings with the same normalized form (case, spacing,
+     trailing punctuation, plural of the last word) are one term;
+  2. embedding clustering: every distinct term is embedded in batches
+     (through the shared embedding cache) and its nearest neighbours are
+     found with blocked matrix products over unit vectors (restricted to
+     the nearest k-means cells for large vocabularies). In order of
+     frequency, a term joins the most similar earlier cluster leader with
+     cosine >= SIM_THRESHOLD, or becomes a leader itself. Only leaders absorb
+     terms, so clusters do not chain from one topic into another.
+
+The map is persisted in out_main/skill_vocab.json and grown incrementally:
+known strings keep their skill id, and new strings are only compared
+against the existing leaders and each other. A skill id is derived from its
+leader's normalized form. Its label is the leader's most frequent spelling.
+
+2_skill_extractor.py counts skills by id and shows the label in top_skills.
+
+Usage:
+  python skill_vocab.py                     # update the vocabulary from the corpus
+  python skill_vocab.py --rebuild           # recluster every term
+  python skill_vocab.py --threshold 0.8     # (with --rebuild) looser clusters
+"""
+import re
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from corpus_store import CORPUS_PATH, open_corpus
+from embedding_store import EMBED_MODEL, EmbeddingStore
+
+SKILL_VOCAB_PATH = Path("out_main/skill_vocab.json")
+IN_DIR = Path("out_main/json")     # fallback when there is no corpus store (CORPUS_PATH)
+SIM_THRESHOLD = 0.85               # cosine similarity to join a cluster leader
+NEIGHBORS = 8                      # nearest neighbours considered per term
+BLOCK_BYTES = 256 * 1024 * 1024    # similarity block size (query rows x candidates, float32)
+EXACT_LIMIT = 20000                # above this many terms, search k-means cells instead of all pairs
+NPROBE = 3                         # nearest cells searched per term
+KMEANS_SAMPLE = 50000              # rows used to fit the cell centroids
+KMEANS_ITERS = 8
+EMBED_BATCH = 4096                 # terms sent to the embedding store per call
+
+_SPACE = re.compile(r"\s+")
+_EDGE = re.compile(r"^[\W_]+|[\W_]+$")
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is", "ics")):
+        return word[:-1]
+    return word
+
+
+def surface_key(term: str) -> str:
+    """Normalized form: lower case, single spaces, no edge punctuation, last word singular."""
+    text = _EDGE.sub("", _SPACE.sub(" ", term.strip().lower()))
+    if not text:
+        return ""
+    head, _, last = text.rpartition(" ")
+    return f"{head} {_singular(last)}" if head else _singular(last)
+
+
+def skill_id(key: str) -> str:
+    return "S" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+
+
+def _top_k(sims: np.ndarray, cols: np.ndarray, k: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k columns per row of `sims` as (cols[...] indices, sims), best first; -1 below threshold."""
+    k = min(k, sims.shape[1])
+    rows = np.arange(sims.shape[0])[:, None]
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < sims.shape[1] else \
+        np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    top_sims = sims[rows, top]
+    order = np.argsort(-top_sims, axis=1, kind="stable")
+    top, top_sims = top[rows, order], top_sims[rows, order]
+    keep = top_sims >= threshold
+    return np.where(keep, cols[top], -1), np.where(keep, top_sims, 0.0).astype(np.float32)
+
+
+def _kmeans(vecs: np.ndarray, n_cells: int) -> np.ndarray:
+    """Spherical k-means centroids (unit rows) from a fixed-seed sample, so runs are reproducible."""
+    rng = np.random.default_rng(0)
+    sample = vecs[np.sort(rng.choice(len(vecs), min(len(vecs), KMEANS_SAMPLE), replace=False))]
+    centroids = sample[rng.choice(len(sample), n_cells, replace=False)]
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=n_cells) == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def nearest_neighbors(queries: np.ndarray, candidates: np.ndarray, k: int,
+                      threshold: float, exclude_offset: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k candidates per query row by cosine (unit vectors), as (indices,
+    sims) of shape (n, k); entries below `threshold` have index -1. With
+    exclude_offset, query row i is candidate row exclude_offset + i and is
+    skipped (a term is not its own neighbour).
+
+    Up to EXACT_LIMIT candidates every pair is scored in blocks. Beyond
+    that, candidates are split into ~sqrt(m) k-means cells and each query
+    is only scored against the members of its NPROBE nearest cells.
+    """
+    n, m = len(queries), len(candidates)
+    k = min(k, m)
+    if n == 0 or k == 0:
+        return np.full((n, k), -1, dtype=np.int64), np.zeros((n, k), dtype=np.float32)
+    self_col = None if exclude_offset is None else exclude_offset + np.arange(n)
+
+    if m <= EXACT_LIMIT:
+        idx = np.full((n, k), -1, dtype=np.int64)
+        sims = np.zeros((n, k), dtype=np.float32)
+        step = max(1, BLOCK_BYTES // (4 * m))
+        for start in range(0, n, step):
+            block = queries[start:start + step] @ candidates.T
+            if self_col is not None:
+                block[np.arange(len(block)), self_col[start:start + step]] = -np.inf
+            idx[start:start + step], sims[start:start + step] = _top_k(block, np.arange(m), k, threshold)
+        return idx, sims
+
+    centroids = _kmeans(candidates, int(np.sqrt(m)))
+    cell_of = np.concatenate([np.argmax(candidates[i:i + EMBED_BATCH] @ centroids.T, axis=1)
+                              for i in range(0, m, EMBED_BATCH)])
+    probes = np.concatenate([np.argsort(-(queries[i:i + EMBED_BATCH] @ centroids.T), axis=1)[:, :NPROBE]
+                             for i in range(0, n, EMBED_BATCH)])
+    order = np.argsort(cell_of, kind="stable")
+    bounds = np.searchsorted(cell_of[order], np.arange(len(centroids) + 1))
+
+    # one slot of k results per probe, merged at the end
+    buf_idx = np.full((n, probes.shape[1] * k), -1, dtype=np.int64)
+    buf_sims = np.zeros((n, probes.shape[1] * k), dtype=np.float32)
+    for p in range(probes.shape[1]):
+        q_order = np.argsort(probes[:, p], kind="stable")
+        q_bounds = np.searchsorted(probes[q_order, p], np.arange(len(centroids) + 1))
+        for c in range(len(centroids)):
+            qs, members = q_order[q_bounds[c]:q_bounds[c + 1]], order[bounds[c]:bounds[c + 1]]
+            if not len(qs) or not len(members):
+                continue
+            block = queries[qs] @ candidates[members].T
+            if self_col is not None:
+                block[self_col[qs][:, None] == members[None, :]] = -np.inf
+            got_idx, got_sims = _top_k(block, members, k, threshold)
+            buf_idx[qs, p * k:p * k + got_idx.shape[1]] = got_idx
+            buf_sims[qs, p * k:p * k + got_idx.shape[1]] = got_sims
+    buf_sims[buf_idx < 0] = -np.inf
+    idx, sims = _top_k(buf_sims, np.arange(buf_sims.shape[1]), k, threshold)
+    rows = np.arange(n)[:, None]
+    return np.where(idx >= 0, buf_idx[rows, np.maximum(idx, 0)], -1), sims
+
+
+class SkillVocab:
+    """Raw skill string -> skill id, skill id -> label / leader key."""
+
+    def __init__(self, skills: Optional[Dict[str, str]] = None, labels: Optional[Dict[str, str]] = None,
+                 leaders: Optional[Dict[str, str]] = None, model: str = EMBED_MODEL,
+                 threshold: float = SIM_THRESHOLD):
+        self.skills = dict(skills or {})
+        self.labels = dict(labels or {})
+        self.leaders = dict(leaders or {})
+        self.model = model
+        self.threshold = threshold
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def skill_of(self, term: str) -> Optional[str]:
+        return self.skills.get(term)
+
+    def label(self, sid: str) -> str:
+        return self.labels.get(sid, sid)
+
+    def is_known(self, term: str) -> bool:
+        """False for terms update() would still have to assign."""
+        return term in self.skills or not surface_key(term)
+
+    def update(self, term_counts: Dict[str, int], store: Optional[EmbeddingStore] = None) -> Dict[str, int]:
+        """
+        Assign skill ids to every unseen term in `term_counts`; returns counts of
+        what was done. The embedding store is only opened (default model) when
+        some term matches no existing spelling.
+        """
+        key_skill = {surface_key(t): sid for t, sid in self.skills.items()}
+        new_keys: Dict[str, List[str]] = defaultdict(list)
+        by_surface = 0
+        for term in sorted(term_counts):
+            if term in self.skills:
+                continue
+            key = surface_key(term)
+            if not key:
+                continue
+            if key in key_skill:
+                self.skills[term] = key_skill[key]
+                by_surface += 1
+            else:
+                new_keys[key].append(term)
+
+        stats = {"terms": len(term_counts), "surface": by_surface, "joined": 0, "new_skills": 0}
+        if not new_keys:
+            return stats
+
+        # most frequent first: frequent spellings become the leaders
+        weight = {k: sum(term_counts[t] for t in terms) for k, terms in new_keys.items()}
+        keys = sorted(new_keys, key=lambda k: (-weight[k], k))
+        old_ids = sorted(self.leaders)
+        old_keys = [self.leaders[sid] for sid in old_ids]
+
+        vecs = self._embed(old_keys + keys, store or EmbeddingStore(self.model))
+        idx, _ = nearest_neighbors(vecs[len(old_keys):], vecs, NEIGHBORS, self.threshold, exclude_offset=len(old_keys))
+
+        # candidate row j: existing leader (j < len(old_keys)) or new key j - len(old_keys)
+        owner: List[Optional[str]] = old_ids + [None] * len(keys)
+        is_leader = np.zeros(len(owner), dtype=bool)
+        is_leader[:len(old_keys)] = True
+        for i, key in enumerate(keys):
+            # best match among leaders so far (later keys are not leaders yet)
+            hit = next((j for j in idx[i] if j >= 0 and is_leader[j]), None)
+            if hit is not None:
+                sid = owner[hit]
+                stats["joined"] += 1
+            else:
+                sid = skill_id(key)
+                self.leaders[sid] = key
+                self.labels[sid] = min(new_keys[key], key=lambda t: (-term_counts[t], len(t), t))
+                is_leader[len(old_keys) + i] = True
+                stats["new_skills"] += 1
+            owner[len(old_keys) + i] = sid
+            for term in new_keys[key]:
+                self.skills[term] = sid
+        return stats
+
+    @staticmethod
+    def _embed(texts: List[str], store: EmbeddingStore) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, store.dim or 1), dtype=np.float32)
+        vecs = np.concatenate([store.encode(texts[i:i + EMBED_BATCH]) for i in range(0, len(texts), EMBED_BATCH)])
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.where(norms > 0, norms, 1.0)
+
+    def members(self) -> Dict[str, List[str]]:
+        """Skill id -> raw strings mapped to it."""
+        out: Dict[str, List[str]] = defaultdict(list)
+        for term, sid in sorted(self.skills.items()):
+            out[sid].append(term)
+        return dict(out)
+
+    def save(self, path: Path = SKILL_VOCAB_PATH) -> None:
+        data = {
+            "model": self.model,
+            "threshold": self.threshold,
+            "skills": dict(sorted(self.skills.items())),
+            "labels": dict(sorted(self.labels.items())),
+            "leaders": dict(sorted(self.leaders.items())),
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = SKILL_VOCAB_PATH) -> "SkillVocab":
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["skills"], data["labels"], data["leaders"], data["model"], data["threshold"])
+
+
+def build_skill_vocab(corpus, path: Path = SKILL_VOCAB_PATH, rebuild: bool = False,
+                      threshold: float = SIM_THRESHOLD) -> Tuple[SkillVocab, Dict[str, int]]:
+    """Load the vocabulary, add every unseen keyword / category in the corpus, save it."""
+    counts: Dict[str, int] = defaultdict(int)
+    for keywords, categories in corpus.iter_columns("keywords", "categories"):
+        for term in set(keywords) | set(categories):
+            counts[term] += 1
+
+    vocab = SkillVocab.load(path)
+    fresh = rebuild or vocab.model != EMBED_MODEL or not path.exists()
+    if fresh:
+        vocab = SkillVocab(model=EMBED_MODEL, threshold=threshold)
+    stats = vocab.update(counts)
+    if fresh or stats["surface"] or stats["joined"] or stats["new_skills"]:
+        vocab.save(path)
+    return vocab, stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=f"Build or update the skill vocabulary in {SKILL_VOCAB_PATH}.")
+    ap.add_argument("--rebuild", action="store_true", help="recluster every term from scratch")
+    ap.add_argument("--threshold", type=float, default=SIM_THRESHOLD,
+                    help="cosine similarity needed to join a cluster (used with --rebuild)")
+    ap.add_argument("--show", type=int, default=20, metavar="N", help="print the N largest clusters")
+    args = ap.parse_args()
+
+    corpus = open_corpus(CORPUS_PATH, IN_DIR)
+    if corpus is None:
+        raise SystemExit(f"Missing input: neither {CORPUS_PATH} nor {IN_DIR} exists")
+    t0 = time.perf_counter()
+    vocab, stats = build_skill_vocab(corpus, rebuild=args.rebuild, threshold=args.threshold)
+    print(f"{stats['terms']} terms -> {len(vocab)} skills in {time.perf_counter() - t0:.1f}s "
+          f"(new: {stats['surface']} by spelling, {stats['joined']} by embedding, "
+          f"{stats['new_skills']} new skills; threshold {vocab.threshold}) -> {SKILL_VOCAB_PATH}")
+    groups = sorted(vocab.members().items(), key=lambda kv: (-len(kv[1]), kv[0]))
+    for sid, terms in groups[:args.show]:
+        if len(terms) > 1:
+            print(f"  {vocab.label(sid)}: " + ", ".join(t for t in terms if t != vocab.label(sid)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the pipeline is a set of root-level scripts, not a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
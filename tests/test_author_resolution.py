@@ -0,0 +1,27 @@
+from author_resolution import AuthorMap
+
+
+def make_map():
+    return AuthorMap({
+        "J. Smith": "J. Smith",
+        "Smith, J.": "J. Smith",
+        "José García": "José García",
+        "Alice Roberts": "Alice Roberts",
+        "Andrew Roberts": "Andrew Roberts",
+    })
+
+
+def test_lookup_normalizes_typed_names():
+    amap = make_map()
+    assert amap.lookup("J. Smith") == "J. Smith"
+    assert amap.lookup("j. smith") == "J. Smith"
+    assert amap.lookup("J Smith") == "J. Smith"
+    assert amap.lookup("Jose Garcia") == "José García"
+    assert amap.lookup("jose garcia") == "José García"
+    assert amap.lookup("J. Garcia") == "José García"     # the one compatible person in the block
+
+
+def test_lookup_leaves_ambiguous_and_unknown_names_alone():
+    amap = make_map()
+    assert amap.lookup("A. Roberts") == "A. Roberts"
+    assert amap.lookup(" Ada Lovelace ") == "Ada Lovelace"
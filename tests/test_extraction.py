@@ -0,0 +1,68 @@
+import json
+import importlib
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+extractor = importlib.import_module("1_initial_script")
+
+
+class Reply:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+def ollama(title, fake=False):
+    def post(url, json=None, timeout=None):
+        body = {"response": _answer(title), "done": True}
+        if fake:
+            body["fake"] = True
+        return Reply(body)
+    return post
+
+
+def _answer(title):
+    return json.dumps({"title": title, "authors": ["Ada Lovelace"], "year": 2020, "abstract": None,
+                       "keywords": [], "categories": []})
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # out/ paths are relative
+    monkeypatch.setattr(extractor, "_corpus", None)
+    monkeypatch.setattr(extractor, "_page_cache", None)
+    monkeypatch.setattr(extractor, "_llm_cache", None)
+    monkeypatch.setattr(extractor, "_near_dup", None)
+    extractor.ensure_dirs()
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Notes on the analytical engine, with no front matter.")
+    doc.save(str(tmp_path / "paper.pdf"))
+    yield tmp_path
+    extractor.get_corpus().close()
+    extractor.get_page_cache().close()
+
+
+def test_fake_answers_are_re_extracted_by_a_real_run(workdir, monkeypatch):
+    pdf = str(workdir / "paper.pdf")
+    config_hash = extractor.extraction_config_hash()
+
+    monkeypatch.setattr(extractor.requests, "post", ollama("Canned", fake=True))
+    manifest = extractor.Manifest(extractor.OUT_MANIFEST)
+    merged = extractor.process_pdf(pdf, manifest, config_hash)
+    assert merged["front"]["title"] == "Canned"
+    assert not manifest.is_current(pdf, config_hash)
+    assert extractor.load_current_result(merged["id"], config_hash) is None
+
+    monkeypatch.setattr(extractor.requests, "post", ollama("The Real Title"))
+    manifest = extractor.Manifest(extractor.OUT_MANIFEST)
+    merged = extractor.process_pdf(pdf, manifest, config_hash)
+    assert merged["front"]["title"] == "The Real Title"
+    assert manifest.is_current(pdf, config_hash)
+    assert extractor.load_current_result(merged["id"], config_hash)["front"]["title"] == "The Real Title"
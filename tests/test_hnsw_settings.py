@@ -0,0 +1,48 @@
+import importlib
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+import vector_store
+from vector_store import ChromaStore, hnsw_metadata
+
+build = importlib.import_module("3_build_chroma_index")
+
+
+def build_args(*argv):
+    return build.make_parser().parse_args(list(argv))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_chroma_clients", {})
+    s = ChromaStore("projects", create=True, hnsw=hnsw_metadata(), path=tmp_path)
+    s.upsert(ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]], metadatas=[{"x": 1}, {"x": 2}])
+    return s
+
+
+def test_incremental_build_keeps_tuned_search_ef(store):
+    store.set_search_params(search_ef=37)      # as tuned with tune_hnsw.py
+    build.check_hnsw(store, build_args())
+    assert store.hnsw["search_ef"] == 37
+
+
+def test_explicit_search_ef_is_applied(store):
+    build.check_hnsw(store, build_args("--search-ef", "64"))
+    assert store.hnsw["search_ef"] == 64
+
+
+def test_tune_measures_the_persisted_index(tmp_path):
+    import chromadb
+    import numpy as np
+
+    tune = importlib.import_module("tune_hnsw")
+    n, dim, m = 2500, 32, 16
+    base = np.random.default_rng(0).normal(size=(n, dim)).astype(np.float32)
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    col, _, size = tune.build_collection(client, tmp_path, "tune_test", hnsw_metadata(m=m), base)
+    assert col.count() == n
+    # hnswlib's level 0 holds every vector plus 2*M links per element; an
+    # index synced only up to the last sync_threshold multiple is smaller
+    assert size >= n * (dim * 4 + 2 * m * 4)
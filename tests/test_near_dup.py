@@ -0,0 +1,31 @@
+import numpy as np
+
+from near_dup import MIN_WORDS, NearDupIndex, signature
+
+
+def text(seed, n=400):
+    words = np.random.default_rng(seed).integers(0, 5000, n)
+    return " ".join(f"w{w}" for w in words)
+
+
+def test_revised_version_matches_its_original(tmp_path):
+    index = NearDupIndex(str(tmp_path / "near_dup.sqlite"))
+    original = text(0)
+    index.add("a", signature(original))
+    index.add("b", signature(text(1)))
+
+    revised = original.split()
+    revised[200:205] = ["errata"] * 5
+    match = index.find(signature(" ".join(revised)))
+    assert match is not None and match[0] == "a"
+    assert index.find(signature(text(2))) is None
+    assert index.find(signature(original), exclude="a") is None
+
+    index.add_version("a2", "a", "v2.pdf", match[1])
+    assert "a2" in index
+    assert index.groups() == {"a": [("a2", "v2.pdf", match[1])]}
+    index.close()
+
+
+def test_short_texts_are_never_signed():
+    assert signature(" ".join(["word"] * (MIN_WORDS - 1))) is None
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import ExactStore
+
+
+def unit_vectors(n, dim=8, seed=0):
+    vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def ids_of(n, start=0):
+    return [f"p{i}" for i in range(start, start + n)]
+
+
+def test_torn_upsert_leaves_committed_rows_intact(tmp_path, monkeypatch):
+    store = ExactStore("t", create=True, root=tmp_path)
+    store.upsert(ids_of(10), unit_vectors(10), [{"n": i} for i in range(10)])
+
+    real_write = vector_store._write_rows
+
+    def crash_halfway(path, rows, data):
+        real_write(path, rows[:len(rows) // 2], data[:len(rows) // 2])
+        raise KeyboardInterrupt("killed mid-upsert")
+
+    monkeypatch.setattr(vector_store, "_write_rows", crash_halfway)
+    with pytest.raises(KeyboardInterrupt):
+        store.upsert(ids_of(4, 10), unit_vectors(4, seed=1), [{}] * 4)
+    monkeypatch.undo()
+
+    reopened = ExactStore("t", root=tmp_path)
+    assert reopened.count() == 10
+    res = reopened.query(unit_vectors(2, seed=2), 20)
+    assert sorted(res["ids"][0]) == sorted(ids_of(10))
+
+    # the orphan rows are reused, not appended after
+    reopened.upsert(ids_of(4, 10), unit_vectors(4, seed=1), [{}] * 4)
+    assert reopened.count() == 14
+    assert reopened.n_rows == 14
+    res = reopened.query(unit_vectors(4, seed=1), 1)
+    assert [hits[0] for hits in res["ids"]] == ids_of(4, 10)
+
+
+def test_orphan_vectors_on_disk_are_ignored(tmp_path):
+    store = ExactStore("t", create=True, root=tmp_path)
+    store.upsert(ids_of(10), unit_vectors(10), [{}] * 10)
+    with store.vectors_path.open("ab") as f:    # another writer appended, then died
+        f.write(unit_vectors(1, seed=3).astype(store.dtype).tobytes())
+
+    reopened = ExactStore("t", root=tmp_path)
+    assert reopened.count() == 10
+    res = reopened.query(unit_vectors(1, seed=3), 11)
+    assert len(res["ids"][0]) == 10
+
+
+def test_upsert_requantizes_when_codes_are_missing(tmp_path):
+    store = ExactStore("t", create=True, root=tmp_path)
+    vecs = unit_vectors(50, dim=16)
+    store.upsert(ids_of(50), vecs, [{}] * 50)
+    store.set_quantization("int8")
+    store.codes_path.unlink()    # lost, e.g. a crash during compaction
+
+    store.upsert(ids_of(1, 50), unit_vectors(1, dim=16, seed=1), [{}])
+    codes, scales = store.codes()
+    assert codes is not None and codes.shape == (51, 16)
+    assert np.abs(codes).sum(axis=1).min() > 0     # no zero-filled rows from a sparse file
+    res = store.query(vecs[:5], 1)
+    assert [hits[0] for hits in res["ids"]] == ids_of(5)
+
+
+def test_rescore_is_per_call(tmp_path):
+    store = ExactStore("t", create=True, root=tmp_path)
+    vecs = unit_vectors(200, dim=16)
+    store.upsert(ids_of(200), vecs, [{}] * 200)
+    store.set_quantization("binary")
+    queries = unit_vectors(5, dim=16, seed=4)
+
+    wide = store.query(queries, 5, rescore=40)      # 200 candidates: exact
+    assert store.rescore == vector_store.EXACT_RESCORE
+    exact = np.argsort(-(queries @ vecs.T), axis=1)[:, :5]
+    assert wide["ids"] == [[f"p{i}" for i in row] for row in exact]
+
+
+def test_sharded_filtered_paging_reads_only_up_to_the_page(tmp_path, monkeypatch):
+    shards = [ExactStore("t", create=True, root=tmp_path / f"s{k}") for k in range(3)]
+    store = vector_store.ShardedStore(shards)
+    n = 300
+    store.upsert(ids_of(n), unit_vectors(n), [{"n": i} for i in range(n)])
+    where = {"n": {"$gte": 100}}
+
+    fetched = []
+    real_get = ExactStore.get
+
+    def counting_get(self, *args, **kwargs):
+        out = real_get(self, *args, **kwargs)
+        fetched.append(len(out["ids"]))
+        return out
+
+    monkeypatch.setattr(ExactStore, "get", counting_get)
+    pages = []
+    while True:
+        fetched.clear()
+        page = store.get(include=["metadatas"], limit=25, offset=25 * len(pages), where=where)["ids"]
+        if not page:
+            break
+        assert sum(fetched) <= 25 * len(pages) + 25 + len(shards)
+        pages.append(page)
+
+    paged = [i for p in pages for i in p]
+    assert len(paged) == len(set(paged))
+    assert sorted(paged) == sorted(store.get(include=[], where=where)["ids"]) == sorted(ids_of(200, 100))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Sweep Chroma HNSW parameters on the real corpus vectors.
+
+Vectors are read from an existing collection (no re-embedding). A held-out
+sample of them is used as queries; the rest is indexed into scratch Chroma
+collections, one per (M, construction_ef, num_threads) combination, and each
+is queried at every search_ef. Exact NumPy search over the same vectors is
+the ground truth for recall@k.
+
+Reports per row: build time, index size on disk, p50/p99 single-query
+latency and recall@k. Chroma only writes the HNSW segment to disk every
+hnsw:sync_threshold additions, so scratch collections set it (and
+hnsw:batch_size) to the vector count: the whole index is built and persisted
+once, and the size is read from the collection's segment directory after. Put the chosen values in vector_store.py (HNSW_*) or
+pass them to 3_build_chroma_index.py (--hnsw-m, --construction-ef,
+--search-ef, --hnsw-threads).
+
+Usage:
+  python tune_hnsw.py
+  python tune_hnsw.py --collection chunks --m 16,32 --construction-ef 100,200 \
+                      --search-ef 20,50,100,200 --k 10 --queries 200 --out tune.jsonl
+"""
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import chromadb
+
+from vector_store import BACKENDS, VECTOR_BACKEND, hnsw_metadata, open_store, recall_at_k
+
+LOAD_PAGE = 5000
+ADD_BATCH = 1000
+
+
+def int_list(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def load_vectors(collection: str, backend: str, limit: int) -> np.ndarray:
+    """All (or the first `limit`) stored vectors of a collection as unit-length float32."""
+    store = open_store(collection, backend)
+    parts = []
+    n = 0
+    while not limit or n < limit:
+        page = store.get(include=["embeddings"], limit=LOAD_PAGE if not limit else min(LOAD_PAGE, limit - n), offset=n)
+        if not len(page["ids"]):
+            break
+        parts.append(np.asarray(page["embeddings"], dtype=np.float32))
+        n += len(page["ids"])
+    vecs = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+    return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+
+def exact_top_k(base: np.ndarray, queries: np.ndarray, k: int) -> List[List[str]]:
+    scores = queries @ base.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return [[str(i) for i in row] for row in top]
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def build_collection(client, scratch: Path, name: str, metadata: Dict, base: np.ndarray) -> Tuple[object, float, int]:
+    """
+    Index base into a new scratch collection; returns (collection, build
+    seconds, bytes of its persisted HNSW segment).
+    """
+    n = base.shape[0]
+    segments_before = {p for p in scratch.iterdir() if p.is_dir()}
+    t0 = time.perf_counter()
+    col = client.create_collection(
+        name=name,
+        metadata={**metadata, "hnsw:batch_size": max(n, 2), "hnsw:sync_threshold": max(n, 2)},
+        embedding_function=None,
+    )
+    ids = [str(i) for i in range(n)]
+    for i in range(0, n, ADD_BATCH):
+        col.add(ids=ids[i:i + ADD_BATCH], embeddings=base[i:i + ADD_BATCH].tolist())
+    build_s = time.perf_counter() - t0
+    size = sum(dir_size(p) for p in scratch.iterdir() if p.is_dir() and p not in segments_before)
+    return col, build_s, size
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Sweep HNSW parameters: build time, size, latency, recall@k.")
+    ap.add_argument("--collection", default="projects")
+    ap.add_argument("--backend", choices=BACKENDS, default=VECTOR_BACKEND, help="where to read vectors from")
+    ap.add_argument("--m", default="8,16,32", help="comma-separated HNSW M values")
+    ap.add_argument("--construction-ef", default="100,200")
+    ap.add_argument("--search-ef", default="10,20,50,100,200")
+    ap.add_argument("--threads", default="0", help="comma-separated num_threads values (0 = Chroma default)")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200, help="held-out vectors used as queries")
+    ap.add_argument("--limit", type=int, default=0, help="use only the first N vectors (0 = all)")
+    ap.add_argument("--out", help="also write one JSON line per setting")
+    args = ap.parse_args()
+
+    vecs = load_vectors(args.collection, args.backend, args.limit)
+    if vecs.shape[0] <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, found {vecs.shape[0]}")
+    rng = np.random.default_rng(0)
+    held = rng.choice(vecs.shape[0], size=args.queries, replace=False)
+    mask = np.ones(vecs.shape[0], dtype=bool)
+    mask[held] = False
+    base, queries = vecs[mask], vecs[held]
+    k = min(args.k, base.shape[0])
+    truth = exact_top_k(base, queries, k)
+    print(f"{args.collection}: {base.shape[0]} vectors x {base.shape[1]} dims, {len(queries)} queries, k={k}")
+
+    scratch = Path(tempfile.mkdtemp(prefix="tune_hnsw_", dir=str(Path("out_main"))))
+    client = chromadb.PersistentClient(path=str(scratch))
+    rows: List[Dict] = []
+    print(f"{'M':>4} {'c_ef':>5} {'thr':>4} {'build s':>8} {'size MB':>8} "
+          f"{'s_ef':>5} {'p50 ms':>7} {'p99 ms':>7} {'recall':>7}")
+    try:
+        for m in int_list(args.m):
+            for c_ef in int_list(args.construction_ef):
+                for threads in int_list(args.threads):
+                    name = f"tune_m{m}_c{c_ef}_t{threads}"
+                    col, build_s, size = build_collection(
+                        client, scratch, name,
+                        hnsw_metadata(m, c_ef, max(int_list(args.search_ef)), threads or None), base,
+                    )
+
+                    for s_ef in int_list(args.search_ef):
+                        try:
+                            col.modify(configuration={"hnsw": {"ef_search": s_ef}})
+                        except TypeError:   # chromadb < 1.0
+                            col.modify(metadata={"hnsw:search_ef": s_ef})
+                        col.query(query_embeddings=queries[:1].tolist(), n_results=k, include=[])  # warm
+                        found, lat = [], []
+                        for q in queries:
+                            t0 = time.perf_counter()
+                            res = col.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+                            lat.append(time.perf_counter() - t0)
+                            found.append(res["ids"][0])
+                        row = {
+                            "M": m, "construction_ef": c_ef, "num_threads": threads or None,
+                            "build_seconds": round(build_s, 3), "size_bytes": size, "search_ef": s_ef,
+                            "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 3),
+                            "p99_ms": round(float(np.percentile(lat, 99)) * 1000, 3),
+                            f"recall@{k}": round(recall_at_k(found, truth, k), 4),
+                        }
+                        rows.append(row)
+                        print(f"{m:>4} {c_ef:>5} {threads or '-':>4} {build_s:>8.2f} {size / 1e6:>8.2f} "
+                              f"{s_ef:>5} {row['p50_ms']:>7.2f} {row['p99_ms']:>7.2f} {row[f'recall@{k}']:>7.4f}")
+                    client.delete_collection(name)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        print(f"Wrote {len(rows)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
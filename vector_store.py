@@ -0,0 +1,1034 @@
+#!/usr/bin/env python3
+"""
+Vector store backends behind one small interface.
+
+Every collection ("projects", "authors", "chunks") is opened through
+open_store(), which returns an object with Chroma's collection API subset
+used here: count, get, upsert, delete and query (query by embeddings, cosine
+distance). Two backends:
+
+  chroma  Chroma's persistent HNSW index (out_main/chroma), approximate
+  exact   brute force over a memory-mapped float16/float32 matrix with
+          batched NumPy matmul + argpartition (out_main/exact); loads
+          instantly, has perfect recall, and is the ground truth for
+          measuring HNSW recall (python vector_store.py recall)
+
+Pick one with VECTOR_BACKEND below, the VECTOR_BACKEND environment variable,
+or --backend on 3_build_chroma_index.py / 4_query.py / query_server.py.
+
+Chroma's HNSW parameters are set from HNSW_* below: M and construction_ef
+when a collection is created (changing them needs --rebuild), search_ef and
+num_threads at any time (tune_hnsw.py sweeps them).
+
+Sharding (3_build_chroma_index.py --shards N --shard-by hash|year|category)
+splits every collection over N stores, each in its own directory
+(out_main/chroma_shard<i>, out_main/exact_shard<i>); the layout is recorded
+in out_main/shards.<backend>.json and picked up by open_store(). Writes are
+routed to their shard and sent to all shards concurrently; queries fan out
+to every shard in a thread pool and the per-shard top-n lists are merged
+into the exact global top-n.
+
+ExactStore layout (one directory per collection):
+  meta.json       {"dim", "dtype", "quantization"}
+  vectors.bin     row-major matrix of unit-length vectors (vectors.<g>.bin after
+                  the g-th compaction; the live generation is kept in rows.sqlite
+                  and switched in the same transaction that renumbers the rows)
+  codes.bin       int8 or sign-bit codes per row (quantized stores only)
+  scales.bin      float32 scale per row (int8 only)
+  rows.sqlite     rows(row, id, metadata, document) + dead(row) tombstones,
+                  plus the filter side index: tags(key, row) for True metadata
+                  flags and nums(key, value, row) for numeric fields, so a
+                  `where` filter becomes a set of rows and only those are scanned;
+                  rows.sqlite is the source of truth for the row count: an
+                  upsert writes its vectors, then commits its rows, all under
+                  one write lock, so a crash leaves only ignored rows past the end
+
+Quantized exact stores (3_build_chroma_index.py --backend exact --quantize
+int8|binary) keep only the codes in RAM for the first-stage scan; the best
+k * EXACT_RESCORE candidates are then rescored against the full vectors,
+which stay memory-mapped on disk and are only touched for those rows.
+
+Usage:
+  python vector_store.py recall [--collection projects] [--k 10] [--queries 200]
+  python vector_store.py quant  [--collection projects] [--k 10] [--queries 200]
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from search_filters import CATEGORY_PREFIX, YEAR_FIELD
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")   # "chroma" or "exact"
+BACKENDS = ("chroma", "exact")
+PERSIST_DIR = Path("out_main/chroma")
+EXACT_DIR = Path("out_main/exact")
+EXACT_DTYPE = "float16"      # "float32" doubles memory for ~no recall gain
+EXACT_BLOCK = 16384          # matrix rows scored per matmul block
+COMPACT_DEAD_FRACTION = 0.25 # rewrite vectors.bin once this share of rows is deleted
+QUANTIZATIONS = ("none", "int8", "binary")
+EXACT_RESCORE = 4            # quantized stores rescore k * EXACT_RESCORE candidates
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# HNSW (chroma backend); the values are Chroma's defaults
+HNSW_M = 16                  # graph degree: recall and memory grow with it
+HNSW_CONSTRUCTION_EF = 100   # build-time beam width: recall and build time grow with it
+HNSW_SEARCH_EF = 100         # query-time beam width: recall and latency grow with it
+HNSW_NUM_THREADS = None      # None = Chroma's default (all cores)
+
+# Sharding
+SHARD_KEYS = ("hash", "year", "category")
+SHARD_WORKERS = os.cpu_count() or 4   # threads for concurrent shard writes / queries
+
+_chroma_clients: Dict[str, object] = {}
+
+
+def hnsw_metadata(m: int = HNSW_M, construction_ef: int = HNSW_CONSTRUCTION_EF,
+                  search_ef: int = HNSW_SEARCH_EF, num_threads: Optional[int] = HNSW_NUM_THREADS) -> Dict:
+    """Collection metadata for a new Chroma collection."""
+    meta = {
+        # cosine distance is better for text embeddings
+        "hnsw:space": "cosine",
+        "hnsw:M": int(m),
+        "hnsw:construction_ef": int(construction_ef),
+        "hnsw:search_ef": int(search_ef),
+    }
+    if num_threads:
+        meta["hnsw:num_threads"] = int(num_threads)
+    return meta
+
+
+def store_path(backend: str = VECTOR_BACKEND) -> Path:
+    return PERSIST_DIR if backend == "chroma" else EXACT_DIR
+
+
+def store_paths(backend: str = VECTOR_BACKEND) -> List[Path]:
+    """Directory of every shard (just store_path when not sharded)."""
+    n = load_shard_config(backend)["shards"]
+    base = store_path(backend)
+    return [base] if n == 1 else [base.with_name(f"{base.name}_shard{i}") for i in range(n)]
+
+
+def shard_config_path(backend: str = VECTOR_BACKEND) -> Path:
+    return PERSIST_DIR.parent / f"shards.{backend}.json"
+
+
+def load_shard_config(backend: str = VECTOR_BACKEND) -> Dict:
+    path = shard_config_path(backend)
+    if not path.exists():
+        return {"shards": 1, "by": "hash"}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_shard_config(backend: str, shards: int, by: str = "hash") -> None:
+    """Record the shard layout of a backend; call only on an empty (dropped) index."""
+    if by not in SHARD_KEYS:
+        raise ValueError(f"unknown shard key: {by} (expected one of {SHARD_KEYS})")
+    path = shard_config_path(backend)
+    if shards <= 1:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"shards": int(shards), "by": by}, f)
+
+
+def _chroma_client(path: Path = PERSIST_DIR):
+    import chromadb
+
+    key = str(path)
+    if key not in _chroma_clients:
+        _chroma_clients[key] = chromadb.PersistentClient(path=key)
+    return _chroma_clients[key]
+
+
+def _open_one(name: str, backend: str, create: bool, embed_fn, hnsw: Optional[Dict], path: Path):
+    if backend == "chroma":
+        return ChromaStore(name, create, embed_fn, hnsw, path)
+    if backend == "exact":
+        return ExactStore(name, create, root=path)
+    raise ValueError(f"unknown vector backend: {backend} (expected one of {BACKENDS})")
+
+
+def open_store(name: str, backend: str = VECTOR_BACKEND, create: bool = False, embed_fn=None,
+               hnsw: Optional[Dict] = None):
+    """
+    The named collection in the chosen backend (a ShardedStore if the backend
+    is sharded). Raises if it does not exist and create is False. embed_fn is
+    recorded by Chroma with the collection; hnsw (see hnsw_metadata) is used
+    when Chroma creates it.
+    """
+    paths = store_paths(backend)
+    if len(paths) == 1:
+        return _open_one(name, backend, create, embed_fn, hnsw, paths[0])
+    return ShardedStore([_open_one(name, backend, create, embed_fn, hnsw, p) for p in paths],
+                        load_shard_config(backend)["by"])
+
+
+def drop_store(name: str, backend: str = VECTOR_BACKEND) -> None:
+    for path in store_paths(backend):
+        if backend == "chroma":
+            try:
+                _chroma_client(path).delete_collection(name)
+            except Exception:
+                pass
+        else:
+            d = path / name
+            if d.exists():
+                for p in d.iterdir():
+                    p.unlink()
+                d.rmdir()
+
+
+class ChromaStore:
+    """Thin wrapper over a Chroma collection (HNSW, cosine space)."""
+
+    backend = "chroma"
+
+    def __init__(self, name: str, create: bool = False, embed_fn=None, hnsw: Optional[Dict] = None,
+                 path: Path = PERSIST_DIR):
+        from embedding_store import CachedEmbeddingFunction
+
+        client = _chroma_client(path)
+        embed_fn = embed_fn or CachedEmbeddingFunction()
+        if create:
+            self.collection = client.get_or_create_collection(
+                name=name,
+                embedding_function=embed_fn,
+                metadata=hnsw or hnsw_metadata(),
+            )
+        else:
+            self.collection = client.get_collection(name=name, embedding_function=embed_fn)
+        self.name = name
+
+    @property
+    def hnsw(self) -> Dict:
+        """Effective HNSW parameters (as persisted by Chroma)."""
+        md = self.collection.metadata or {}
+        # raw JSON: .configuration would instantiate the persisted embedding function
+        conf = (getattr(self.collection, "configuration_json", None) or {}).get("hnsw") or {}
+        return {
+            "M": conf.get("max_neighbors", md.get("hnsw:M", HNSW_M)),
+            "construction_ef": conf.get("ef_construction", md.get("hnsw:construction_ef", HNSW_CONSTRUCTION_EF)),
+            "search_ef": conf.get("ef_search", md.get("hnsw:search_ef", HNSW_SEARCH_EF)),
+            "num_threads": conf.get("num_threads", md.get("hnsw:num_threads")),
+        }
+
+    def set_search_params(self, search_ef: Optional[int] = None, num_threads: Optional[int] = None) -> None:
+        """Change query-time HNSW parameters of the (persisted) collection."""
+        current = self.hnsw
+        update = {}
+        if search_ef and current["search_ef"] != search_ef:
+            update["ef_search"] = int(search_ef)
+        if num_threads and current["num_threads"] != num_threads:
+            update["num_threads"] = int(num_threads)
+        if not update:
+            return
+        try:
+            self.collection.modify(configuration={"hnsw": update})
+        except TypeError:   # chromadb < 1.0: parameters live in the metadata
+            md = dict(self.collection.metadata or {})
+            md.pop("hnsw:space", None)  # may not be re-set
+            if "ef_search" in update:
+                md["hnsw:search_ef"] = update["ef_search"]
+            if "num_threads" in update:
+                md["hnsw:num_threads"] = update["num_threads"]
+            self.collection.modify(metadata=md)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get(self, ids=None, include=("metadatas",), limit=None, offset=None, where=None) -> Dict:
+        return self.collection.get(ids=ids, include=list(include), limit=limit, offset=offset, where=where)
+
+    def upsert(self, ids, embeddings, metadatas, documents=None) -> None:
+        self.collection.upsert(ids=ids, embeddings=_as_lists(embeddings), metadatas=metadatas, documents=documents)
+
+    def delete(self, ids) -> None:
+        self.collection.delete(ids=ids)
+
+    def query(self, query_embeddings, n_results: int, include=("metadatas", "distances"), where=None,
+              rescore: Optional[int] = None) -> Dict:
+        """where (see search_filters.py) is applied by Chroma before the kNN search; rescore is ignored."""
+        return self.collection.query(
+            query_embeddings=_as_lists(query_embeddings),
+            n_results=n_results,
+            include=list(include),
+            where=where,
+        )
+
+    def compact(self) -> None:
+        pass
+
+
+def _as_lists(vectors):
+    return vectors.tolist() if isinstance(vectors, np.ndarray) else vectors
+
+
+class ExactStore:
+    """Exact cosine kNN over a memory-mapped matrix; ids and metadata in SQLite."""
+
+    backend = "exact"
+
+    def __init__(self, name: str, create: bool = False, dtype: str = EXACT_DTYPE, root: Path = EXACT_DIR):
+        self.name = name
+        self.dir = root / name
+        if not self.dir.exists():
+            if not create:
+                raise ValueError(f"Collection {name} does not exist in {root}")
+            self.dir.mkdir(parents=True)
+        self.meta_path = self.dir / "meta.json"
+
+        self.codes_path = self.dir / "codes.bin"
+        self.scales_path = self.dir / "scales.bin"
+
+        self.dim: Optional[int] = None
+        self.dtype = np.dtype(dtype)
+        self.quantization = "none"
+        self.rescore = EXACT_RESCORE
+        if self.meta_path.exists():
+            with self.meta_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.quantization = meta.get("quantization", "none")
+
+        self._conn = sqlite3.connect(str(self.dir / "rows.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, metadata TEXT, document TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dead (row INTEGER PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tags (key TEXT NOT NULL, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nums (key TEXT NOT NULL, value REAL NOT NULL, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tags_key ON tags (key, row)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tags_row ON tags (row)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nums_key ON nums (key, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nums_row ON nums (row)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()
+        self.generation = row[0] if row else 0
+        self.vectors_path = self._vectors_file(self.generation)
+        for stale in self.dir.glob("vectors*.bin"):
+            if stale != self.vectors_path:    # left behind by a compaction that crashed
+                stale.unlink()
+        self._matrix: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._load_dead()
+
+    def _vectors_file(self, generation: int) -> Path:
+        return self.dir / ("vectors.bin" if generation == 0 else f"vectors.{generation}.bin")
+
+    def _save_meta(self) -> None:
+        with self.meta_path.open("w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "quantization": self.quantization}, f)
+
+    # ---- reading ----
+
+    def _load_dead(self) -> None:
+        self.dead = np.fromiter((r for (r,) in self._conn.execute("SELECT row FROM dead")), dtype=np.int64)
+
+    @property
+    def n_rows(self) -> int:
+        """
+        Committed rows, including deleted ones: one past the highest row in
+        rows.sqlite. vectors.bin may be longer (an upsert that crashed before
+        its commit); those rows are ignored and reused by the next upsert.
+        """
+        if self.dim is None or not self.vectors_path.exists():
+            return 0
+        top = self._conn.execute(
+            "SELECT MAX(m) FROM (SELECT MAX(row) AS m FROM rows UNION ALL SELECT MAX(row) FROM dead)"
+        ).fetchone()[0]
+        on_disk = self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+        return 0 if top is None else min(top + 1, on_disk)
+
+    def matrix(self) -> np.ndarray:
+        n = self.n_rows
+        if self._matrix is None or self._matrix.shape[0] != n:
+            if n == 0:
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+        return self._matrix
+
+    @property
+    def code_bytes(self) -> int:
+        return self.dim if self.quantization == "int8" else -(-self.dim // 8)
+
+    def _codes_cover(self, n: int) -> bool:
+        """True if the code (and scale) files hold the first n rows."""
+        if self.quantization == "none" or not self.codes_path.exists():
+            return False
+        if self.codes_path.stat().st_size < n * self.code_bytes:
+            return False
+        return self.quantization != "int8" or (
+            self.scales_path.exists() and self.scales_path.stat().st_size >= n * 4
+        )
+
+    def codes(self):
+        """(codes, scales) loaded into RAM, or (None, None) if missing or stale."""
+        if self.quantization == "none":
+            return None, None
+        n = self.n_rows
+        if self._codes is None or self._codes.shape[0] != n:
+            if not self._codes_cover(n):
+                return None, None   # written before quantization was enabled; compact() rebuilds
+            dtype = np.int8 if self.quantization == "int8" else np.uint8
+            codes = np.fromfile(self.codes_path, dtype=dtype, count=n * self.code_bytes)
+            self._codes = codes.reshape(n, self.code_bytes)
+            self._scales = np.fromfile(self.scales_path, dtype=np.float32, count=n) if self.quantization == "int8" else None
+        return self._codes, self._scales
+
+    def count(self) -> int:
+        return self.n_rows - int(self.dead.size)
+
+    def set_search_params(self, search_ef: Optional[int] = None, num_threads: Optional[int] = None) -> None:
+        pass    # exact search has no approximation knobs
+
+    def footprint(self) -> Dict[str, object]:
+        """Bytes on disk (memory-mapped, paged in on demand) vs bytes the first-stage scan keeps in RAM."""
+        vectors = self.n_rows * (self.dim or 0) * self.dtype.itemsize
+        codes = 0
+        if self.quantization != "none" and self.dim:
+            codes = self.n_rows * (self.code_bytes + (4 if self.quantization == "int8" else 0))
+        return {
+            "rows": self.count(),
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "quantization": self.quantization,
+            "vectors_bytes": vectors,
+            "scan_bytes": codes or vectors,
+        }
+
+    def _result(self, rows: List[tuple], include: Sequence[str]) -> Dict:
+        out = {"ids": [r[1] for r in rows]}
+        if "metadatas" in include:
+            out["metadatas"] = [json.loads(r[2]) if r[2] else None for r in rows]
+        if "documents" in include:
+            out["documents"] = [r[3] for r in rows]
+        if "embeddings" in include:
+            mat = self.matrix()
+            idx = np.array([r[0] for r in rows], dtype=np.int64)
+            out["embeddings"] = np.asarray(mat[idx], dtype=np.float32) if idx.size else np.zeros((0, self.dim or 0))
+        return out
+
+    def get(self, ids=None, include=("metadatas",), limit=None, offset=None, where=None) -> Dict:
+        cols = "row, id, metadata, document"
+        if where is not None:
+            rows = self._where_rows(where)
+            rows = rows[int(offset or 0):]
+            rows = rows[:int(limit)] if limit is not None else rows
+            by_row = self._fetch_rows(rows.tolist())
+            rows = [by_row[r] for r in rows.tolist() if r in by_row]
+            if ids is not None:
+                keep = set(ids)
+                rows = [r for r in rows if r[1] in keep]
+        elif ids is not None:
+            rows = []
+            ids = list(ids)
+            for i in range(0, len(ids), 500):   # SQLite parameter limit
+                part = ids[i:i + 500]
+                rows.extend(self._conn.execute(
+                    f"SELECT {cols} FROM rows WHERE id IN ({','.join('?' * len(part))})", part
+                ).fetchall())
+        else:
+            rows = self._conn.execute(
+                f"SELECT {cols} FROM rows ORDER BY row LIMIT ? OFFSET ?",
+                (-1 if limit is None else int(limit), int(offset or 0)),
+            ).fetchall()
+        return self._result(rows, include)
+
+    def _fetch_rows(self, rows: List[int]) -> Dict[int, tuple]:
+        by_row = {}
+        for i in range(0, len(rows), 500):   # SQLite parameter limit
+            part = rows[i:i + 500]
+            by_row.update((r[0], r) for r in self._conn.execute(
+                f"SELECT row, id, metadata, document FROM rows WHERE row IN ({','.join('?' * len(part))})", part
+            ))
+        return by_row
+
+    def _where_rows(self, where: Dict) -> np.ndarray:
+        """
+        Sorted live rows matching a Chroma-style where clause, from the side
+        index: {"$and": [...]}, {"$or": [...]}, {key: True} and numeric
+        {key: {"$eq"|"$ne"|"$gt"|"$gte"|"$lt"|"$lte": x}}.
+        """
+        def run(sql, params):
+            return np.fromiter((r for (r,) in self._conn.execute(sql, params)), dtype=np.int64)
+
+        parts = []
+        for key, cond in where.items():
+            if key in ("$and", "$or"):
+                subs = [self._where_rows(c) for c in cond]
+                combine = np.intersect1d if key == "$and" else np.union1d
+                rows = subs[0] if subs else np.zeros(0, dtype=np.int64)
+                for sub in subs[1:]:
+                    rows = combine(rows, sub)
+            else:
+                op, value = next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+                if value is True and op == "$eq":
+                    rows = run("SELECT row FROM tags WHERE key = ?", (key,))
+                elif isinstance(value, (int, float)) and not isinstance(value, bool) and op in _SQL_OPS:
+                    rows = run(f"SELECT row FROM nums WHERE key = ? AND value {_SQL_OPS[op]} ?", (key, value))
+                else:
+                    raise ValueError(f"unsupported filter for the exact backend: {{{key!r}: {cond!r}}}")
+            parts.append(np.unique(rows))
+        rows = parts[0] if parts else np.zeros(0, dtype=np.int64)
+        for part in parts[1:]:
+            rows = np.intersect1d(rows, part)
+        return rows
+
+    def _scan(self, q: np.ndarray, k: int, scores, rows: Optional[np.ndarray] = None) -> tuple:
+        """
+        Top-k (scores, rows) per query over all live rows, or only over the
+        given sorted rows; scores(q, idx) scores one block (a slice or rows).
+        """
+        nq = q.shape[0]
+        best_s = np.full((nq, 0), -np.inf, dtype=np.float32)
+        best_r = np.zeros((nq, 0), dtype=np.int64)
+        n = self.n_rows if rows is None else rows.size
+        for start in range(0, n, EXACT_BLOCK):
+            stop = min(start + EXACT_BLOCK, n)
+            if rows is None:
+                block = np.arange(start, stop)
+                s = scores(q, slice(start, stop))
+                dead = self.dead[(self.dead >= start) & (self.dead < stop)] - start
+                s[:, dead] = -np.inf
+            else:
+                block = rows[start:stop]    # deleted rows are not in the side index
+                s = scores(q, block)
+            kk = min(k, s.shape[1])
+            part = np.argpartition(-s, kk - 1, axis=1)[:, :kk]
+            cand_s = np.concatenate([best_s, np.take_along_axis(s, part, axis=1)], axis=1)
+            cand_r = np.concatenate([best_r, block[part]], axis=1)
+            if cand_s.shape[1] > k:
+                keep = np.argpartition(-cand_s, k - 1, axis=1)[:, :k]
+                cand_s = np.take_along_axis(cand_s, keep, axis=1)
+                cand_r = np.take_along_axis(cand_r, keep, axis=1)
+            best_s, best_r = cand_s, cand_r
+        order = np.argsort(-best_s, axis=1, kind="stable")
+        return np.take_along_axis(best_s, order, axis=1), np.take_along_axis(best_r, order, axis=1)
+
+    def _full_scores(self, q: np.ndarray, idx) -> np.ndarray:
+        return q @ np.asarray(self.matrix()[idx], dtype=np.float32).T
+
+    def _code_scores(self, q: np.ndarray, idx) -> np.ndarray:
+        codes, scales = self.codes()
+        if self.quantization == "int8":
+            return (q @ codes[idx].astype(np.float32).T) * scales[idx]
+        # binary: negated Hamming distance between sign bits
+        q_bits = np.packbits(q > 0, axis=1)
+        block = codes[idx]
+        return np.stack([
+            -POPCOUNT[np.bitwise_xor(block, qb)].sum(axis=1, dtype=np.int32) for qb in q_bits
+        ]).astype(np.float32)
+
+    def _rescore(self, q: np.ndarray, cand_s: np.ndarray, cand_r: np.ndarray, k: int) -> tuple:
+        """Exact scores for the candidates from the memory-mapped full vectors; keep the best k."""
+        mat = self.matrix()
+        best_s = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        best_r = np.zeros((q.shape[0], k), dtype=np.int64)
+        for i, (s, rows) in enumerate(zip(cand_s, cand_r)):
+            rows = np.sort(rows[s > -np.inf])   # sorted rows: sequential reads
+            exact = np.asarray(mat[rows], dtype=np.float32) @ q[i]
+            top = np.argsort(-exact, kind="stable")[:k]
+            best_s[i, :top.size] = exact[top]
+            best_r[i, :top.size] = rows[top]
+        return best_s, best_r
+
+    def query(self, query_embeddings, n_results: int, include=("metadatas", "distances"), where=None,
+              rescore: Optional[int] = None) -> Dict:
+        """
+        Exact top-n by cosine similarity; distances are 1 - similarity, like
+        Chroma's cosine space. Quantized stores scan the codes first and
+        rescore n * rescore candidates (this call's rescore, else the store's).
+        With where, only the matching rows are scanned.
+        """
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        subset = self._where_rows(where) if where is not None else None
+        n = self.count() if subset is None else int(subset.size)
+        k = min(int(n_results), n)
+        best_s = np.full((q.shape[0], 0), -np.inf, dtype=np.float32)
+        best_r = np.zeros((q.shape[0], 0), dtype=np.int64)
+
+        if k > 0:
+            if self.codes()[0] is not None:
+                factor = rescore or self.rescore
+                cand_s, cand_r = self._scan(q, min(k * factor, n), self._code_scores, subset)
+                best_s, best_r = self._rescore(q, cand_s, cand_r, k)
+            else:
+                best_s, best_r = self._scan(q, k, self._full_scores, subset)
+
+        out = {key: [] for key in ["ids", *include]}
+        for sims, rows in zip(best_s, best_r):
+            hits = [(int(r), float(s)) for r, s in zip(rows, sims) if s > -np.inf]
+            by_row = self._fetch_rows([r for r, _ in hits])
+            hits = [(r, s) for r, s in hits if r in by_row]    # deleted since the scan started
+            res = self._result([by_row[r] for r, _ in hits], include)
+            for key in res:
+                out[key].append(res[key])
+            if "distances" in include:
+                out["distances"].append([1.0 - s for _, s in hits])
+        return out
+
+    # ---- writing ----
+
+    def upsert(self, ids, embeddings, metadatas, documents=None) -> None:
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        if vecs.size == 0:
+            return
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            self._save_meta()
+        documents = documents if documents is not None else [None] * len(ids)
+
+        # Rows are allocated, written and committed under one write lock: a
+        # concurrent writer waits, and a crash before the commit leaves only
+        # uncommitted rows past n_rows, which the next upsert overwrites.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows, requantize = self._write_vectors(ids, vecs)
+            self._write_records(rows, ids, metadatas, documents)
+        except BaseException:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
+        self._matrix = None
+        self._codes = None
+        if requantize:
+            self._requantize()
+
+    def _write_vectors(self, ids, vecs: np.ndarray) -> tuple:
+        """
+        Allocate rows for new ids and write their vectors (and codes); returns
+        (rows, requantize). Codes are only written into a code file that covers
+        every committed row, else the whole store must be requantized.
+        """
+        n = self.n_rows
+        existing = self._rows_of(ids)
+        rows = []
+        next_row = n
+        for doc_id in ids:
+            row = existing.get(doc_id)
+            if row is None:
+                row = next_row
+                next_row += 1
+                existing[doc_id] = row
+            rows.append(row)
+
+        _write_rows(self.vectors_path, rows, vecs.astype(self.dtype))
+        requantize = False
+        if self.quantization != "none":
+            if self._codes_cover(n):
+                codes, scales = quantize(vecs, self.quantization)
+                _write_rows(self.codes_path, rows, codes)
+                if scales is not None:
+                    _write_rows(self.scales_path, rows, scales[:, None])
+            else:
+                requantize = True   # missing or short code file: extending it would zero-fill old rows
+        return rows, requantize
+
+    def _write_records(self, rows: List[int], ids, metadatas, documents) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO rows (row, id, metadata, document) VALUES (?, ?, ?, ?)",
+            [
+                (row, doc_id, json.dumps(md, ensure_ascii=False) if md is not None else None, doc)
+                for row, doc_id, md, doc in zip(rows, ids, metadatas, documents)
+            ],
+        )
+        self._unindex(rows)
+        tags, nums = [], []
+        for row, md in zip(rows, metadatas):
+            for key, value in (md or {}).items():
+                if value is True:
+                    tags.append((key, row))
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    nums.append((key, value, row))
+        self._conn.executemany("INSERT INTO tags (key, row) VALUES (?, ?)", tags)
+        self._conn.executemany("INSERT INTO nums (key, value, row) VALUES (?, ?, ?)", nums)
+
+    def _rows_of(self, ids) -> Dict[str, int]:
+        rows: Dict[str, int] = {}
+        ids = list(ids)
+        for i in range(0, len(ids), 500):   # SQLite parameter limit
+            part = ids[i:i + 500]
+            rows.update(self._conn.execute(
+                f"SELECT id, row FROM rows WHERE id IN ({','.join('?' * len(part))})", part
+            ).fetchall())
+        return rows
+
+    def delete(self, ids) -> None:
+        rows = list(self._rows_of(ids).values())
+        self._conn.executemany("DELETE FROM rows WHERE row = ?", [(r,) for r in rows])
+        self._conn.executemany("INSERT OR IGNORE INTO dead (row) VALUES (?)", [(r,) for r in rows])
+        self._unindex(rows)
+        self._conn.commit()
+        self._load_dead()
+
+    def _unindex(self, rows: Sequence[int]) -> None:
+        """Drop the filter side-index entries of these rows."""
+        self._conn.executemany("DELETE FROM tags WHERE row = ?", [(r,) for r in rows])
+        self._conn.executemany("DELETE FROM nums WHERE row = ?", [(r,) for r in rows])
+
+    def compact(self) -> None:
+        """
+        Rewrite the vectors without deleted rows once enough of them pile up;
+        refresh stale codes.
+
+        The compacted matrix goes to the next generation's file and the row
+        renumbering and the generation switch commit in one transaction, so
+        after a crash rows.sqlite always matches the file it names; the other
+        file is removed on the next open.
+        """
+        n = self.n_rows
+        if n and self.dead.size >= COMPACT_DEAD_FRACTION * n:
+            mat = self.matrix()
+            live = [r for (r,) in self._conn.execute("SELECT row FROM rows ORDER BY row")]
+            old_path = self.vectors_path
+            new_path = self._vectors_file(self.generation + 1)
+            with new_path.open("wb") as f:
+                for i in range(0, len(live), EXACT_BLOCK):
+                    f.write(np.asarray(mat[live[i:i + EXACT_BLOCK]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._matrix = None
+            del mat
+            # codes are derived from the vectors; rebuilt below (or by the next compact() after a crash)
+            self._codes = self._scales = None
+            self.codes_path.unlink(missing_ok=True)
+            self.scales_path.unlink(missing_ok=True)
+            # renumber rows 0..n_live-1 in the same order (via negatives to avoid collisions)
+            self._conn.execute("UPDATE rows SET row = -1 - row")
+            self._conn.executemany("UPDATE rows SET row = ? WHERE row = ?", [(i, -1 - r) for i, r in enumerate(live)])
+            self._conn.execute("CREATE TEMP TABLE remap (old INTEGER PRIMARY KEY, new INTEGER)")
+            self._conn.executemany("INSERT INTO remap (old, new) VALUES (?, ?)", [(r, i) for i, r in enumerate(live)])
+            for table in ("tags", "nums"):
+                self._conn.execute(f"UPDATE {table} SET row = (SELECT new FROM remap WHERE old = {table}.row)")
+            self._conn.execute("DROP TABLE remap")
+            self._conn.execute("DELETE FROM dead")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('generation', ?)", (self.generation + 1,)
+            )
+            self._conn.commit()
+            self.generation += 1
+            self.vectors_path = new_path
+            old_path.unlink(missing_ok=True)
+            self._load_dead()
+            self._requantize()
+        elif self.quantization != "none" and self.codes()[0] is None:
+            self._requantize()
+
+    def set_quantization(self, quantization: str) -> None:
+        """Switch the first-stage encoding; codes are rebuilt from the stored vectors."""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"unknown quantization: {quantization} (expected one of {QUANTIZATIONS})")
+        if quantization == self.quantization:
+            return
+        self.quantization = quantization
+        if self.dim is not None:
+            self._save_meta()
+        self._requantize()
+
+    def _requantize(self) -> None:
+        self._codes = self._scales = None
+        self.codes_path.unlink(missing_ok=True)
+        self.scales_path.unlink(missing_ok=True)
+        if self.quantization == "none" or not self.n_rows:
+            return
+        mat = self.matrix()
+        with self.codes_path.open("wb") as fc, self.scales_path.open("wb") as fs:
+            for start in range(0, mat.shape[0], EXACT_BLOCK):
+                codes, scales = quantize(mat[start:start + EXACT_BLOCK], self.quantization)
+                fc.write(codes.tobytes())
+                if scales is not None:
+                    fs.write(scales.tobytes())
+        if self.quantization != "int8":
+            self.scales_path.unlink()
+
+
+_SQL_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+class ShardedStore:
+    """
+    One collection split over several stores of the same backend. Ids are
+    placed by shard_of(); reads and queries fan out to all shards in a
+    thread pool and are merged (query: exact top-n of the per-shard top-n).
+    """
+
+    def __init__(self, shards: List, by: str = "hash"):
+        self.shards = shards
+        self.by = by
+        self.name = shards[0].name
+        self.backend = shards[0].backend
+        self._pool = ThreadPoolExecutor(max_workers=min(len(shards), SHARD_WORKERS))
+
+    def _map(self, fn, *per_shard_args) -> List:
+        """fn(shard, *args) on every shard concurrently, results in shard order."""
+        return list(self._pool.map(fn, self.shards, *per_shard_args))
+
+    @property
+    def hnsw(self) -> Dict:
+        return self.shards[0].hnsw
+
+    @property
+    def rescore(self) -> int:
+        return getattr(self.shards[0], "rescore", EXACT_RESCORE)
+
+    @rescore.setter
+    def rescore(self, factor: int) -> None:
+        for shard in self.shards:
+            shard.rescore = factor
+
+    def set_search_params(self, search_ef: Optional[int] = None, num_threads: Optional[int] = None) -> None:
+        for shard in self.shards:
+            shard.set_search_params(search_ef, num_threads)
+
+    def set_quantization(self, quantization: str) -> None:
+        self._map(lambda s: s.set_quantization(quantization))
+
+    def footprint(self) -> Dict[str, object]:
+        fps = [s.footprint() for s in self.shards]
+        out = dict(fps[0])
+        for key in ("rows", "vectors_bytes", "scan_bytes"):
+            out[key] = sum(fp[key] for fp in fps)
+        return out
+
+    def count(self) -> int:
+        return sum(self._map(lambda s: s.count()))
+
+    def get(self, ids=None, include=("metadatas",), limit=None, offset=None, where=None) -> Dict:
+        if ids is not None:
+            ids = list(ids)
+            groups = self._groups(ids)
+
+            def read(shard, g):
+                return shard.get(ids=[ids[i] for i in g], include=include, where=where) if g else None
+            return _concat([p for p in self._map(read, groups) if p is not None], include)
+
+        if limit is None and not offset:
+            return _concat(self._map(lambda s: s.get(include=include, where=where)), include)
+
+        # paging walks the shards in order; with a filter, a shard's matches
+        # are only counted as far as the skip (not listed in full per page)
+        parts = []
+        skip = int(offset or 0)
+        left = None if limit is None else int(limit)
+        for shard in self.shards:
+            if left is not None and left <= 0:
+                break
+            n = shard.count() if where is None else len(shard.get(include=[], limit=skip + 1, where=where)["ids"])
+            if skip >= n:
+                skip -= n
+                continue
+            page = shard.get(include=include, limit=left, offset=skip, where=where)
+            parts.append(page)
+            skip = 0
+            if left is not None:
+                left -= len(page["ids"])
+        return _concat(parts, include)
+
+    def _split(self, ids, metadatas) -> List[List[int]]:
+        """Positions of the docs that belong to each shard."""
+        groups: List[List[int]] = [[] for _ in self.shards]
+        for i, (doc_id, md) in enumerate(zip(ids, metadatas)):
+            groups[shard_of(doc_id, md, len(self.shards), self.by)].append(i)
+        return groups
+
+    def _groups(self, ids) -> List[List[int]]:
+        """Positions of the ids to look up in each shard: only their own with hash placement, else all."""
+        if self.by == "hash":
+            return self._split(ids, [None] * len(ids))
+        return [list(range(len(ids)))] * len(self.shards)
+
+    def _locate(self, ids: List[str]) -> List[Set[str]]:
+        """The ids stored in each shard (one id lookup per shard, concurrently)."""
+        return self._map(lambda s: set(s.get(ids=ids, include=[])["ids"]))
+
+    def upsert(self, ids, embeddings, metadatas, documents=None) -> None:
+        ids = list(ids)
+        groups = self._split(ids, metadatas)
+        if self.by != "hash":
+            # a changed year/category moves the doc: drop the old copy, only where it moved from
+            target = {ids[i]: k for k, g in enumerate(groups) for i in g}
+            moved = [sorted(d for d in found if target[d] != k) for k, found in enumerate(self._locate(ids))]
+            self._map(lambda s, m: s.delete(m) if m else None, moved)
+
+        def write(shard, g):
+            if g:
+                shard.upsert(
+                    ids=[ids[i] for i in g],
+                    embeddings=[embeddings[i] for i in g] if not isinstance(embeddings, np.ndarray) else embeddings[g],
+                    metadatas=[metadatas[i] for i in g],
+                    documents=[documents[i] for i in g] if documents is not None else None,
+                )
+        self._map(write, groups)
+
+    def delete(self, ids) -> None:
+        ids = list(ids)
+        self._map(lambda s, g: s.delete([ids[i] for i in g]) if g else None, self._groups(ids))
+
+    def compact(self) -> None:
+        self._map(lambda s: s.compact())
+
+    def query(self, query_embeddings, n_results: int, include=("metadatas", "distances"), where=None,
+              rescore: Optional[int] = None) -> Dict:
+        """Top-n from every shard concurrently, merged by distance into the global top-n."""
+        fields = [k for k in include if k != "distances"]
+        parts = self._map(lambda s: s.query(query_embeddings, n_results, [*fields, "distances"], where, rescore))
+        out = {key: [] for key in ["ids", *include]}
+        for qi in range(len(parts[0]["ids"])):
+            hits = [(d, p, j) for p in parts for j, d in enumerate(p["distances"][qi])]
+            hits.sort(key=lambda h: h[0])
+            hits = hits[:n_results]
+            out["ids"].append([p["ids"][qi][j] for _, p, j in hits])
+            for key in include:
+                if key == "distances":
+                    out[key].append([d for d, _, _ in hits])
+                else:
+                    out[key].append([p[key][qi][j] for _, p, j in hits])
+        return out
+
+
+def shard_of(doc_id: str, metadata: Optional[Dict], n: int, by: str = "hash") -> int:
+    """
+    Shard of a document: by hash of its id, or by hash of its year / first
+    category (all papers of a year / category together). Docs without a
+    year or category, and any "authors" entries, fall back to the id hash.
+    """
+    key = doc_id
+    md = metadata or {}
+    if by == "year" and md.get(YEAR_FIELD) is not None:
+        key = f"{YEAR_FIELD}={md[YEAR_FIELD]}"
+    elif by == "category":
+        key = next((k for k in md if k.startswith(CATEGORY_PREFIX)), doc_id)
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16) % n
+
+
+def _concat(parts: List[Dict], include: Sequence[str]) -> Dict:
+    out = {"ids": [i for p in parts for i in p["ids"]]}
+    for key in include:
+        if key == "embeddings":
+            embs = [np.asarray(p[key], dtype=np.float32) for p in parts if len(p["ids"])]
+            out[key] = np.concatenate(embs) if embs else np.zeros((0, 0), dtype=np.float32)
+        else:
+            out[key] = [x for p in parts for x in p[key]]
+    return out
+
+
+def _write_rows(path: Path, rows: Sequence[int], data: np.ndarray) -> None:
+    """Write data[i] at row rows[i] of a fixed-width row file (appending as needed)."""
+    row_bytes = data[0].nbytes
+    with path.open("r+b" if path.exists() else "wb") as f:
+        for row, values in zip(rows, data):
+            f.seek(row * row_bytes)
+            f.write(values.tobytes())
+
+
+def quantize(vecs: np.ndarray, quantization: str):
+    """(codes, scales) for unit vectors: int8 with a per-row scale, or packed sign bits."""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if quantization == "int8":
+        scales = np.maximum(np.abs(vecs).max(axis=1), 1e-12) / 127.0
+        codes = np.round(vecs / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if quantization == "binary":
+        return np.packbits(vecs > 0, axis=1), None
+    raise ValueError(f"unknown quantization: {quantization} (expected one of {QUANTIZATIONS})")
+
+
+def recall_at_k(approx: Sequence[Sequence[str]], exact: Sequence[Sequence[str]], k: int) -> float:
+    """Mean share of the exact top-k found in the approximate top-k."""
+    hits = [len(set(a[:k]) & set(e[:k])) / max(1, len(e[:k])) for a, e in zip(approx, exact)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def sample_queries(store, n: int) -> np.ndarray:
+    """Stored vectors of n random rows, used as queries (no model needed)."""
+    rng = np.random.default_rng(0)
+    offsets = rng.choice(store.count(), size=min(n, store.count()), replace=False)
+    return np.concatenate([
+        store.get(include=["embeddings"], limit=1, offset=int(o))["embeddings"] for o in offsets
+    ])
+
+
+def timed_ids(store, queries: np.ndarray, k: int) -> tuple:
+    t0 = time.perf_counter()
+    ids = store.query(queries, k, include=[])["ids"]
+    return ids, time.perf_counter() - t0
+
+
+def report_recall(args) -> None:
+    approx = open_store(args.collection, "chroma")
+    exact = open_store(args.collection, "exact")
+    for shard in getattr(exact, "shards", [exact]):
+        shard.quantization = "none"     # in memory only: full-precision ground truth
+    queries = sample_queries(exact, args.queries)
+    a, t_approx = timed_ids(approx, queries, args.k)
+    e, t_exact = timed_ids(exact, queries, args.k)
+    print(f"{len(queries)} queries, k={args.k}: recall@{args.k}={recall_at_k(a, e, args.k):.4f}  "
+          f"chroma {t_approx * 1000:.1f} ms  exact {t_exact * 1000:.1f} ms")
+
+
+def report_quantization(args) -> None:
+    """Scan memory vs recall@k for each quantization and rescore factor (codes built in memory)."""
+    store = open_store(args.collection, "exact")
+    if isinstance(store, ShardedStore):
+        print(f"Sharded store: measuring shard 0 of {len(store.shards)}")
+        store = store.shards[0]
+    saved = store.quantization
+    store.quantization = "none"
+    queries = sample_queries(store, args.queries)
+    truth, t_full = timed_ids(store, queries, args.k)
+    full = store.footprint()
+    print(f"{store.count()} rows x {store.dim} dims, {len(queries)} queries, k={args.k} (stored: {saved})")
+    print(f"{'mode':<8} {'rescore':>7} {'scan MB':>9} {'recall':>7} {'ms/query':>9}")
+    print(f"{'none':<8} {'-':>7} {full['vectors_bytes'] / 1e6:>9.2f} {1.0:>7.4f} "
+          f"{t_full * 1000 / len(queries):>9.3f}")
+
+    mat = store.matrix()
+    for quantization in ("int8", "binary"):
+        parts = [quantize(mat[i:i + EXACT_BLOCK], quantization) for i in range(0, mat.shape[0], EXACT_BLOCK)]
+        store.quantization = quantization
+        store._codes = np.concatenate([c for c, _ in parts])
+        store._scales = np.concatenate([sc for _, sc in parts]) if quantization == "int8" else None
+        scan_mb = store.footprint()["scan_bytes"] / 1e6
+        for factor in (1, 2, 4, 10):
+            store.rescore = factor
+            ids, t = timed_ids(store, queries, args.k)
+            print(f"{quantization:<8} {factor:>7} {scan_mb:>9.2f} {recall_at_k(ids, truth, args.k):>7.4f} "
+                  f"{t * 1000 / len(queries):>9.3f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Vector store tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rc = sub.add_parser("recall", help="HNSW recall@k against the exact store, using stored vectors as queries")
+    qc = sub.add_parser("quant", help="memory footprint and recall@k of int8/binary first stage + rescoring")
+    for p in (rc, qc):
+        p.add_argument("--collection", default="projects")
+        p.add_argument("--k", type=int, default=10)
+        p.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    if args.cmd == "recall":
+        report_recall(args)
+    else:
+        report_quantization(args)
+
+
+if __name__ == "__main__":
+    main()